@@ -0,0 +1,94 @@
+"""
+Misura il costo della risoluzione dell'utente autenticato su un endpoint di esercizi
+(risposta LLM già in cache), contando le query SQL per richiesta:
+- token senza dati utente e cache disattivata (comportamento precedente: una query a richiesta)
+- token senza dati utente con la cache degli utenti
+- token con i dati utente inclusi (nessuna query)
+
+Uso: python benchmarks/auth_resolution.py [richieste]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from fake_llm import FakeModel, install_fake_model
+
+import httpx
+from jose import jwt
+from sqlalchemy import event
+
+import crud, schemas
+from main import app
+from database import AsyncSessionLocal, async_engine
+from api import dependencies
+from utils.passwords import pwd_context
+
+BENCH_USERNAME = "benchmark_auth_user"
+PRACTICE = '[{"sentence": "Hallo", "translation": "Ciao"}]'
+
+
+async def get_bench_user():
+    async with AsyncSessionLocal() as db:
+        user = await crud.get_user_by_username(db, BENCH_USERNAME)
+        if user is None:
+            user = await crud.create_user(
+                db,
+                schemas.UserCreate(
+                    username=BENCH_USERNAME, password="benchmark", native_language="Italian"
+                ),
+                hashed_password=pwd_context.hash("benchmark"),
+            )
+        return user
+
+
+def legacy_token(username: str) -> str:
+    to_encode = {"sub": username, "exp": datetime.now(timezone.utc) + timedelta(minutes=30)}
+    return jwt.encode(to_encode, dependencies.SECRET_KEY, algorithm=dependencies.ALGORITHM)
+
+
+async def measure(client, token: str, requests: int):
+    queries = 0
+
+    def count_query(*args):
+        nonlocal queries
+        queries += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"target_language": "German"}
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = await client.get("/api/exercises/daily-practice", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+    elapsed = time.perf_counter() - start
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count_query)
+    return elapsed / requests * 1e6, queries / requests
+
+
+async def run(requests: int):
+    install_fake_model(FakeModel(text=PRACTICE, latency=0))
+    user = await get_bench_user()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Scalda la cache dei contenuti, così si misura solo l'autenticazione
+        await client.get(
+            "/api/exercises/daily-practice",
+            params={"target_language": "German"},
+            headers={"Authorization": f"Bearer {dependencies.create_access_token(user)}"},
+        )
+
+        dependencies.user_cache.ttl = 0
+        results = {"token senza dati, senza cache": await measure(client, legacy_token(user.username), requests)}
+        dependencies.user_cache.ttl = dependencies.USER_CACHE_TTL_SECONDS
+        results["token senza dati, con cache"] = await measure(client, legacy_token(user.username), requests)
+        results["token con dati utente"] = await measure(
+            client, dependencies.create_access_token(user), requests
+        )
+
+    for name, (micros, queries) in results.items():
+        print(f"{name:<32} {micros:8.1f} µs/richiesta  {queries:.2f} query/richiesta")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,72 @@
+"""
+Confronta il costo per turno di una conversazione lunga:
+- /api/chat/interaction, dove il client reinvia ogni volta l'intera cronologia
+- le sessioni lato server, dove si invia solo il nuovo messaggio e il prompt è limitato
+  da CHAT_HISTORY_TOKEN_BUDGET
+
+Per ogni turno campione riporta byte inviati dal client, token stimati del prompt e
+latenza. Il modello fittizio ha una latenza proporzionale alla lunghezza del prompt.
+
+Uso: python benchmarks/chat_sessions.py [turni]
+"""
+import asyncio
+import sys
+import time
+
+from fake_llm import FakeModel, install_fake_model
+
+import httpx
+import models
+from main import app
+from api.dependencies import get_current_user
+from utils.llm_handler import estimate_tokens
+
+REPLY = "Certo! " + "Questa è una risposta di media lunghezza del compagno di conversazione. " * 4
+USER_MESSAGE = "Oggi sono andato al mercato e ho comprato delle mele, delle pere e del pane fresco."
+
+
+async def run(turns: int):
+    fake = install_fake_model(FakeModel(text=REPLY, latency=0.05, latency_per_kchar=0.02))
+    samples = sorted({1, turns // 4, turns // 2, turns} - {0})
+    fake_user = models.User(id=990_011, username="bench-chat", native_language="Italian")
+    app.dependency_overrides[get_current_user] = lambda: fake_user
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print("senza sessione (cronologia reinviata dal client)")
+        messages = []
+        for turn in range(1, turns + 1):
+            messages.append({"role": "user", "content": USER_MESSAGE})
+            body = {"language": "English", "mode": "talk_buddy", "messages": messages}
+            request = client.build_request("POST", "/api/chat/interaction", json=body)
+            start = time.perf_counter()
+            response = await client.send(request)
+            elapsed = (time.perf_counter() - start) * 1000
+            messages.append(response.json())
+            if turn in samples:
+                print(
+                    f"  turno {turn:>3}: {len(request.content):>7} byte inviati, "
+                    f"{estimate_tokens(fake.last_prompt):>6} token di prompt, {elapsed:7.1f} ms"
+                )
+
+        print("con sessione lato server")
+        session = await client.post(
+            "/api/chat/sessions", json={"language": "English", "mode": "talk_buddy"}
+        )
+        session_id = session.json()["id"]
+        for turn in range(1, turns + 1):
+            request = client.build_request(
+                "POST", f"/api/chat/sessions/{session_id}/messages", json={"content": USER_MESSAGE}
+            )
+            start = time.perf_counter()
+            response = await client.send(request)
+            elapsed = (time.perf_counter() - start) * 1000
+            assert response.status_code == 200, response.text
+            if turn in samples:
+                print(
+                    f"  turno {turn:>3}: {len(request.content):>7} byte inviati, "
+                    f"{estimate_tokens(fake.last_prompt):>6} token di prompt, {elapsed:7.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
@@ -0,0 +1,107 @@
+"""
+Carico misto di letture e scritture sul database (progressi e lingue) da più task,
+confrontando le impostazioni SQLite di default (journal DELETE, synchronous FULL) con
+quelle dell'applicazione (WAL, synchronous NORMAL, mmap e cache). Ogni configurazione
+gira in un processo separato su un database temporaneo, indicato con DATABASE_URL.
+
+Uso: python benchmarks/db_mixed_workload.py [task] [secondi] [quota_scritture, es. 0.2]
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGURATIONS = {
+    "default SQLite": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL"},
+    "WAL + NORMAL": {"SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL"},
+}
+
+
+async def worker_main(tasks: int, seconds: float, write_ratio: float):
+    from fake_llm import percentile  # prepara anche sys.path e la directory di lavoro
+
+    import crud
+    from database import AsyncSessionLocal, init_db
+
+    init_db()
+    users = list(range(1, 201))
+    async with AsyncSessionLocal() as db:
+        for user_id in users:
+            await crud.increment_progress(db, user_id, "German")
+
+    reads, writes, errors = [], [], []
+    deadline = time.perf_counter() + seconds
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            while time.perf_counter() < deadline:
+                user_id = random.choice(users)
+                start = time.perf_counter()
+                try:
+                    if random.random() < write_ratio:
+                        await crud.increment_progress(db, user_id, "German", vocabulary_delta=1)
+                        writes.append(time.perf_counter() - start)
+                    else:
+                        await crud.get_progress(db, user_id, "German")
+                        await crud.get_languages(db)
+                        await db.commit()
+                        reads.append(time.perf_counter() - start)
+                except Exception as e:
+                    await db.rollback()
+                    errors.append(type(e).__name__)
+
+    await asyncio.gather(*[run() for _ in range(tasks)])
+
+    print(
+        json.dumps(
+            {
+                "ops_per_second": (len(reads) + len(writes)) / seconds,
+                "reads": len(reads),
+                "writes": len(writes),
+                "errors": len(errors),
+                "read_p50_ms": percentile(reads, 0.5) * 1000,
+                "read_p99_ms": percentile(reads, 0.99) * 1000,
+                "write_p50_ms": percentile(writes, 0.5) * 1000,
+                "write_p99_ms": percentile(writes, 0.99) * 1000,
+            }
+        )
+    )
+
+
+def main(tasks: int, seconds: float, write_ratio: float):
+    for name, settings in CONFIGURATIONS.items():
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                **settings,
+                "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            }
+            output = subprocess.run(
+                [sys.executable, __file__, "--worker", str(tasks), str(seconds), str(write_ratio)],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{name}: {result['ops_per_second']:.0f} op/s, "
+            f"letture p50 {result['read_p50_ms']:.2f} ms / p99 {result['read_p99_ms']:.2f} ms, "
+            f"scritture p50 {result['write_p50_ms']:.2f} ms / p99 {result['write_p99_ms']:.2f} ms, "
+            f"errori {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        asyncio.run(worker_main(int(sys.argv[2]), float(sys.argv[3]), float(sys.argv[4])))
+    else:
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+            float(sys.argv[2]) if len(sys.argv) > 2 else 5.0,
+            float(sys.argv[3]) if len(sys.argv) > 3 else 0.2,
+        )
@@ -0,0 +1,98 @@
+"""
+Confronta le quattro chiamate in sequenza della schermata di lezione con una sola
+chiamata a /exercises/bundle, e verifica il ripiego sulle chiamate singole quando la
+risposta combinata è incompleta.
+
+Uso: python benchmarks/exercise_bundle.py [latenza_llm_secondi]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from fake_llm import FakeModel, FakeResponse, install_fake_model
+
+import httpx
+import models
+from main import app
+from api.endpoints import exercises
+from utils import content_cache
+
+EXERCISES = {
+    "daily-practice": [{"sentence": "Guten Morgen", "translation": "Buongiorno"}] * 5,
+    "fill-in-the-blank": {"sentence": "Ich ___ Anna.", "options": ["bin", "bist"], "answer": "bin"},
+    "flashcards": [{"word_or_phrase": "Haus", "translation": "casa"}] * 5,
+    "comprehension-test": {
+        "text": "Anna wohnt in Berlin.",
+        "questions": [{"question": "Dove vive Anna?", "options": ["Berlino", "Roma"], "answer": "Berlino"}],
+    },
+}
+
+
+class LessonModel(FakeModel):
+    """
+    Modello fittizio che risponde con l'esercizio richiesto dal prompt. Per i prompt
+    combinati restituisce un oggetto con una chiave per esercizio, escludendo quelli in
+    `drop_from_bundle`.
+    """
+
+    drop_from_bundle = ()
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        await asyncio.sleep(self._latency_for(prompt))
+        if prompt.startswith("Create a bundle"):
+            bundle = {
+                name: data
+                for name, data in EXERCISES.items()
+                if f"'{name}'" in prompt and name not in self.drop_from_bundle
+            }
+            return FakeResponse(json.dumps(bundle))
+        for name, builder in exercises.EXERCISE_PROMPT_BUILDERS.items():
+            if prompt == builder("German", "Italian", "travel", None):
+                return FakeResponse(json.dumps(EXERCISES[name]))
+        raise AssertionError("unexpected prompt")
+
+
+async def run(latency: float):
+    fake = install_fake_model(LessonModel(latency=latency))
+    fake_user = models.User(id=1, username="bench", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    params = {"target_language": "German", "topic": "travel"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        content_cache.content_cache.clear()
+        start = time.perf_counter()
+        separate = {}
+        for name in EXERCISES:
+            response = await client.get(f"/api/exercises/{name}", params=params)
+            assert response.status_code == 200, response.text
+            separate[name] = response.json()
+        elapsed = time.perf_counter() - start
+        print(f"4 endpoint in sequenza: {elapsed:.2f}s, {fake.calls} chiamate all'LLM")
+
+        body = {**params, "exercise_types": list(EXERCISES)}
+        content_cache.content_cache.clear()
+        fake.calls = 0
+        start = time.perf_counter()
+        response = await client.post("/api/exercises/bundle", json=body)
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        assert response.json() == separate
+        print(f"bundle: {elapsed:.2f}s, {fake.calls} chiamate all'LLM")
+
+        content_cache.content_cache.clear()
+        fake.calls = 0
+        fake.drop_from_bundle = ("flashcards", "comprehension-test")
+        start = time.perf_counter()
+        response = await client.post("/api/exercises/bundle", json=body)
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        assert response.json() == separate
+        print(
+            f"bundle con 2 esercizi mancanti nella risposta: {elapsed:.2f}s, "
+            f"{fake.calls} chiamate all'LLM"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.5))
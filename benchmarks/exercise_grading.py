@@ -0,0 +1,99 @@
+"""
+Misura la correzione locale delle risposte chiuse su /exercises/grade e verifica che
+l'LLM venga chiamato solo quando ci sono risposte libere.
+
+Uso: python benchmarks/exercise_grading.py [numero_correzioni]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from fake_llm import FakeModel, FakeResponse, install_fake_model
+
+import httpx
+import models
+import schemas
+from main import app
+from api.endpoints import exercises
+from utils.grading import grade_answers
+
+COMPREHENSION_TEST = {
+    "text": "Anna wohnt in Berlin. Sie arbeitet als Ärztin.",
+    "questions": [
+        {"question": "Dove vive Anna?", "options": ["Berlino", "Roma", "Parigi"], "answer": "Berlino"},
+        {"question": "Che lavoro fa?", "options": ["Medico", "Cuoca", "Pilota"], "answer": "Medico"},
+        {"question": "Come si chiama?", "options": ["Anna", "Eva", "Lena"], "answer": "Anna"},
+    ],
+}
+
+
+class GradingModel(FakeModel):
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        await asyncio.sleep(self._latency_for(prompt))
+        if "answered the following numbered" in prompt:
+            return FakeResponse(json.dumps([{"index": 1, "correct": True, "feedback": "Giusto."}]))
+        return FakeResponse(json.dumps(COMPREHENSION_TEST))
+
+
+async def run(count: int):
+    fake = install_fake_model(GradingModel(latency=0.2))
+    fake_user = models.User(id=990_016, username="bench-grading", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get(
+            "/api/exercises/comprehension-test",
+            params={"target_language": "German", "topic": "lavoro"},
+        )
+        test = response.json()["comprehension_test"]
+        answers = [
+            {"question": "Dove vive Anna?", "user_answer": "berlino"},
+            {"question": "Che lavoro fa?", "user_answer": "Medico."},
+            {"question": "Come si chiama?", "user_answer": "Eva"},
+        ]
+        submission = {
+            "exercise_id": test["exercise_id"],
+            "exercise_type": "comprehension-test",
+            "target_language": "German",
+            "answers": answers,
+        }
+
+        parsed = [schemas.AssessmentAnswer(**answer) for answer in answers]
+        start = time.perf_counter()
+        for _ in range(count):
+            grade_answers(COMPREHENSION_TEST["questions"], parsed)
+        elapsed = time.perf_counter() - start
+        print(f"grade_answers: {elapsed / count * 1e6:.1f} µs per correzione")
+
+        # Un esercizio si corregge una volta sola per utente: ogni correzione ne usa uno diverso
+        fake.calls = 0
+        start = time.perf_counter()
+        for i in range(count):
+            fake_user.id = 1_000_000 + i
+            response = await client.post("/api/exercises/grade", json=submission)
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - start
+        body = response.json()
+        print(
+            f"/exercises/grade, risposte chiuse: {elapsed / count * 1000:.2f} ms per richiesta, "
+            f"{fake.calls} chiamate all'LLM, punteggio {body['score']}/{body['graded']}"
+        )
+        assert fake.calls == 0
+
+        answers[1]["user_answer"] = "Lavora in ospedale come dottoressa"
+        fake_user.id = 1_000_000 + count
+        start = time.perf_counter()
+        response = await client.post("/api/exercises/grade", json=submission)
+        elapsed = time.perf_counter() - start
+        body = response.json()
+        print(
+            f"/exercises/grade, una risposta libera: {elapsed * 1000:.0f} ms, "
+            f"{fake.calls} chiamate all'LLM, corretta da: "
+            f"{[result['graded_by'] for result in body['results']]}"
+        )
+        assert fake.calls == 1
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+# I benchmark importano i moduli dell'app come fa uvicorn, cioè da dentro src/
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+os.chdir(SRC_DIR)
+os.environ.setdefault("GEMINI_API_KEY", "fake-key-for-benchmarks")
+os.environ.setdefault("SECRET_KEY", "fake-secret-for-benchmarks")
+# Database temporaneo, condiviso dai processi avviati dal benchmark: utenti e dati di
+# prova non finiscono nel database di sviluppo
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='babilonia-bench-'), 'bench.db')}",
+)
+
+
+def percentile(values, fraction):
+    """
+    Restituisce il valore al quantile fraction (0-1) dei campioni, 0 se non ce ne sono.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+class FakeUsage:
+    def __init__(self, prompt: str, text: str):
+        # Stessa stima di llm_handler.estimate_tokens
+        self.prompt_token_count = len(str(prompt)) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: FakeUsage = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeStreamResponse:
+    def __init__(self, chunks, delay: float, usage: FakeUsage = None):
+        self.chunks = chunks
+        self.delay = delay
+        self.usage = usage
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            await asyncio.sleep(self.delay)
+            # Come Gemini, l'utilizzo è riportato con l'ultimo frammento
+            yield FakeResponse(chunk, self.usage if i == len(self.chunks) - 1 else None)
+
+
+class FakeChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, content, stream: bool = False, **kwargs):
+        prompt = "\n".join(str(entry) for entry in self.history) + f"\n{content}"
+        response = await self.model.generate_content_async(prompt, stream=stream)
+        self.history.extend(
+            [{"role": "user", "parts": [content]}, {"role": "model", "parts": [self.model.text]}]
+        )
+        return response
+
+
+class FakeModel:
+    """
+    Sostituto di genai.GenerativeModel che non fa chiamate di rete: attende una latenza
+    fissa (più, opzionalmente, una quota proporzionale alla lunghezza del prompt) e
+    restituisce un testo predefinito. Conta le chiamate ricevute e ricorda l'ultimo prompt.
+    """
+
+    def __init__(
+        self, text: str = "Fake response", latency: float = 1.0, latency_per_kchar: float = 0.0
+    ):
+        self.text = text
+        self.latency = latency
+        self.latency_per_kchar = latency_per_kchar
+        self.calls = 0
+        self.last_prompt = ""
+
+    def _latency_for(self, prompt) -> float:
+        self.calls += 1
+        self.last_prompt = str(prompt)
+        return self.latency + self.latency_per_kchar * len(self.last_prompt) / 1000
+
+    def start_chat(self, history=None, **kwargs):
+        return FakeChatSession(self, history)
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        latency = self._latency_for(prompt)
+        if stream:
+            # La latenza totale viene distribuita sui frammenti della risposta
+            chunks = [self.text[i : i + 20] for i in range(0, len(self.text), 20)]
+            return FakeStreamResponse(
+                chunks, latency / max(len(chunks), 1), FakeUsage(prompt, self.text)
+            )
+        await asyncio.sleep(latency)
+        return FakeResponse(self.text, FakeUsage(prompt, self.text))
+
+
+def parse_latency(spec: str):
+    """
+    Restituisce una funzione che estrae una latenza in secondi secondo la distribuzione
+    indicata: "fixed:0.5", "uniform:0.2:1.5", "lognormal:<mediana>:<sigma>" oppure
+    "exponential:<media>".
+    """
+    kind, *args = spec.split(":")
+    values = [float(arg) for arg in args]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma)
+    if kind == "exponential":
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+_FILL_IN_THE_BLANK = {"sentence": "Ich ___ Anna.", "options": ["bin", "bist", "ist"], "answer": "bin"}
+_COMPREHENSION_TEST = {
+    "text": "Anna wohnt in Berlin. Sie arbeitet als Ärztin.",
+    "questions": [
+        {"question": "Wo wohnt Anna?", "options": ["Berlin", "Rom"], "answer": "Berlin"},
+        {"question": "Was ist Anna von Beruf?", "options": ["Ärztin", "Köchin"], "answer": "Ärztin"},
+    ],
+}
+_FLASHCARDS = [{"word_or_phrase": f"das Haus {i}", "translation": f"la casa {i}"} for i in range(5)]
+_SENTENCES = [{"sentence": f"Guten Morgen {i}.", "translation": f"Buongiorno {i}."} for i in range(5)]
+
+# Risposte predefinite, scelte in base a un frammento del prompt (il primo che compare).
+# L'ultima voce, senza frammento, è la risposta della chat.
+CANNED_RESPONSES = [
+    (
+        "exactly these keys",
+        {
+            "daily-practice": _SENTENCES,
+            "fill-in-the-blank": _FILL_IN_THE_BLANK,
+            "comprehension-test": _COMPREHENSION_TEST,
+            "flashcards": _FLASHCARDS,
+        },
+    ),
+    ("numbered flashcards", [{"index": 1, "feedback": "Corretto.", "vocabulary_delta": 1}]),
+    ("numbered exercise questions", [{"index": 1, "correct": True, "feedback": "Giusto."}]),
+    (
+        "one object per sentence",
+        [{"index": 1, "corrected_sentence": "Ich bin Anna.", "explanation": "Verbo essere."}],
+    ),
+    (
+        "translation for a flashcard",
+        {"feedback": "Corretto.", "evaluation": {"vocabulary_delta": 1}},
+    ),
+    ("'corrected_sentence' and 'explanation'", {"corrected_sentence": "Ich bin Anna.", "explanation": "Verbo essere."}),
+    ("'sentence', 'options'", _FILL_IN_THE_BLANK),
+    ("'text' and 'questions'", _COMPREHENSION_TEST),
+    ("'word_or_phrase'", _FLASHCARDS),
+    ("daily-life sentences", _SENTENCES),
+    ("famous quote", "Wer rastet, der rostet. / Chi si ferma è perduto. - (Proverbio)"),
+    ("useful sentences", _SENTENCES * 6),
+    (None, "Certo! Ecco una risposta del tutor di lingua."),
+]
+
+
+class ScenarioModel(FakeModel):
+    """
+    Modello fittizio per i test di carico: risponde con CANNED_RESPONSES in base al
+    prompt, con latenza estratta da una distribuzione. Una quota error_rate di chiamate
+    fallisce con un'eccezione e una quota malformed_rate restituisce un JSON troncato.
+    """
+
+    def __init__(
+        self,
+        latency: str = "fixed:0.5",
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        responses=CANNED_RESPONSES,
+    ):
+        super().__init__()
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.responses = [
+            (marker, value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+            for marker, value in responses
+        ]
+        self.errors = 0
+
+    def _latency_for(self, prompt) -> float:
+        super()._latency_for(prompt)
+        return self.sample_latency()
+
+    def _text_for(self, prompt) -> str:
+        prompt = str(prompt)
+        for marker, text in self.responses:
+            if marker is None or marker in prompt:
+                if random.random() < self.malformed_rate:
+                    return text[: len(text) // 2]
+                return text
+        return self.text
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        latency = self._latency_for(prompt)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(latency)
+            raise RuntimeError("Fake LLM error")
+        text = self._text_for(prompt)
+        if stream:
+            chunks = [text[i : i + 20] for i in range(0, len(text), 20)]
+            return FakeStreamResponse(
+                chunks, latency / max(len(chunks), 1), FakeUsage(prompt, text)
+            )
+        await asyncio.sleep(latency)
+        return FakeResponse(text, FakeUsage(prompt, text))
+
+
+def install_fake_model(model: FakeModel) -> FakeModel:
+    """
+    Sostituisce il modello Gemini usato da llm_handler con il modello fittizio.
+    """
+    from utils import llm_handler
+
+    llm_handler.model = model
+    return model
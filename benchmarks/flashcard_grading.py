@@ -0,0 +1,101 @@
+"""
+Confronta la correzione di N flashcard una per richiesta con la correzione multipla su
+/exercises/submit-flashcard-corrections, contando chiamate all'LLM e query a database.
+
+Uso: python benchmarks/flashcard_grading.py [numero_flashcard] [latenza_llm_secondi]
+"""
+import asyncio
+import json
+import re
+import sys
+import time
+
+from fake_llm import FakeModel, FakeResponse, install_fake_model
+
+import httpx
+from sqlalchemy import event
+
+import models
+from database import async_engine
+from main import app
+from api.endpoints import exercises
+
+
+class GradingModel(FakeModel):
+    """
+    Modello fittizio che valuta come corretta (+1) ogni flashcard numerata del prompt.
+    Ai prompt con una sola flashcard risponde con il formato dell'endpoint singolo.
+    """
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        await asyncio.sleep(self._latency_for(prompt))
+        numbered = re.findall(r"^(\d+)\. Original text", prompt, flags=re.MULTILINE)
+        if not numbered:
+            return FakeResponse(
+                json.dumps({"feedback": "Corretto!", "evaluation": {"vocabulary_delta": 1}})
+            )
+        items = [
+            {"index": int(index), "feedback": "Corretto!", "vocabulary_delta": 1}
+            for index in numbered
+        ]
+        return FakeResponse(json.dumps(items))
+
+
+queries = 0
+
+
+def count_query(*args):
+    global queries
+    queries += 1
+
+
+async def run(count: int, latency: float):
+    global queries
+    fake = install_fake_model(GradingModel(latency=latency))
+    # Un utente e una lingua non usati da altri benchmark
+    fake_user = models.User(id=990_015, username="bench-flashcards", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+    cards = [
+        {"flashcard_text": f"Haus {i}", "user_translation": f"casa {i}"} for i in range(count)
+    ]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queries = 0
+        start = time.perf_counter()
+        for card in cards:
+            response = await client.post(
+                "/api/exercises/submit-flashcard-correction",
+                json={**card, "target_language": "German"},
+            )
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - start
+        print(
+            f"{count} richieste singole: {elapsed:.2f}s, {fake.calls} chiamate all'LLM, "
+            f"{queries} query"
+        )
+
+        fake.calls = 0
+        queries = 0
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/exercises/submit-flashcard-corrections",
+            json={"cards": cards, "target_language": "Spanish"},
+        )
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        body = response.json()
+        assert [r["flashcard_text"] for r in body["results"]] == [c["flashcard_text"] for c in cards]
+        print(
+            f"batch: {elapsed:.2f}s, {fake.calls} chiamate all'LLM, {queries} query, "
+            f"progressi: {body['new_progress']}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        run(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+            float(sys.argv[2]) if len(sys.argv) > 2 else 0.2,
+        )
+    )
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark del parsing delle risposte LLM: confronta il vecchio percorso
+(str.replace + ast.literal_eval) con utils.json_parser su payload realistici di
+phrasebook e comprehension-test.
+
+Uso: python benchmarks/json_parsing.py [ripetizioni]
+"""
+import json
+import sys
+import timeit
+from ast import literal_eval
+
+import fake_llm  # noqa: F401 - configura sys.path e variabili d'ambiente
+from utils.json_parser import RESPONSE_SCHEMAS, parse_llm_json
+
+
+def legacy_clean_json_response(response: str):
+    return literal_eval(response.replace("```json", "").replace("```", ""))
+
+
+PHRASEBOOK = [
+    {
+        "sentence": f"¿Dónde está la estación de tren número {i}? Necesito llegar antes de las ocho.",
+        "translation": f"Dov'è la stazione dei treni numero {i}? Devo arrivare prima delle otto.",
+    }
+    for i in range(40)
+]
+
+COMPREHENSION = {
+    "text": "\n\n".join(
+        "María se despierta temprano todos los días. Antes de ir al trabajo, prepara un café "
+        "y lee las noticias en el balcón mientras escucha la radio. " * 4
+        for _ in range(4)
+    ),
+    "questions": [
+        {
+            "question": f"Domanda {i}: cosa fa María prima di andare al lavoro?",
+            "options": ["Prepara un caffè", "Va in palestra", "Porta a spasso il cane", "Dorme"],
+            "answer": "Prepara un caffè",
+        }
+        for i in range(4)
+    ],
+}
+
+PAYLOADS = {
+    "phrasebook": json.dumps(PHRASEBOOK, ensure_ascii=False),
+    "comprehension-test": json.dumps(COMPREHENSION, ensure_ascii=False),
+}
+
+
+def run(repetitions: int):
+    for endpoint, raw in PAYLOADS.items():
+        fenced = f"```json\n{raw}\n```"
+        schema = RESPONSE_SCHEMAS[endpoint]
+        cases = {
+            "literal_eval (fenced)": lambda: legacy_clean_json_response(fenced),
+            "json_parser (pure JSON)": lambda: parse_llm_json(raw),
+            "json_parser (fenced)": lambda: parse_llm_json(fenced),
+            "json_parser (pure JSON + schema)": lambda: parse_llm_json(raw, schema),
+        }
+        print(f"{endpoint} ({len(raw.encode('utf-8'))} byte)")
+        for name, func in cases.items():
+            seconds = timeit.timeit(func, number=repetitions)
+            print(f"  {name:<34} {seconds / repetitions * 1e6:10.1f} µs/parse")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
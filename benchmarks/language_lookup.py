@@ -0,0 +1,68 @@
+"""
+Verifica la ricerca delle lingue per nome normalizzato e alias e misura il costo di
+get_language_by_name. Controlla inoltre che una lingua sconosciuta venga rifiutata con
+404 prima di chiamare l'LLM.
+
+Uso: python benchmarks/language_lookup.py [ricerche]
+"""
+import asyncio
+import sys
+import time
+
+from fake_llm import FakeModel, install_fake_model
+
+import httpx
+
+import crud, models
+from main import app
+from database import AsyncSessionLocal
+from api.endpoints import exercises
+
+LOOKUPS = {
+    "German": "German",
+    "german": "German",
+    "  mandarin   CHINESE ": "Mandarin Chinese",
+    "DE": "German",
+    "deu": "German",
+    "Español": "Spanish",
+    "日本語": "Japanese",
+    "zh": "Mandarin Chinese",
+    "Klingon": None,
+}
+
+
+async def run(lookups: int):
+    fake = install_fake_model(FakeModel(text='{"quote": "Carpe diem"}', latency=0))
+    fake_user = models.User(id=990_023, username="bench-languages", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+
+    async with AsyncSessionLocal() as db:
+        for name, expected in LOOKUPS.items():
+            language = await crud.get_language_by_name(db, name)
+            found = language.name if language else None
+            print(f"{name!r:<26} -> {found}")
+            assert found == expected
+        start = time.perf_counter()
+        for _ in range(lookups):
+            await crud.get_language_by_name(db, "  mandarin   CHINESE ")
+        elapsed = time.perf_counter() - start
+    print(f"get_language_by_name: {elapsed / lookups * 1e6:.2f} µs per ricerca")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        fake.calls = 0
+        response = await client.get("/api/exercises/daily-quote", params={"target_language": "Klingon"})
+        assert response.status_code == 404 and fake.calls == 0
+        response = await client.post(
+            "/api/exercises/sentence-correction",
+            json={"sentence": "Ich bin", "target_language": "Klingon"},
+        )
+        assert response.status_code == 404 and fake.calls == 0
+        print("lingua sconosciuta: 404, 0 chiamate all'LLM")
+        response = await client.get("/api/exercises/daily-quote", params={"target_language": "de"})
+        assert response.status_code == 200 and fake.calls == 1
+        print("target_language=de: 200, 1 chiamata all'LLM")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
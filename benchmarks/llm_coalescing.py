@@ -0,0 +1,46 @@
+"""
+Verifica che N chiamate concorrenti con lo stesso prompt producano una sola chiamata a
+Gemini, sia direttamente su llm_handler sia attraverso l'endpoint daily-quote.
+
+Uso: python benchmarks/llm_coalescing.py [numero_chiamate]
+"""
+import asyncio
+import sys
+
+from fake_llm import FakeModel, install_fake_model
+
+import httpx
+import models
+from main import app
+from api.endpoints import exercises
+from utils import llm_handler, metrics
+
+
+async def run(concurrency: int):
+    fake = install_fake_model(FakeModel(text="Quote / Citazione - (Author)", latency=0.5))
+    results = await asyncio.gather(
+        *[llm_handler.generate_llm_response_async("same prompt") for _ in range(concurrency)]
+    )
+    assert all(result == fake.text for result in results)
+    print(f"llm_handler: {concurrency} chiamate concorrenti -> {fake.calls} chiamate a monte")
+    assert fake.calls == 1
+
+    fake.calls = 0
+    fake_user = models.User(id=1, username="bench", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        responses = await asyncio.gather(
+            *[
+                client.get("/api/exercises/daily-quote", params={"target_language": "German"})
+                for _ in range(concurrency)
+            ]
+        )
+    assert all(response.status_code == 200 for response in responses)
+    print(f"daily-quote: {concurrency} richieste concorrenti -> {fake.calls} chiamate a monte")
+    print(f"richieste accorpate: {metrics.llm_coalesced_requests.values}")
+    assert fake.calls == 1
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
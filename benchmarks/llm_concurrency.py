@@ -0,0 +1,50 @@
+"""
+Verifica che un singolo worker gestisca centinaia di richieste LLM concorrenti senza
+saturare il threadpool di starlette (~40 thread). Le richieste sono identiche, quindi
+l'accorpamento (LLM_COALESCING_ENABLED) viene disattivato: ognuna arriva al modello.
+
+Uso: python benchmarks/llm_concurrency.py [numero_richieste] [latenza_secondi]
+"""
+import asyncio
+import sys
+import time
+
+from fake_llm import FakeModel, install_fake_model
+
+import httpx
+import models
+from main import app
+from api.endpoints import exercises
+from utils import llm_handler
+
+
+async def run(concurrency: int, latency: float):
+    fake = install_fake_model(FakeModel(text="Quote / Citazione - (Author)", latency=latency))
+    llm_handler.LLM_COALESCING_ENABLED = False
+    fake_user = models.User(id=1, username="bench", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *[
+                client.get("/api/exercises/daily-quote", params={"target_language": "English"})
+                for _ in range(concurrency)
+            ]
+        )
+        elapsed = time.perf_counter() - start
+
+    ok = sum(1 for r in responses if r.status_code == 200)
+    print(f"{concurrency} richieste concorrenti, latenza LLM {latency}s")
+    print(f"risposte OK: {ok}/{concurrency}, chiamate al modello: {fake.calls}")
+    print(f"tempo totale: {elapsed:.2f}s (sequenziale sarebbe {concurrency * latency:.0f}s)")
+    assert fake.calls == concurrency
+    # Con un percorso bloccante il tempo sarebbe almeno ceil(N / 40) * latenza
+    assert elapsed < 3 * latency, "le richieste LLM non sono state servite in parallelo"
+
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    asyncio.run(run(concurrency, latency))
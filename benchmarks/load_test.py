@@ -0,0 +1,342 @@
+"""
+Test di carico offline di tutte le route dell'API (autenticazione, dati di riferimento,
+esercizi, phrasebook, chat) con il modello fittizio ScenarioModel al posto di Gemini.
+Per ogni endpoint invia --requests richieste con --concurrency richieste in parallelo e
+riporta throughput, latenza p50/p95/p99 ed errori (risposte >= 400 o eccezioni).
+
+I risultati vengono salvati in JSON (--output). Con --compare si confrontano con quelli
+di un'esecuzione precedente: un endpoint con p95 peggiorato oltre --threshold per cento
+è segnalato come regressione e lo script termina con codice 1.
+
+Le variabili d'ambiente dell'applicazione valgono come al solito, ad esempio
+CONTENT_CACHE_ENABLED=false per far arrivare ogni richiesta al modello fittizio.
+Il WebSocket della chat non è coperto: httpx non supporta WebSocket su ASGI.
+
+Uso: python benchmarks/load_test.py [--requests 200] [--concurrency 20]
+     [--latency lognormal:0.4:0.5] [--error-rate 0.01] [--malformed-rate 0.01]
+     [--endpoints exercises,chat] [--output risultati.json] [--compare precedente.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+# fake_llm cambia la directory di lavoro: i percorsi dei file sono relativi a quella di avvio
+START_DIR = os.getcwd()
+
+from fake_llm import ScenarioModel, install_fake_model, percentile
+
+import httpx
+
+from main import app
+from utils.exercise_store import exercise_store
+
+PASSWORD = "load-test-password"
+USER_MESSAGE = "Ich habe heute einen Apfel gegessen."
+
+
+class Context:
+    """
+    Dati preparati prima del carico: utenti, token, esercizi da correggere e sessione
+    di chat.
+    """
+
+    def __init__(self):
+        self.headers = {}
+        self.username = ""
+        self.refresh_tokens: asyncio.Queue = asyncio.Queue()
+        # (exercise_id, frase): ogni esercizio si corregge una volta sola per utente
+        self.exercises = []
+        self.chat_session_id = ""
+
+
+async def register(client, username: str):
+    response = await client.post(
+        "/api/users/",
+        json={"username": username, "password": PASSWORD, "native_language": "Italian"},
+    )
+    return response
+
+
+async def setup(client, users: int, exercises: int) -> Context:
+    context = Context()
+    prefix = f"load-{uuid.uuid4().hex[:8]}"
+    for i in range(users):
+        username = f"{prefix}-{i}"
+        response = await register(client, username)
+        assert response.status_code == 200, response.text
+        response = await client.post(
+            "/api/token", data={"username": username, "password": PASSWORD}
+        )
+        assert response.status_code == 200, response.text
+        tokens = response.json()
+        context.refresh_tokens.put_nowait(tokens["refresh_token"])
+        if i == 0:
+            context.username = username
+            context.headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    for i in range(exercises):
+        exercise = {"sentence": f"Ich ___ Anna ({i}).", "options": ["bin", "bist"], "answer": "bin"}
+        exercise_id = await exercise_store.save("fill-in-the-blank", "German", exercise)
+        context.exercises.append((exercise_id, exercise["sentence"]))
+
+    response = await client.post(
+        "/api/chat/sessions",
+        json={"language": "German", "mode": "talk_buddy"},
+        headers=context.headers,
+    )
+    assert response.status_code == 200, response.text
+    context.chat_session_id = response.json()["id"]
+    return context
+
+
+async def refresh(client, context: Context):
+    # Ogni refresh token vale una volta sola: quello nuovo torna in coda
+    token = await context.refresh_tokens.get()
+    response = None
+    try:
+        response = await client.post("/api/token/refresh", json={"refresh_token": token})
+        return response
+    finally:
+        if response is not None and response.status_code == 200:
+            token = response.json()["refresh_token"]
+        context.refresh_tokens.put_nowait(token)
+
+
+GERMAN = {"target_language": "German"}
+
+
+async def grade(client, context: Context):
+    exercise_id, sentence = context.exercises.pop()
+    return await client.post(
+        "/api/exercises/grade",
+        json={
+            **GERMAN,
+            "exercise_id": exercise_id,
+            "exercise_type": "fill-in-the-blank",
+            "answers": [{"question": sentence, "user_answer": "bin"}],
+        },
+        headers=context.headers,
+    )
+
+
+def get(path, **params):
+    return lambda client, context: client.get(path, params=params, headers=context.headers)
+
+
+def post(path, body):
+    return lambda client, context: client.post(path, json=body, headers=context.headers)
+
+
+# nome -> funzione (client, context) che invia una richiesta e restituisce la risposta
+ENDPOINTS = {
+    "auth: POST /api/users/": lambda client, context: register(
+        client, f"load-{uuid.uuid4().hex}"
+    ),
+    "auth: POST /api/token": lambda client, context: client.post(
+        "/api/token", data={"username": context.username, "password": PASSWORD}
+    ),
+    "auth: POST /api/token/refresh": refresh,
+    "reference: GET /api/languages": get("/api/languages"),
+    "reference: GET /api/topics": get("/api/topics"),
+    "reference: GET /api/lesson-subjects": get("/api/lesson-subjects"),
+    "exercises: GET daily-practice": get("/api/exercises/daily-practice", **GERMAN),
+    "exercises: GET daily-quote": get("/api/exercises/daily-quote", **GERMAN),
+    "exercises: GET fill-in-the-blank": get("/api/exercises/fill-in-the-blank", **GERMAN),
+    "exercises: GET comprehension-test": get("/api/exercises/comprehension-test", **GERMAN),
+    "exercises: GET flashcards": get("/api/exercises/flashcards", **GERMAN),
+    "exercises: POST bundle": post(
+        "/api/exercises/bundle",
+        {**GERMAN, "exercise_types": ["fill-in-the-blank", "flashcards"], "topic": "Sport"},
+    ),
+    "exercises: POST sentence-correction": post(
+        "/api/exercises/sentence-correction", {**GERMAN, "sentence": "Ich bist Anna."}
+    ),
+    "exercises: POST sentence-correction/batch": post(
+        "/api/exercises/sentence-correction/batch", {**GERMAN, "sentences": ["Ich bist Anna."]}
+    ),
+    "exercises: POST submit-flashcard-correction": post(
+        "/api/exercises/submit-flashcard-correction",
+        {**GERMAN, "flashcard_text": "das Haus", "user_translation": "la casa"},
+    ),
+    "exercises: POST submit-flashcard-corrections": post(
+        "/api/exercises/submit-flashcard-corrections",
+        {**GERMAN, "cards": [{"flashcard_text": "das Haus", "user_translation": "la casa"}]},
+    ),
+    "exercises: POST grade": grade,
+    "phrasebook: GET /api/phrasebook": get("/api/phrasebook", **GERMAN),
+    "phrasebook: GET /api/phrasebook/stream": get("/api/phrasebook/stream", **GERMAN),
+    "chat: GET /api/chat/modes": get("/api/chat/modes"),
+    "chat: POST /api/chat/interaction": post(
+        "/api/chat/interaction",
+        {"language": "German", "mode": "teacher", "messages": [{"role": "user", "content": USER_MESSAGE}]},
+    ),
+    "chat: POST /api/chat/interaction/stream": post(
+        "/api/chat/interaction/stream",
+        {"language": "German", "mode": "teacher", "messages": [{"role": "user", "content": USER_MESSAGE}]},
+    ),
+    "chat: POST /api/chat/sessions": post(
+        "/api/chat/sessions", {"language": "German", "mode": "talk_buddy"}
+    ),
+    "chat: POST /api/chat/sessions/{id}/messages": lambda client, context: client.post(
+        f"/api/chat/sessions/{context.chat_session_id}/messages",
+        json={"content": USER_MESSAGE},
+        headers=context.headers,
+    ),
+    "chat: GET /api/chat/sessions/{id}/messages": lambda client, context: client.get(
+        f"/api/chat/sessions/{context.chat_session_id}/messages", headers=context.headers
+    ),
+}
+
+
+async def load_endpoint(client, context: Context, send, requests: int, concurrency: int) -> dict:
+    latencies, statuses, errors = [], {}, 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await send(client, context)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(min(concurrency, requests))])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "errors": errors,
+        "statuses": statuses,
+    }
+
+
+def compare(results: dict, previous: dict, threshold: float) -> list:
+    """
+    Stampa la variazione di p95 e throughput rispetto all'esecuzione precedente e
+    restituisce gli endpoint peggiorati oltre la soglia.
+    """
+    regressions = []
+    print(f"\nconfronto con l'esecuzione del {previous.get('started_at', '?')}")
+    for name, current in results["endpoints"].items():
+        before = previous.get("endpoints", {}).get(name)
+        if not before or not before["p95_ms"]:
+            continue
+        change = (current["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        throughput = (current["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] * 100
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSIONE"
+            regressions.append(name)
+        print(f"{name:<48} p95 {change:+7.1f}%  throughput {throughput:+7.1f}%{flag}")
+    return regressions
+
+
+async def run(args) -> int:
+    fake = install_fake_model(
+        ScenarioModel(
+            latency=args.latency, error_rate=args.error_rate, malformed_rate=args.malformed_rate
+        )
+    )
+    selected = [
+        name
+        for name in ENDPOINTS
+        if not args.endpoints or any(part in name for part in args.endpoints.split(","))
+    ]
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "malformed_rate": args.malformed_rate,
+            "python": platform.python_version(),
+            "env": {
+                key: os.environ[key]
+                for key in sorted(os.environ)
+                if key.startswith(("CONTENT_CACHE", "EXERCISE_POOL", "LLM_", "PROGRESS_", "DB_", "SQLITE_"))
+            },
+        },
+        "endpoints": {},
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+        context = await setup(client, args.users, args.requests)
+        print(
+            f"{'endpoint':<48} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'errori':>7} {'LLM':>6}"
+        )
+        for name in selected:
+            fake.calls = 0
+            stats = await load_endpoint(
+                client, context, ENDPOINTS[name], args.requests, args.concurrency
+            )
+            stats["llm_calls"] = fake.calls
+            results["endpoints"][name] = stats
+            print(
+                f"{name:<48} {stats['throughput_rps']:8.1f} {stats['p50_ms']:8.1f} "
+                f"{stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f} {stats['errors']:7d} "
+                f"{stats['llm_calls']:6d}"
+            )
+
+    output = os.path.join(START_DIR, args.output)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nrisultati salvati in {output}")
+
+    if args.compare:
+        with open(os.path.join(START_DIR, args.compare)) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test di carico offline dell'API")
+    parser.add_argument("--requests", type=int, default=200, help="richieste per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20, help="richieste in parallelo")
+    parser.add_argument(
+        "--latency",
+        default="lognormal:0.4:0.5",
+        help="latenza del modello: fixed:S, uniform:MIN:MAX, lognormal:MEDIANA:SIGMA, exponential:MEDIA",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="quota di chiamate LLM fallite")
+    parser.add_argument(
+        "--malformed-rate", type=float, default=0.0, help="quota di risposte LLM con JSON troncato"
+    )
+    parser.add_argument("--users", type=int, default=4, help="utenti creati per i refresh token")
+    parser.add_argument("--endpoints", default="", help="filtro sui nomi, separati da virgola")
+    parser.add_argument(
+        "--output",
+        default=f"load_test_{datetime.now():%Y%m%d_%H%M%S}.json",
+        help="file JSON dei risultati",
+    )
+    parser.add_argument("--compare", help="file JSON di un'esecuzione precedente")
+    parser.add_argument(
+        "--threshold", type=float, default=20.0, help="peggioramento p95 (%%) considerato regressione"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
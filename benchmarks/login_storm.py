@@ -0,0 +1,91 @@
+"""
+Misura la latenza degli endpoint non di autenticazione mentre è in corso una raffica di
+login, confrontando bcrypt eseguito nel threadpool del worker con il pool di processi
+di utils.passwords.
+
+Uso: python benchmarks/login_storm.py [login_concorrenti] [durata_secondi]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from fake_llm import percentile  # configura anche sys.path e variabili d'ambiente
+
+import httpx
+
+import crud, schemas
+from main import app
+from database import AsyncSessionLocal
+from utils import passwords
+
+BENCH_USERNAME = "benchmark_login_user"
+BENCH_PASSWORD = "benchmark"
+
+
+async def ensure_bench_user():
+    async with AsyncSessionLocal() as db:
+        if await crud.get_user_by_username(db, BENCH_USERNAME) is None:
+            await crud.create_user(
+                db,
+                schemas.UserCreate(
+                    username=BENCH_USERNAME, password=BENCH_PASSWORD, native_language="Italian"
+                ),
+                hashed_password=passwords.pwd_context.hash(BENCH_PASSWORD),
+            )
+
+
+async def login_loop(client, stop_at, counter):
+    form = {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}
+    while time.perf_counter() < stop_at:
+        response = await client.post("/api/token", data=form)
+        assert response.status_code == 200, response.text
+        counter.append(1)
+
+
+async def probe_loop(client, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        for path in ("/api/languages", "/api/chat/modes", "/"):
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+        await asyncio.sleep(0.005)
+
+
+async def scenario(client, concurrent_logins: int, duration: float):
+    stop_at = time.perf_counter() + duration
+    latencies, logins = [], []
+    await asyncio.gather(
+        probe_loop(client, stop_at, latencies),
+        *[login_loop(client, stop_at, logins) for _ in range(concurrent_logins)],
+    )
+    return latencies, len(logins)
+
+
+async def run(concurrent_logins: int, duration: float):
+    await ensure_bench_user()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        baseline, _ = await scenario(client, 0, duration)
+        print(f"senza login: p50 {statistics.median(baseline):.1f} ms, p99 {percentile(baseline, 0.99):.1f} ms")
+        for workers in (0, passwords.PASSWORD_HASH_WORKERS or 4):
+            passwords.shutdown_password_executor()
+            passwords.PASSWORD_HASH_WORKERS = workers
+            if workers:
+                # Avvia i processi prima della misura
+                await passwords.hash_password("warmup")
+            latencies, logins = await scenario(client, concurrent_logins, duration)
+            mode = "threadpool" if workers == 0 else f"pool di {workers} processi"
+            print(
+                f"{concurrent_logins} login concorrenti, bcrypt nel {mode}: "
+                f"{logins / duration:.1f} login/s, endpoint non-auth "
+                f"p50 {statistics.median(latencies):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms"
+            )
+    passwords.shutdown_password_executor()
+
+
+if __name__ == "__main__":
+    concurrent_logins = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    asyncio.run(run(concurrent_logins, duration))
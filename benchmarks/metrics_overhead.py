@@ -0,0 +1,130 @@
+"""
+Misura il costo del middleware delle metriche (METRICS_ENABLED) su richieste economiche
+(/api/languages servito dallo snapshot, /api/chat/modes) e verifica che
+/metrics riporti latenza per route, durata e token delle chiamate all'LLM, errori di
+interpretazione delle risposte e query per richiesta. Ogni misura gira in un processo
+separato su un database temporaneo, indicato con DATABASE_URL.
+
+Uso: python benchmarks/metrics_overhead.py [richieste]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PATHS = ("/api/languages", "/api/chat/modes")
+
+
+def client_for(app):
+    import httpx
+
+    from api.endpoints import exercises
+    import models
+
+    fake_user = models.User(id=990_025, username="bench-metrics", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+async def measure(requests: int) -> dict:
+    import time
+
+    from main import app
+
+    async with client_for(app) as client:
+        for path in PATHS:
+            await client.get(path)
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for i in range(requests):
+                await client.get(PATHS[i % len(PATHS)])
+            timings.append((time.perf_counter() - start) / requests * 1e6)
+    return {"us": statistics.median(timings)}
+
+
+async def check() -> dict:
+    from fake_llm import ScenarioModel, install_fake_model
+
+    from main import app
+
+    fake = install_fake_model(ScenarioModel(latency="fixed:0.01"))
+    async with client_for(app) as client:
+        response = await client.get(
+            "/api/exercises/fill-in-the-blank", params={"target_language": "German"}
+        )
+        assert response.status_code == 200, response.text
+        fake.malformed_rate = 1.0
+        response = await client.post(
+            "/api/exercises/sentence-correction",
+            json={"sentence": "Ich bin Anna", "target_language": "German"},
+        )
+        assert response.status_code == 502, response.text
+        fake.malformed_rate = 0.0
+        fake.error_rate = 1.0
+        await client.get("/api/exercises/daily-quote", params={"target_language": "German"})
+        await client.get("/api/languages")
+        response = await client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return {"lines": response.text.splitlines()}
+
+
+def worker_main(mode: str, requests: int):
+    import asyncio
+
+    import fake_llm  # noqa: F401  (prepara sys.path e la directory di lavoro)
+
+    result = asyncio.run(check() if mode == "check" else measure(requests))
+    print(json.dumps(result))
+
+
+def run_worker(database_url: str, mode: str, enabled: bool, requests: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", mode, str(requests)],
+        env={
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "METRICS_ENABLED": "true" if enabled else "false",
+            "EXERCISE_POOL_ENABLED": "false",
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(requests: int):
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        disabled = run_worker(url, "measure", False, requests)["us"]
+        enabled = run_worker(url, "measure", True, requests)["us"]
+        print(f"METRICS_ENABLED=false {disabled:8.1f} µs/richiesta")
+        print(f"METRICS_ENABLED=true  {enabled:8.1f} µs/richiesta  ({enabled - disabled:+.1f} µs)")
+
+        lines = run_worker(url, "check", True, requests)["lines"]
+    expected = (
+        'babilonia_http_request_duration_seconds_count{method="GET",route="/api/languages"}',
+        'babilonia_http_requests_total{method="POST",route="/api/exercises/sentence-correction",status="502"} 1',
+        'babilonia_llm_request_duration_seconds_count{operation="/api/exercises/fill-in-the-blank"} 1',
+        'babilonia_llm_prompt_tokens_total{operation="/api/exercises/fill-in-the-blank"}',
+        'babilonia_llm_response_tokens_total{operation="/api/exercises/fill-in-the-blank"}',
+        'babilonia_llm_parse_failures_total{operation="/api/exercises/sentence-correction"} 1',
+        'babilonia_llm_errors_total{operation="/api/exercises/daily-quote"} 1',
+        'babilonia_db_queries_per_request_count{route="/api/languages"}',
+        'babilonia_exercise_pool_ready_exercises 0',
+    )
+    for prefix in expected:
+        matches = [line for line in lines if line.startswith(prefix)]
+        assert matches, f"missing metric: {prefix}"
+        print(matches[0])
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker_main(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
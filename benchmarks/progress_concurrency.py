@@ -0,0 +1,105 @@
+"""
+Verifica che gli aggiornamenti concorrenti dei progressi non si perdano: N task, ognuno
+con la propria sessione, sommano M volte +1 al vocabolario della stessa riga. Per
+confronto viene eseguito anche il vecchio schema lettura-modifica-scrittura in Python.
+Verifica inoltre che la creazione concorrente della riga con increment_progress ne
+inserisca una sola.
+
+Uso: python benchmarks/progress_concurrency.py [task] [incrementi_per_task]
+"""
+import asyncio
+import sys
+import time
+import uuid
+
+import fake_llm  # noqa: F401  (prepara sys.path e la directory di lavoro)
+
+from sqlalchemy import func, select
+
+import crud
+import models
+from database import AsyncSessionLocal, init_db
+
+USER_ID = 990_017
+
+
+async def run_tasks(count: int, target):
+    go = asyncio.Event()
+
+    async def worker():
+        async with AsyncSessionLocal() as db:
+            await go.wait()
+            await target(db)
+
+    workers = [asyncio.create_task(worker()) for _ in range(count)]
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    go.set()
+    await asyncio.gather(*workers)
+    return time.perf_counter() - start
+
+
+async def read_modify_write(db, language: str):
+    # Il vecchio aggiornamento dei progressi: lettura, somma in Python, commit
+    result = await db.execute(
+        select(models.UserProgress).filter_by(user_id=USER_ID, target_language=language)
+    )
+    progress = result.scalars().first()
+    progress.vocabulary_level += 1
+    await db.commit()
+
+
+async def current_level(language: str) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await crud.get_progress(db, USER_ID, language)).vocabulary_level
+
+
+async def main(tasks: int, increments: int):
+    init_db()
+    expected = 1 + tasks * increments
+
+    async def repeat(operation):
+        for _ in range(increments):
+            await operation()
+
+    language = f"Bench-{uuid.uuid4().hex[:8]}"
+    async with AsyncSessionLocal() as db:
+        await crud.increment_progress(db, USER_ID, language)
+    elapsed = await run_tasks(
+        tasks, lambda db: repeat(lambda: read_modify_write(db, language))
+    )
+    print(
+        f"lettura-modifica-scrittura: livello {await current_level(language)} su {expected} "
+        f"attesi ({elapsed:.2f}s)"
+    )
+
+    language = f"Bench-{uuid.uuid4().hex[:8]}"
+    elapsed = await run_tasks(
+        tasks,
+        lambda db: repeat(
+            lambda: crud.increment_progress(db, USER_ID, language, vocabulary_delta=1)
+        ),
+    )
+    level = await current_level(language)
+    print(f"increment_progress: livello {level} su {expected} attesi ({elapsed:.2f}s)")
+    assert level == expected
+
+    language = f"Bench-{uuid.uuid4().hex[:8]}"
+    await run_tasks(tasks, lambda db: crud.increment_progress(db, USER_ID, language))
+    async with AsyncSessionLocal() as db:
+        rows = await db.scalar(
+            select(func.count())
+            .select_from(models.UserProgress)
+            .filter_by(user_id=USER_ID, target_language=language)
+        )
+    print(f"creazione della riga da {tasks} task: {rows} righe")
+    assert rows == 1
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        )
+    )
@@ -0,0 +1,110 @@
+"""
+Confronta la scrittura immediata dei progressi con la scrittura differita
+(PROGRESS_WRITE_BEHIND_ENABLED) inviando N correzioni concorrenti a /exercises/grade,
+che non chiama l'LLM, e contando gli INSERT/UPDATE eseguiti: con la scrittura immediata
+ogni richiesta ne fa due (registrazione della correzione e progressi), con quella
+differita le correzioni concorrenti sono registrate a gruppi e i progressi scritti in
+blocco (500 richieste: 1000 contro 5 scritture). Verifica che le risposte vedano i delta
+non ancora scritti e che, dopo l'ultima scrittura in blocco, il database contenga tutti
+gli incrementi.
+
+Uso: python benchmarks/progress_write_behind.py [numero_richieste]
+"""
+import asyncio
+import sys
+import time
+import uuid
+
+from fake_llm import FakeModel, install_fake_model
+
+import httpx
+from sqlalchemy import event
+
+import crud
+import models
+from database import AsyncSessionLocal, async_engine
+from main import app
+from api.endpoints import exercises
+from utils import progress_aggregator
+from utils.exercise_store import exercise_store
+
+writes = 0
+
+
+def count_writes(conn, cursor, statement, *args):
+    global writes
+    if statement.lstrip().upper().startswith(("INSERT", "UPDATE")):
+        writes += 1
+
+
+async def save_exercises(count: int) -> list:
+    """
+    Salva count esercizi diversi: ognuno si corregge una volta sola per utente.
+    """
+    submissions = []
+    for i in range(count):
+        exercise = {"sentence": f"Ich ___ Anna ({i}).", "options": ["bin", "bist"], "answer": "bin"}
+        submissions.append(
+            {
+                "exercise_id": await exercise_store.save("fill-in-the-blank", "German", exercise),
+                "exercise_type": "fill-in-the-blank",
+                "target_language": "German",
+                "answers": [{"question": exercise["sentence"], "user_answer": "bin"}],
+            }
+        )
+    return submissions
+
+
+async def submit_all(client, submissions: list):
+    start = time.perf_counter()
+    responses = await asyncio.gather(
+        *[client.post("/api/exercises/grade", json=submission) for submission in submissions]
+    )
+    elapsed = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses)
+    levels = [response.json()["new_progress"]["grammar_level"] for response in responses]
+    return elapsed, levels
+
+
+async def stored_level(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return (await crud.get_progress(db, user_id, "German")).grammar_level
+
+
+async def run(count: int):
+    global writes
+    install_fake_model(FakeModel(latency=0.0))
+    fake_user = models.User(id=990_018, username="bench-write-behind", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_writes)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        submissions = await save_exercises(count)
+
+        # Ogni fase usa un utente nuovo, quindi parte da una riga di progressi vuota
+        fake_user.id = 1_000_000 + uuid.uuid4().int % 1_000_000_000
+        writes = 0
+        elapsed, levels = await submit_all(client, submissions)
+        print(
+            f"scrittura immediata: {count} richieste in {elapsed:.2f}s, {writes} scritture, "
+            f"livello finale {await stored_level(fake_user.id)}"
+        )
+
+        progress_aggregator.PROGRESS_WRITE_BEHIND_ENABLED = True
+        writer = asyncio.create_task(progress_aggregator.progress_aggregator.run())
+        fake_user.id = 1_000_000 + uuid.uuid4().int % 1_000_000_000
+        writes = 0
+        elapsed, levels = await submit_all(client, submissions)
+        progress_aggregator.progress_aggregator.stop()
+        await writer
+        print(
+            f"scrittura differita: {count} richieste in {elapsed:.2f}s, {writes} scritture, "
+            f"livello massimo visto nelle risposte {max(levels)}, "
+            f"livello finale {await stored_level(fake_user.id)}"
+        )
+        assert max(levels) == count + 1
+        assert await stored_level(fake_user.id) == count + 1
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
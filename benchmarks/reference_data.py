@@ -0,0 +1,77 @@
+"""
+Misura /api/languages, /api/topics e /api/lesson-subjects:
+- snapshot riletto ad ogni richiesta (TTL 0, come prima: una query e una serializzazione)
+- snapshot in memoria
+- snapshot in memoria con If-None-Match (304 Not Modified)
+Verifica inoltre che un'aggiunta renda subito visibile la nuova lingua con un nuovo ETag.
+
+Uso: python benchmarks/reference_data.py [richieste]
+"""
+import asyncio
+import sys
+import time
+import uuid
+
+import fake_llm  # noqa: F401  (prepara sys.path e la directory di lavoro)
+
+import httpx
+from sqlalchemy import event
+
+from main import app
+from database import async_engine
+from utils.reference_data import reference_data
+
+PATHS = ("/api/languages", "/api/topics", "/api/lesson-subjects")
+
+queries = 0
+
+
+def count_query(*args):
+    global queries
+    queries += 1
+
+
+async def measure(client, requests: int, conditional: bool):
+    global queries
+    etags = {path: (await client.get(path)).headers["etag"] for path in PATHS}
+    queries = 0
+    statuses = set()
+    start = time.perf_counter()
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)]
+        headers = {"If-None-Match": etags[path]} if conditional else {}
+        response = await client.get(path, headers=headers)
+        statuses.add(response.status_code)
+    elapsed = time.perf_counter() - start
+    return elapsed / requests * 1e6, queries / requests, statuses
+
+
+async def run(requests: int):
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        reference_data.ttl = 0
+        results = {"riletto ad ogni richiesta": await measure(client, requests, False)}
+        reference_data.ttl = 300
+        results["snapshot in memoria"] = await measure(client, requests, False)
+        results["snapshot, If-None-Match"] = await measure(client, requests, True)
+        for name, (micros, per_request, statuses) in results.items():
+            print(
+                f"{name:<28} {micros:8.1f} µs/richiesta  {per_request:.2f} query/richiesta  "
+                f"stati {sorted(statuses)}"
+            )
+
+        before = await client.get("/api/languages")
+        name = f"Bench{uuid.uuid4().hex[:8]}"
+        response = await client.post("/api/add-language", json={"name": name})
+        assert response.status_code == 200, response.text
+        after = await client.get(
+            "/api/languages", headers={"If-None-Match": before.headers["etag"]}
+        )
+        assert after.status_code == 200 and after.headers["etag"] != before.headers["etag"]
+        assert name.capitalize() in [language["name"] for language in after.json()]
+        print("dopo /add-language: nuovo ETag e nuova lingua visibile")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 3000))
@@ -0,0 +1,89 @@
+"""
+Confronta N chiamate in sequenza a /exercises/sentence-correction con una sola chiamata a
+/exercises/sentence-correction/batch. Il modello fittizio omette una frase dalla risposta,
+per verificare che l'errore sia riportato solo su quella frase.
+
+Uso: python benchmarks/sentence_correction_batch.py [numero_frasi] [latenza_llm_secondi]
+"""
+import asyncio
+import json
+import re
+import sys
+import time
+
+from fake_llm import FakeModel, FakeResponse, install_fake_model
+
+import httpx
+import models
+from main import app
+from api.endpoints import exercises
+
+
+class CorrectionModel(FakeModel):
+    """
+    Modello fittizio che corregge ogni frase numerata del prompt, tranne la frase con
+    indice `drop_index`. Ai prompt con una sola frase risponde con un oggetto.
+    """
+
+    drop_index = 3
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        await asyncio.sleep(self._latency_for(prompt))
+        numbered = re.findall(r"^(\d+)\. (.*)$", prompt, flags=re.MULTILINE)
+        if not numbered:
+            correction = {"corrected_sentence": "Ich bin Anna.", "explanation": "Coniugazione."}
+            return FakeResponse(json.dumps(correction))
+        items = [
+            {"index": int(index), "corrected_sentence": sentence.upper(), "explanation": "Ok."}
+            for index, sentence in numbered
+            if int(index) != self.drop_index
+        ]
+        return FakeResponse(json.dumps(items))
+
+
+async def run(count: int, latency: float):
+    fake = install_fake_model(CorrectionModel(latency=latency))
+    fake_user = models.User(id=1, username="bench", native_language="Italian")
+    app.dependency_overrides[exercises.get_current_user] = lambda: fake_user
+    sentences = [f"Ich bist Schüler numero {i}" for i in range(count)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        for sentence in sentences:
+            response = await client.post(
+                "/api/exercises/sentence-correction",
+                json={"sentence": sentence, "target_language": "German"},
+            )
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - start
+        print(f"{count} chiamate singole: {elapsed:.2f}s, {fake.calls} chiamate all'LLM")
+
+        fake.calls = 0
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/exercises/sentence-correction/batch",
+            json={"sentences": sentences, "target_language": "German"},
+        )
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.text
+        corrections = response.json()["corrections"]
+        failed = [i for i, item in enumerate(corrections) if item["error"]]
+        assert [item["sentence"] for item in corrections] == sentences
+        assert all(
+            item["correction"]["corrected_sentence"] == item["sentence"].upper()
+            for item in corrections
+            if item["correction"]
+        )
+        print(
+            f"batch: {elapsed:.2f}s, {fake.calls} chiamate all'LLM, "
+            f"frasi non corrette: {failed}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        run(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+            float(sys.argv[2]) if len(sys.argv) > 2 else 0.5,
+        )
+    )
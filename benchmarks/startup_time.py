@@ -0,0 +1,106 @@
+"""
+Misura il tempo e le query di init_db all'avvio di un worker, su un database vuoto e su
+uno già popolato, confrontando l'inizializzazione attuale con quella precedente (una
+SELECT per ogni riga iniziale e un commit per ogni riga mancante, con create_all
+eseguito due volte). Ogni misura gira in un processo separato su un database temporaneo,
+indicato con DATABASE_URL.
+
+Uso: python benchmarks/startup_time.py [ripetizioni]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+def legacy_init_db():
+    import models
+    from database import (
+        INITIAL_LANGUAGES,
+        INITIAL_LESSON_SUBJECTS,
+        INITIAL_TOPICS,
+        _add_progress_unique_index,
+        engine,
+    )
+    from sqlalchemy.orm import Session
+
+    models.Base.metadata.create_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _add_progress_unique_index(conn, models)
+    db = Session(engine, autoflush=False)
+    try:
+        for model, names in (
+            (models.Language, INITIAL_LANGUAGES),
+            (models.Topic, INITIAL_TOPICS),
+            (models.LessonSubject, INITIAL_LESSON_SUBJECTS),
+        ):
+            for name in names:
+                if not db.query(model).filter_by(name=name).first():
+                    row = model(name=name)
+                    db.add(row)
+                    db.commit()
+                    db.refresh(row)
+    finally:
+        db.close()
+
+
+def worker_main(variant: str):
+    import time
+
+    import fake_llm  # noqa: F401  (prepara sys.path e la directory di lavoro)
+
+    from sqlalchemy import event
+
+    import database
+
+    queries = 0
+
+    def count_query(*args):
+        nonlocal queries
+        queries += 1
+
+    event.listen(database.engine, "before_cursor_execute", count_query)
+    start = time.perf_counter()
+    if variant == "precedente":
+        legacy_init_db()
+    else:
+        database.init_db()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"ms": elapsed * 1000, "queries": queries}))
+
+
+def run_worker(database_url: str, variant: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", variant],
+        env={**os.environ, "DATABASE_URL": database_url},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(repetitions: int):
+    for variant in ("precedente", "attuale"):
+        results = {"vuoto": [], "popolato": []}
+        for _ in range(repetitions):
+            with tempfile.TemporaryDirectory() as directory:
+                url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+                results["vuoto"].append(run_worker(url, variant))
+                results["popolato"].append(run_worker(url, variant))
+        for state, runs in results.items():
+            print(
+                f"init_db {variant}, database {state}: "
+                f"{statistics.median(run['ms'] for run in runs):.1f} ms, "
+                f"{runs[0]['queries']} query"
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker_main(sys.argv[2])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,213 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta, datetime, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, models, schemas
+from database import AsyncSessionLocal, get_db
+
+load_dotenv()
+
+# Dipendenze condivise dagli endpoint che richiedono un utente autenticato
+
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
+
+
+class UserCache:
+    """
+    Cache in memoria, limitata e con scadenza, degli utenti letti a database. Serve solo
+    per i token emessi prima che i dati dell'utente venissero inclusi nel token stesso.
+    Chi modifica la riga di un utente deve chiamare invalidate con il suo username.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Optional[schemas.User]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return user
+
+    def set(self, username: str, user: schemas.User):
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+user_cache = UserCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+
+
+def create_access_token(user: models.User) -> str:
+    """
+    Genera il token JWT di accesso includendo i dati dell'utente usati dagli endpoint,
+    così la verifica del token non richiede alcuna query a database.
+    """
+    to_encode = {
+        "sub": user.username,
+        "uid": user.id,
+        "native_language": user.native_language,
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def _utcnow() -> datetime:
+    # SQLite salva date senza fuso orario: si usa sempre UTC "naive"
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _hash_token_secret(secret: str) -> str:
+    # Il segreto è casuale a 256 bit: basta un hash veloce, bcrypt non serve
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+async def create_refresh_token(db: AsyncSession, user_id: int) -> str:
+    """
+    Emette un refresh token revocabile nella forma "<id>.<segreto>". A database si
+    salvano solo l'id, indicizzato, e l'hash SHA-256 del segreto.
+    """
+    token_id = secrets.token_urlsafe(12)
+    secret = secrets.token_urlsafe(32)
+    await crud.create_refresh_token(
+        db,
+        token_id=token_id,
+        token_hash=_hash_token_secret(secret),
+        user_id=user_id,
+        expires_at=_utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return f"{token_id}.{secret}"
+
+
+async def verify_refresh_token(
+    db: AsyncSession, refresh_token: str
+) -> Optional[models.RefreshToken]:
+    """
+    Restituisce la riga del refresh token se è valido, non scaduto e non revocato.
+    """
+    token_id, _, secret = refresh_token.partition(".")
+    db_token = await crud.get_refresh_token(db, token_id)
+    if (
+        db_token is None
+        or db_token.revoked
+        or db_token.expires_at <= _utcnow()
+        or not hmac.compare_digest(db_token.token_hash, _hash_token_secret(secret))
+    ):
+        return None
+    return db_token
+
+
+async def consume_refresh_token(
+    db: AsyncSession, refresh_token: str
+) -> Optional[models.RefreshToken]:
+    """
+    Verifica il refresh token e lo revoca in modo atomico. Con più richieste concorrenti
+    con lo stesso token la riga viene restituita solo a quella che l'ha revocato.
+    """
+    db_token = await verify_refresh_token(db, refresh_token)
+    if db_token is None or not await crud.consume_refresh_token(db, db_token.id, _utcnow()):
+        return None
+    return db_token
+
+
+async def delete_expired_refresh_tokens() -> int:
+    """
+    Elimina a blocchi i refresh token scaduti o revocati.
+    """
+    async with AsyncSessionLocal() as db:
+        return await crud.delete_expired_refresh_tokens(db, now=_utcnow())
+
+
+async def _load_user(username: str) -> Optional[schemas.User]:
+    async with AsyncSessionLocal() as db:
+        user = await crud.get_user_by_username(db, username=username)
+        if user is None:
+            return None
+        return schemas.User(
+            id=user.id, username=user.username, native_language=user.native_language
+        )
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> schemas.User:
+    """
+    Ricava l'utente autenticato dal token JWT. I dati necessari sono nel token; per i
+    token che non li contengono si usa la cache degli utenti e, solo in caso di miss,
+    il database.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+
+    user_id = payload.get("uid")
+    native_language = payload.get("native_language")
+    if user_id is not None and native_language is not None:
+        return schemas.User(id=user_id, username=username, native_language=native_language)
+
+    user = user_cache.get(username)
+    if user is None:
+        user = await _load_user(username)
+        if user is None:
+            raise credentials_exception
+        user_cache.set(username, user)
+    return user
+
+
+async def resolve_target_language(db: AsyncSession, name: str) -> str:
+    """
+    Restituisce il nome canonico di una lingua supportata (es. "de", "deutsch" ->
+    "German"). Le lingue sconosciute vengono rifiutate prima di qualsiasi chiamata all'LLM.
+    """
+    language = await crud.get_language_by_name(db, name)
+    if language is None:
+        raise HTTPException(status_code=404, detail="Language not found")
+    return language.name
+
+
+async def get_target_language(target_language: str, db: AsyncSession = Depends(get_db)) -> str:
+    """
+    Dipendenza per gli endpoint con target_language nella query string.
+    """
+    return await resolve_target_language(db, target_language)
@@ -1,64 +1,100 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import schemas, crud, models
-from database import SessionLocal
+from database import get_db
+from api.dependencies import (
+    create_access_token,
+    consume_refresh_token,
+    create_refresh_token,
+    verify_refresh_token,
+    user_cache,
+)
+from utils.passwords import hash_password, verify_password
 from typing import Annotated
-from passlib.context import CryptContext
-from datetime import timedelta, datetime, timezone
-from jose import JWTError, jwt
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Crea un nuovo utente nel database.
     """
-    db_user = crud.get_user_by_username(db, username=user.username)
+    db_user = await crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    # La connessione torna al pool mentre si calcola l'hash
+    await db.close()
+    hashed_password = await hash_password(user.password)
+    db_user = await crud.create_user(db=db, user=user, hashed_password=hashed_password)
+    return db_user
 
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Gestisce il processo di login di un utente e genera un token di accesso JWT (JSON Web Token) se l'autenticazione ha successo.
+    Se il costo bcrypt configurato è cambiato, l'hash della password viene aggiornato.
     """
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not pwd_context.verify(form_data.password, user.hashed_password):
+    user = await crud.get_user_by_username(db, username=form_data.username)
+    # La connessione torna al pool mentre si verifica la password
+    await db.close()
+    valid, new_hash = (
+        await verify_password(form_data.password, user.hashed_password)
+        if user
+        else (False, None)
+    )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode = {
-        "sub": user.username,
-        "exp": datetime.now(timezone.utc) + access_token_expires,
+    if new_hash:
+        await crud.update_user_password_hash(db, user.id, new_hash)
+        user_cache.invalidate(user.username)
+    return {
+        "access_token": create_access_token(user),
+        "token_type": "bearer",
+        "refresh_token": await create_refresh_token(db, user.id),
+    }
+
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    request: schemas.RefreshTokenRequest, db: AsyncSession = Depends(get_db)
+):
+    """
+    Emette un nuovo token di accesso a partire da un refresh token valido, senza
+    verificare di nuovo la password. Il refresh token usato viene revocato e sostituito;
+    se lo stesso token arriva più volte in contemporanea, solo una richiesta lo ottiene.
+    """
+    db_token = await consume_refresh_token(db, request.refresh_token)
+    user = await crud.get_user_by_id(db, db_token.user_id) if db_token else None
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "access_token": create_access_token(user),
+        "token_type": "bearer",
+        "refresh_token": await create_refresh_token(db, user.id),
     }
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return {"access_token": encoded_jwt, "token_type": "bearer"}
+
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(
+    request: schemas.RefreshTokenRequest, db: AsyncSession = Depends(get_db)
+):
+    """
+    Revoca un refresh token (ad esempio al logout).
+    """
+    db_token = await verify_refresh_token(db, request.refresh_token)
+    if db_token:
+        await crud.revoke_refresh_token(db, db_token.id)
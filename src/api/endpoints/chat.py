@@ -1,70 +1,359 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from typing import List
-from sqlalchemy.orm import Session
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
 import crud, schemas, models
-from database import SessionLocal
-from utils.llm_handler import generate_llm_response
+from database import AsyncSessionLocal, get_db
+from api.dependencies import get_current_user, resolve_target_language
+from utils.llm_handler import (
+    LLMUnavailableError,
+    generate_llm_response_async,
+    stream_llm_response,
+    estimate_tokens,
+    start_chat_session,
+    stream_chat_message,
+)
 
 router = APIRouter()
 
 # Questo modulo gestisce le interazioni della chat con il modello LLM,
 # consentendo agli utenti di interagire in diverse modalità (es. insegnante, compagno di conversazione, traduttore).
 
+# Token (stimati) della cronologia inclusi nel prompt delle sessioni di chat
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+# Se true i turni esclusi dalla finestra vengono riassunti invece di essere scartati
+CHAT_HISTORY_SUMMARIZE = os.getenv("CHAT_HISTORY_SUMMARIZE", "false").lower() == "true"
+# Giorni senza messaggi dopo cui una sessione di chat viene eliminata con la sua cronologia
+CHAT_SESSION_TTL_DAYS = int(os.getenv("CHAT_SESSION_TTL_DAYS", "30"))
+# Connessioni WebSocket aperte al massimo per worker e secondi di inattività prima della chiusura
+CHAT_WS_MAX_SESSIONS = int(os.getenv("CHAT_WS_MAX_SESSIONS", "500"))
+CHAT_WS_IDLE_TIMEOUT = float(os.getenv("CHAT_WS_IDLE_TIMEOUT", "300"))
 
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+open_ws_sessions = 0
 
 
-@router.post("/interaction", response_model=schemas.ChatMessage)
-def chat_interaction(
-    request: schemas.ChatInteractionRequest, db: Session = Depends(get_db)
-):
+async def get_system_prompt(db: AsyncSession, language_name: str, mode: str) -> str:
     """
-    Gestisce le interazioni della chat con il modello LLM in base alla modalità selezionata.
-    NB. Guardare ChatInteractionRequest epr il body della richiesta
+    Valida lingua e modalità e restituisce il messaggio di sistema corrispondente.
     """
-
-    language = crud.get_language_by_name(db, request.language.capitalize())
-    if not language:
-        raise HTTPException(status_code=404, detail="Language not found")
+    language_name = await resolve_target_language(db, language_name)
 
     system_prompts = {
-        "teacher": f"You are a {request.language} language teacher. Your role is to assist the user in learning {request.language}. Respond to their questions, correct their mistakes, and provide clear explanations in a supportive and encouraging manner.",
-        "talk_buddy": f"You are a native {request.language} speaker and you are a friendly conversation partner for the user who is learning your language. Chat with them about various topics, ask questions, and help them practice their speaking skills in a natural and informal way.",
-        "translator": f"You are a translation tool. Your task is to translate the user's text into {request.language}. Respond only with the translation of the user's message, without any additional comments or explanations.",
+        "teacher": f"You are a {language_name} language teacher. Your role is to assist the user in learning {language_name}. Respond to their questions, correct their mistakes, and provide clear explanations in a supportive and encouraging manner.",
+        "talk_buddy": f"You are a native {language_name} speaker and you are a friendly conversation partner for the user who is learning your language. Chat with them about various topics, ask questions, and help them practice their speaking skills in a natural and informal way.",
+        "translator": f"You are a translation tool. Your task is to translate the user's text into {language_name}. Respond only with the translation of the user's message, without any additional comments or explanations.",
     }
 
-    if request.mode not in system_prompts:
+    if mode not in system_prompts:
         raise HTTPException(
             status_code=400,
             detail="Invalid mode specified. Available modes: teacher, talk_buddy, translator.",
         )
+    return system_prompts[mode]
+
 
+async def build_chat_prompt(request: schemas.ChatInteractionRequest, db: AsyncSession) -> str:
+    """
+    Valida lingua e modalità della richiesta e costruisce il prompt con il messaggio di
+    sistema e la cronologia della conversazione.
+    """
     system_message = schemas.ChatMessage(
-        role="system", content=system_prompts[request.mode]
+        role="system", content=await get_system_prompt(db, request.language, request.mode)
     )
 
     full_message_history = [system_message] + request.messages
 
-    prompt = "\n".join([f"{msg.role}: {msg.content}" for msg in full_message_history])
+    return "\n".join([f"{msg.role}: {msg.content}" for msg in full_message_history])
+
+
+@router.post("/interaction", response_model=schemas.ChatMessage)
+async def chat_interaction(
+    request: schemas.ChatInteractionRequest, db: AsyncSession = Depends(get_db)
+):
+    """
+    Gestisce le interazioni della chat con il modello LLM in base alla modalità selezionata.
+    NB. Guardare ChatInteractionRequest epr il body della richiesta
+    """
+    prompt = await build_chat_prompt(request, db)
 
     try:
-        llm_response_content = generate_llm_response(prompt)
-        return schemas.ChatMessage(role="assistant", content=llm_response_content)
-    except Exception as e:
+        llm_response_content = await generate_llm_response_async(prompt)
+    except LLMUnavailableError as e:
         raise HTTPException(
-            status_code=500,
+            status_code=502,
             detail=f"An error occurred while communicating with the LLM: {e}",
         )
+    return schemas.ChatMessage(role="assistant", content=llm_response_content)
+
+
+@router.post("/interaction/stream")
+async def chat_interaction_stream(
+    request: schemas.ChatInteractionRequest, db: AsyncSession = Depends(get_db)
+):
+    """
+    Come /interaction, ma invia la risposta come Server-Sent Events man mano che il
+    modello la genera. Ogni frammento è un evento `data: {"content": ...}`; alla fine
+    un evento `done` contiene il ChatMessage completo, un evento `error` segnala un
+    problema con l'LLM.
+    """
+    prompt = await build_chat_prompt(request, db)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in stream_llm_response(prompt):
+                chunks.append(chunk)
+                yield f"data: {json.dumps({'content': chunk})}\n\n"
+        except Exception as e:
+            print(f"Error streaming from Gemini API: {e}")
+            error = {"detail": f"An error occurred while communicating with the LLM: {e}"}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+            return
+        message = schemas.ChatMessage(role="assistant", content="".join(chunks))
+        yield f"event: done\ndata: {message.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _utcnow() -> datetime:
+    # SQLite salva date senza fuso orario: si usa sempre UTC "naive"
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def delete_expired_chat_sessions() -> int:
+    """
+    Elimina le sessioni di chat senza messaggi da più di CHAT_SESSION_TTL_DAYS giorni.
+    """
+    async with AsyncSessionLocal() as db:
+        return await crud.delete_expired_chat_sessions(
+            db, inactive_since=_utcnow() - timedelta(days=CHAT_SESSION_TTL_DAYS)
+        )
+
+
+async def get_user_chat_session(
+    db: AsyncSession, session_id: str, current_user: schemas.User
+) -> models.ChatSession:
+    """
+    Recupera una sessione di chat dell'utente. Le sessioni di altri utenti risultano
+    inesistenti, così gli id non possono essere sondati.
+    """
+    session = await crud.get_chat_session(db, session_id)
+    if not session or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+
+@router.post("/sessions", response_model=schemas.ChatSession)
+async def create_chat_session(
+    request: schemas.ChatSessionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+):
+    """
+    Crea una sessione di chat lato server per l'utente. La cronologia resta sul server:
+    ad ogni turno il client invia solo il nuovo messaggio a /sessions/{session_id}/messages.
+    """
+    await get_system_prompt(db, request.language, request.mode)
+    return await crud.create_chat_session(
+        db,
+        session_id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        language=request.language,
+        mode=request.mode,
+        now=_utcnow(),
+    )
+
+
+async def summarize_dropped_messages(db: AsyncSession, session: models.ChatSession, before_id: int):
+    """
+    Aggiorna il riassunto della sessione con i messaggi usciti dalla finestra di
+    cronologia. Si riassume a blocchi, solo quando i messaggi esclusi e non ancora
+    riassunti superano metà del budget, per non aggiungere una chiamata LLM ad ogni turno.
+    """
+    after_id = session.summary_until_id or 0
+    dropped_tokens = await crud.count_chat_tokens_between(db, session.id, after_id, before_id)
+    if dropped_tokens < CHAT_HISTORY_TOKEN_BUDGET // 2:
+        return
+    dropped = await crud.get_chat_messages_between(db, session.id, after_id, before_id)
+    transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in dropped)
+    prompt = f"""Summarize the following conversation between a language learner and an assistant in a few sentences, keeping the facts, topics and the learner's recurring mistakes that matter for continuing the conversation.
+    Previous summary: {session.summary or "none"}
+    Conversation:
+    {transcript}"""
+    try:
+        summary = await generate_llm_response_async(prompt)
+    except LLMUnavailableError:
+        # Si riprova al turno successivo; intanto i messaggi esclusi restano fuori dal prompt
+        return
+    await crud.update_chat_session_summary(db, session, summary, dropped[-1].id)
+
+
+@router.post("/sessions/{session_id}/messages", response_model=schemas.ChatMessage)
+async def send_chat_session_message(
+    session_id: str,
+    request: schemas.ChatSessionMessageRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+):
+    """
+    Aggiunge un messaggio dell'utente alla sessione e restituisce la risposta del
+    modello. Il prompt include solo i turni più recenti che rientrano in
+    CHAT_HISTORY_TOKEN_BUDGET, più l'eventuale riassunto di quelli precedenti, così il
+    costo di ogni turno non cresce con la lunghezza della conversazione.
+    """
+    session = await get_user_chat_session(db, session_id, current_user)
+    system_prompt = await get_system_prompt(db, session.language, session.mode)
+
+    # Salvato con il messaggio dell'utente, nello stesso commit
+    session.last_activity_at = _utcnow()
+    user_message = await crud.add_chat_message(
+        db, session.id, "user", request.content, estimate_tokens(request.content)
+    )
+    window = await crud.get_chat_history_window(db, session.id, CHAT_HISTORY_TOKEN_BUDGET)
+    if CHAT_HISTORY_SUMMARIZE:
+        await summarize_dropped_messages(db, session, window[0].id)
+
+    prompt_lines = [f"system: {system_prompt}"]
+    if session.summary:
+        prompt_lines.append(f"system: Summary of the earlier conversation: {session.summary}")
+    prompt_lines.extend(f"{msg.role}: {msg.content}" for msg in window)
+
+    try:
+        llm_response_content = await generate_llm_response_async("\n".join(prompt_lines))
+    except LLMUnavailableError as e:
+        # Il turno dell'utente rimasto senza risposta non deve entrare nei prompt successivi
+        await crud.delete_chat_message(db, user_message.id)
+        raise HTTPException(
+            status_code=502,
+            detail=f"An error occurred while communicating with the LLM: {e}",
+        )
+    await crud.add_chat_message(
+        db,
+        session.id,
+        "assistant",
+        llm_response_content,
+        estimate_tokens(llm_response_content),
+    )
+    return schemas.ChatMessage(role="assistant", content=llm_response_content)
+
+
+@router.get("/sessions/{session_id}/messages", response_model=List[schemas.ChatMessage])
+async def get_chat_session_messages(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+):
+    """
+    Ritorna l'intera cronologia di una sessione di chat dell'utente.
+    """
+    await get_user_chat_session(db, session_id, current_user)
+    return [
+        schemas.ChatMessage(role=msg.role, content=msg.content)
+        for msg in await crud.get_chat_messages(db, session_id)
+    ]
+
+
+async def _validate_chat_request(language: str, mode: str) -> str:
+    async with AsyncSessionLocal() as db:
+        return await get_system_prompt(db, language, mode)
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, language: str, mode: str):
+    """
+    Chat su WebSocket con una sessione del modello che resta aperta per tutta la
+    connessione: lingua, modalità e messaggio di sistema vengono elaborati una sola
+    volta. Il client invia {"content": "..."}; il server risponde con eventi
+    {"type": "chunk", "content": ...} e infine {"type": "done", "message": {...}}
+    (oppure {"type": "error", "detail": ...}, inviato anche per i messaggi che non sono
+    JSON, senza chiudere la connessione). La connessione viene chiusa dopo
+    CHAT_WS_IDLE_TIMEOUT secondi di inattività.
+    """
+    global open_ws_sessions
+    # Senza accept la chiusura diventa un 403 e il client non vede il codice: si accetta
+    # solo per comunicare il rifiuto, dopo i controlli
+    if open_ws_sessions >= CHAT_WS_MAX_SESSIONS:
+        await websocket.accept()
+        await websocket.close(code=1013, reason="Too many open chat sessions")
+        return
+
+    # Il posto è riservato prima di qualsiasi await, altrimenti connessioni concorrenti
+    # superano tutte il controllo
+    open_ws_sessions += 1
+    try:
+        try:
+            system_prompt = await _validate_chat_request(language, mode)
+        except HTTPException as e:
+            await websocket.accept()
+            await websocket.close(code=1008, reason=e.detail)
+            return
+        await websocket.accept()
+
+        chat = start_chat_session(system_prompt)
+        # token stimati di ogni turno (messaggio + risposta) presente nella cronologia
+        turn_tokens = []
+        while True:
+            try:
+                data = await asyncio.wait_for(
+                    websocket.receive_json(), timeout=CHAT_WS_IDLE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                await websocket.close(code=1000, reason="Idle timeout")
+                return
+            except json.JSONDecodeError:
+                await websocket.send_json({"type": "error", "detail": "Invalid JSON message"})
+                continue
+            content = data.get("content") if isinstance(data, dict) else None
+            if not content:
+                await websocket.send_json({"type": "error", "detail": "Missing content"})
+                continue
+
+            chunks = []
+            try:
+                async for chunk in stream_chat_message(chat, content):
+                    chunks.append(chunk)
+                    await websocket.send_json({"type": "chunk", "content": chunk})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"Error streaming from Gemini API: {e}")
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "detail": f"An error occurred while communicating with the LLM: {e}",
+                    }
+                )
+                continue
+
+            reply = "".join(chunks)
+            await websocket.send_json(
+                {"type": "done", "message": {"role": "assistant", "content": reply}}
+            )
+
+            # La cronologia in memoria resta entro CHAT_HISTORY_TOKEN_BUDGET: si scartano
+            # i turni più vecchi, mantenendo il messaggio di sistema iniziale
+            turn_tokens.append(estimate_tokens(content) + estimate_tokens(reply))
+            while len(turn_tokens) > 1 and sum(turn_tokens) > CHAT_HISTORY_TOKEN_BUDGET:
+                turn_tokens.pop(0)
+                history = list(chat.history)
+                chat.history = history[:2] + history[4:]
+    except WebSocketDisconnect:
+        pass
+    finally:
+        open_ws_sessions -= 1
 
 
 @router.get("/modes", response_model=List[str])
-def get_available_modes():
+async def get_available_modes():
     """
     Ritorna una lista delle modalità di interazione disponibili per la chat.
     """
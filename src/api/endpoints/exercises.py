@@ -1,203 +1,582 @@
+import asyncio
+import logging
+import os
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import schemas, crud, models
-from database import SessionLocal
-from utils.llm_handler import generate_llm_response, clean_json_response
-from jose import JWTError, jwt
-from fastapi.security import OAuth2PasswordBearer
-import os
-import json
-from typing import List, Optional
+from database import get_db
+from api.dependencies import get_current_user, get_target_language, resolve_target_language
+from utils.llm_handler import (
+    LLMUnavailableError,
+    generate_llm_response_async,
+    clean_json_response,
+    estimate_tokens,
+    generation_config,
+)
+from utils.json_parser import LLMResponseParseError, RESPONSE_SCHEMAS, validate_llm_data
+from utils.content_cache import generate_cached_json_response, get_cached_content, cache_content
+from utils.exercise_pool import exercise_pool
+from utils.exercise_store import exercise_store, with_exercise_id, GRADABLE_EXERCISES
+from utils.grading import exercise_questions, grade_answers, level_delta
+from utils import metrics
+from utils.progress_aggregator import apply_progress, mark_exercise_graded, read_progress
+from typing import Callable, Dict, List, Optional
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Frasi accettate al massimo da una richiesta di correzione multipla
+SENTENCE_CORRECTION_BATCH_MAX_ITEMS = int(os.getenv("SENTENCE_CORRECTION_BATCH_MAX_ITEMS", "50"))
+# Flashcard accettate al massimo da una correzione multipla (valutate con un solo prompt)
+FLASHCARD_CORRECTION_BATCH_MAX_ITEMS = int(
+    os.getenv("FLASHCARD_CORRECTION_BATCH_MAX_ITEMS", "50")
+)
+# Token di output (stimati) riservati alla spiegazione di ogni correzione; le frasi sono
+# divise in blocchi la cui risposta stimata sta nel limite max_output_tokens del modello
+SENTENCE_CORRECTION_EXPLANATION_TOKENS = int(
+    os.getenv("SENTENCE_CORRECTION_EXPLANATION_TOKENS", "120")
+)
+
+
+def build_fill_in_the_blank_prompt(
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
+) -> str:
+    """
+    Costruisce il prompt per un esercizio "riempi gli spazi".
+    """
+    prompt_parts = [
+        f"Create a 'fill-in-the-blank' exercise for a beginner learning {target_language}.",
+        f"The user's native language is {native_language}.",
+        f"The exercise must be in the {target_language} language.",
+    ]
+    if topic:
+        prompt_parts.append(f"The topic should be about: {topic}.")
+    if lesson_focus:
+        prompt_parts.append(
+            f"The exercise should focus on the grammar/vocabulary concept of: {lesson_focus}."
+        )
+    prompt_parts.append(
+        "Provide a sentence with a missing word, the options for the blank, and the correct answer. Format as a JSON object with 'sentence', 'options' (an array of strings), and 'answer' keys."
+    )
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
+    return " ".join(prompt_parts)
+
+
+def build_comprehension_test_prompt(
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
+) -> str:
+    """
+    Costruisce il prompt per un test di comprensione del testo.
+    """
+    prompt_parts = [
+        f"Generate a short text (about 3-4 paragraphs) in {target_language} for a language learner.",
+        f"The user's native language is {native_language}.",
+    ]
+    if topic:
+        prompt_parts.append(f"The topic should be about: {topic}.")
+    else:
+        prompt_parts.append("The topic should be about a daily life situation.")
+    if lesson_focus:
+        prompt_parts.append(
+            f"The text should subtly incorporate examples of: {lesson_focus}."
+        )
+    prompt_parts.append(
+        "After the text, create 3-4 multiple-choice questions about the text to test comprehension."
+    )
+    prompt_parts.append(f"The questions should be in {native_language}.")
+    prompt_parts.append(
+        "Format the entire output as a single JSON object with 'text' and 'questions' keys. The 'questions' should be an array of objects, each with 'question', 'options' (an array of strings), and 'answer' keys."
+    )
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
+    return " ".join(prompt_parts)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def build_flashcards_prompt(
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
+) -> str:
+    """
+    Costruisce il prompt per un set di 5 flashcard.
+    """
+    prompt_parts = [
+        f"Generate 5 flashcards for learning {target_language}.",
+        f"The user's native language is {native_language}.",
+    ]
+    if topic:
+        prompt_parts.append(f"The flashcards should be related to the topic: {topic}.")
+    if lesson_focus:
+        prompt_parts.append(
+            f"The flashcards should focus on vocabulary related to: {lesson_focus}."
+        )
+    prompt_parts.append(
+        "For each flashcard, provide a word or short phrase in the target language and its translation in the user's native language. Format the output as a JSON array of objects, where each object has 'word_or_phrase' and 'translation' keys."
+    )
 
+    return " ".join(prompt_parts)
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+
+def build_daily_practice_prompt(
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
+) -> str:
+    """
+    Costruisce il prompt per 5 frasi di vita quotidiana (topic e lesson_focus non sono usati).
+    """
+    return f"""Create a set of 5 simple, daily-life sentences in {target_language} for a beginner learner. The user's native language is {native_language}. For each sentence, provide the sentence in the target language, and its translation in the user's native language. Format the output as a JSON array of objects, where each object has 'sentence' and 'translation' keys."""
+
+
+EXERCISE_PROMPT_BUILDERS = {
+    "daily-practice": build_daily_practice_prompt,
+    "fill-in-the-blank": build_fill_in_the_blank_prompt,
+    "comprehension-test": build_comprehension_test_prompt,
+    "flashcards": build_flashcards_prompt,
+}
+
+# Chiave con cui ogni esercizio viene restituito dal rispettivo endpoint
+EXERCISE_RESPONSE_KEYS = {
+    "daily-practice": "practice_sentences",
+    "fill-in-the-blank": "exercise",
+    "comprehension-test": "comprehension_test",
+    "flashcards": "flashcards",
+}
+
+# Esercizi che possono essere pre-generati dal pool
+POOLED_EXERCISES = ("fill-in-the-blank", "comprehension-test", "flashcards")
+
+for exercise_type in POOLED_EXERCISES:
+    exercise_pool.register_prompt_builder(exercise_type, EXERCISE_PROMPT_BUILDERS[exercise_type])
+
+
+def _prompt_inputs(
+    exercise_type: str,
+    target_language: str,
+    native_language: str,
+    topic: Optional[str],
+    lesson_focus: Optional[str],
+) -> tuple:
+    # Gli input da cui dipende il prompt, usati come chiave di cache
+    if exercise_type == "daily-practice":
+        return (target_language, native_language)
+    return (target_language, native_language, topic, lesson_focus)
+
+
+async def generate_exercise(
+    exercise_type: str,
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
 ):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+    """
+    Restituisce un esercizio del tipo richiesto: dal pool di esercizi pre-generati se
+    disponibile, altrimenti dalla cache dei contenuti o da una nuova chiamata all'LLM.
+    """
+    if exercise_type in POOLED_EXERCISES:
+        exercise = exercise_pool.pop(
+            exercise_type, target_language, native_language, topic, lesson_focus
+        )
+        if exercise is not None:
+            return exercise
+    prompt = EXERCISE_PROMPT_BUILDERS[exercise_type](
+        target_language, native_language, topic, lesson_focus
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+    inputs = _prompt_inputs(exercise_type, target_language, native_language, topic, lesson_focus)
+    return await generate_cached_json_response(exercise_type, prompt, *inputs)
+
+
+def build_bundle_prompt(
+    exercise_types: List[str],
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
+) -> str:
+    """
+    Costruisce un unico prompt che chiede tutti gli esercizi indicati, ciascuno sotto la
+    propria chiave di un oggetto JSON.
+    """
+    prompt_parts = [
+        f"Create a bundle of {len(exercise_types)} independent exercises for a learner of {target_language}.",
+        "Format the entire output as a single JSON object with exactly these keys: "
+        + ", ".join(f"'{exercise_type}'" for exercise_type in exercise_types)
+        + ". The value of each key is the exercise described below, formatted as requested in its description.",
+    ]
+    for exercise_type in exercise_types:
+        description = EXERCISE_PROMPT_BUILDERS[exercise_type](
+            target_language, native_language, topic, lesson_focus
+        )
+        prompt_parts.append(f"'{exercise_type}': {description}")
+
+    return "\n\n".join(prompt_parts)
+
+
+async def generate_exercise_bundle(
+    exercise_types: List[str],
+    target_language: str,
+    native_language: str,
+    topic: Optional[str] = None,
+    lesson_focus: Optional[str] = None,
+) -> dict:
+    """
+    Genera più esercizi con una sola chiamata all'LLM. Gli esercizi già pronti nel pool o
+    in cache non vengono richiesti; quelli mancanti o non validi nella risposta combinata
+    vengono generati singolarmente, in parallelo.
+
+    Returns:
+        Un dizionario tipo di esercizio -> esercizio già validato.
+    """
+    exercises = {}
+    missing = []
+    for exercise_type in exercise_types:
+        exercise = None
+        if exercise_type in POOLED_EXERCISES:
+            exercise = exercise_pool.pop(
+                exercise_type, target_language, native_language, topic, lesson_focus
+            )
+        if exercise is None:
+            exercise = get_cached_content(
+                exercise_type,
+                *_prompt_inputs(exercise_type, target_language, native_language, topic, lesson_focus),
+            )
+        if exercise is None:
+            missing.append(exercise_type)
+        else:
+            exercises[exercise_type] = exercise
+
+    if len(missing) > 1:
+        prompt = build_bundle_prompt(missing, target_language, native_language, topic, lesson_focus)
+        try:
+            response = await generate_llm_response_async(prompt, json_output=True)
+            bundle = clean_json_response(response)
+        except (LLMUnavailableError, LLMResponseParseError) as e:
+            logger.warning("Error generating bundled exercises: %s", e)
+            bundle = {}
+        if not isinstance(bundle, dict):
+            metrics.observe_parse_failure()
+            bundle = {}
+
+        for exercise_type in list(missing):
+            try:
+                exercise = validate_llm_data(bundle[exercise_type], RESPONSE_SCHEMAS[exercise_type])
+            except (KeyError, LLMResponseParseError) as e:
+                logger.warning("Bundled exercise '%s' missing or invalid: %r", exercise_type, e)
+                # Con un errore della chiamata la risposta vuota è già stata contata
+                if bundle:
+                    metrics.observe_parse_failure()
+                continue
+            inputs = _prompt_inputs(exercise_type, target_language, native_language, topic, lesson_focus)
+            # La dimensione è stimata sulla quota della risposta combinata
+            cache_content(exercise_type, exercise, len(response.encode("utf-8")) // len(missing), *inputs)
+            exercises[exercise_type] = exercise
+            missing.remove(exercise_type)
+
+    # Ripiego: le parti mancanti si generano con le chiamate dei singoli endpoint
+    results = await asyncio.gather(
+        *(
+            generate_exercise(exercise_type, target_language, native_language, topic, lesson_focus)
+            for exercise_type in missing
+        )
+    )
+    exercises.update(zip(missing, results))
+    return exercises
 
 
 @router.get("/exercises/daily-practice")
-def get_daily_practice(
-    target_language: str, current_user: models.User = Depends(get_current_user)
+async def get_daily_practice(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
 ):
     """
     Genera una serie di 5 frasi semplici e di vita quotidiana per esercitarsi.
     """
-    prompt = f"""Create a set of 5 simple, daily-life sentences in {target_language} for a beginner learner. The user's native language is {current_user.native_language}. For each sentence, provide the sentence in the target language, and its translation in the user's native language. Format the output as a JSON array of objects, where each object has 'sentence' and 'translation' keys."""
-
-    response = generate_llm_response(prompt)
-    return {"practice_sentences": clean_json_response(response)}
+    practice_sentences = await generate_exercise(
+        "daily-practice", target_language, current_user.native_language
+    )
+    return {"practice_sentences": practice_sentences}
 
 
 @router.get("/exercises/daily-quote")
-def get_daily_quote(
-    target_language: str, current_user: models.User = Depends(get_current_user)
+async def get_daily_quote(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
 ):
     """
     Ritorna una citazione giornaliero in un certo linguaggio.
     """
     prompt = f"""Name a famous quote translated into the {target_language} language, with "<translated_{target_language}_quote> / <translated_{current_user.native_language}_quote> - (<author>)" style. Format the output just with the quote text and the author, without any other text. The translation must be in the {current_user.native_language} language."""
 
-    response = generate_llm_response(prompt)
+    response = await generate_llm_response_async(prompt)
     return {"quote": response}
 
 
 @router.get("/exercises/fill-in-the-blank")
-def get_fill_in_the_blank_exercise(
-    target_language: str,
-    current_user: models.User = Depends(get_current_user),
+async def get_fill_in_the_blank_exercise(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
     topic: Optional[str] = None,
     lesson_focus: Optional[str] = None,
 ):
     """
     Crea un esercizio "riempi gli spazi" basato su un argomento o un focus grammaticale.
     """
-    prompt_parts = [
-        f"Create a 'fill-in-the-blank' exercise for a beginner learning {target_language}.",
-        f"The user's native language is {current_user.native_language}.",
-        f"The exercise must be in the {target_language} language.",
-    ]
-    if topic:
-        prompt_parts.append(f"The topic should be about: {topic}.")
-    if lesson_focus:
-        prompt_parts.append(
-            f"The exercise should focus on the grammar/vocabulary concept of: {lesson_focus}."
-        )
-    prompt_parts.append(
-        "Provide a sentence with a missing word, the options for the blank, and the correct answer. Format as a JSON object with 'sentence', 'options' (an array of strings), and 'answer' keys."
+    exercise = await generate_exercise(
+        "fill-in-the-blank", target_language, current_user.native_language, topic, lesson_focus
     )
+    return {"exercise": await with_exercise_id("fill-in-the-blank", target_language, exercise)}
 
-    prompt = " ".join(prompt_parts)
-    response = generate_llm_response(prompt)
-    return {"exercise": clean_json_response(response)}
+
+@router.post("/exercises/bundle")
+async def get_exercise_bundle(
+    request: schemas.ExerciseBundleRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Genera più esercizi in una sola richiesta. Ogni esercizio ha la stessa forma restituita
+    dal rispettivo endpoint (es. {"flashcards": {"flashcards": [...]}}).
+    """
+    request.target_language = await resolve_target_language(db, request.target_language)
+    # Tipi senza duplicati, nell'ordine richiesto
+    exercise_types = list(dict.fromkeys(request.exercise_types))
+    unknown = [t for t in exercise_types if t not in EXERCISE_PROMPT_BUILDERS]
+    if not exercise_types or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported exercise types: {', '.join(unknown) or 'none requested'}. "
+            f"Supported types: {', '.join(EXERCISE_PROMPT_BUILDERS)}.",
+        )
+
+    exercises = await generate_exercise_bundle(
+        exercise_types,
+        request.target_language,
+        current_user.native_language,
+        request.topic,
+        request.lesson_focus,
+    )
+    return {
+        exercise_type: {
+            EXERCISE_RESPONSE_KEYS[exercise_type]: await with_exercise_id(
+                exercise_type, request.target_language, exercises[exercise_type]
+            )
+        }
+        for exercise_type in exercise_types
+    }
 
 
 @router.post("/exercises/sentence-correction")
-def correct_sentence(
+async def correct_sentence(
     request: schemas.SentenceCorrectionRequest,
-    current_user: models.User = Depends(get_current_user),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Corregge una frase scritta dall'utente e fornisce una spiegazione.
     """
+    request.target_language = await resolve_target_language(db, request.target_language)
     prompt = f"""A user is learning {request.target_language}. His native language is {current_user.native_language}.
     The user wrote the following sentence: '{request.sentence}'
     Please correct the sentence if there are any errors.
     Then, provide a brief, simple explanation of the correction in {current_user.native_language}.
     Format the output as a JSON object with 'corrected_sentence' and 'explanation' keys."""
 
-    response = generate_llm_response(prompt)
-    return {"correction": clean_json_response(response)}
+    response = await generate_llm_response_async(prompt, json_output=True)
+    return {"correction": clean_json_response(response, "sentence-correction")}
 
 
-@router.get("/exercises/comprehension-test")
-def get_comprehension_test(
+async def evaluate_numbered_items(
+    lines: Dict[int, str], build_prompt: Callable[[str], str], schema, description: str
+) -> Dict[int, dict]:
+    """
+    Chiede all'LLM, con un solo prompt, un oggetto JSON per ciascuna delle righe
+    numerate. Gli oggetti non validi vengono scartati e contati come errori di
+    interpretazione, quelli con un indice non richiesto ignorati.
+
+    Args:
+        lines: Indice -> testo della riga, numerata nel prompt con l'indice.
+        build_prompt: Costruisce il prompt a partire dal blocco di righe numerate.
+        schema: Schema di ogni oggetto della risposta, con una chiave 'index'.
+        description: Nome degli oggetti nei messaggi di log (es. "flashcard evaluation").
+
+    Returns:
+        Un dizionario indice -> oggetto validato (senza 'index'); vuoto se la chiamata
+        fallisce. Le righe mancanti sono da considerare non valutate.
+    """
+    numbered = "\n".join(f"{i}. {line}" for i, line in lines.items())
+    try:
+        response = await generate_llm_response_async(build_prompt(numbered), json_output=True)
+        items = clean_json_response(response)
+    except (LLMUnavailableError, LLMResponseParseError) as e:
+        logger.warning("Error requesting %ss: %s", description, e)
+        return {}
+    if not isinstance(items, list):
+        metrics.observe_parse_failure()
+        return {}
+
+    evaluations = {}
+    for item in items:
+        try:
+            evaluation = validate_llm_data(item, schema)
+        except LLMResponseParseError as e:
+            logger.warning("Skipping invalid %s: %s", description, e)
+            metrics.observe_parse_failure()
+            continue
+        index = evaluation.pop("index")
+        if index in lines:
+            evaluations[index] = evaluation
+    return evaluations
+
+
+def chunk_sentences_for_correction(sentences: List[str]) -> List[List[int]]:
+    """
+    Divide le frasi (per indice) in blocchi la cui risposta stimata (frase corretta,
+    spiegazione e struttura JSON) non supera i tre quarti di max_output_tokens.
+    """
+    budget = generation_config["max_output_tokens"] * 3 // 4
+    chunks: List[List[int]] = []
+    used = budget
+    for index, sentence in enumerate(sentences):
+        cost = estimate_tokens(sentence) + SENTENCE_CORRECTION_EXPLANATION_TOKENS + 20
+        if used + cost > budget and (not chunks or chunks[-1]):
+            chunks.append([])
+            used = 0
+        chunks[-1].append(index)
+        used += cost
+    return chunks
+
+
+async def correct_sentence_chunk(
+    sentences: List[str],
+    indexes: List[int],
     target_language: str,
-    current_user: models.User = Depends(get_current_user),
+    native_language: str,
+) -> dict:
+    """
+    Corregge con un solo prompt le frasi indicate.
+
+    Returns:
+        Un dizionario indice -> correzione per le frasi presenti e valide nella risposta.
+        Le frasi mancanti sono da considerare fallite.
+    """
+    def build_prompt(numbered: str) -> str:
+        return f"""A user is learning {target_language}. Their native language is {native_language}.
+    The user wrote the following numbered sentences:
+{numbered}
+    Please correct each sentence if there are any errors.
+    For each one, provide a brief, simple explanation of the correction in {native_language}.
+    Format the output as a JSON array with one object per sentence, each with 'index' (the number of the sentence), 'corrected_sentence' and 'explanation' keys."""
+
+    return await evaluate_numbered_items(
+        {i: sentences[i] for i in indexes},
+        build_prompt,
+        schemas.SentenceCorrectionBatchItem,
+        "sentence correction",
+    )
+
+
+@router.post("/exercises/sentence-correction/batch")
+async def correct_sentences(
+    request: schemas.SentenceCorrectionBatchRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Corregge più frasi scritte dall'utente con un prompt per blocco di frasi. Le correzioni
+    sono restituite nell'ordine delle frasi; quelle non riuscite hanno "correction" nullo
+    e un messaggio in "error", senza far fallire le altre.
+    """
+    request.target_language = await resolve_target_language(db, request.target_language)
+    if not request.sentences:
+        raise HTTPException(status_code=400, detail="No sentences to correct.")
+    if len(request.sentences) > SENTENCE_CORRECTION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many sentences: at most {SENTENCE_CORRECTION_BATCH_MAX_ITEMS} per request.",
+        )
+
+    results = await asyncio.gather(
+        *(
+            correct_sentence_chunk(
+                request.sentences,
+                indexes,
+                request.target_language,
+                current_user.native_language,
+            )
+            for indexes in chunk_sentences_for_correction(request.sentences)
+        )
+    )
+    corrections = {}
+    for chunk_corrections in results:
+        corrections.update(chunk_corrections)
+
+    return {
+        "corrections": [
+            {
+                "sentence": sentence,
+                "correction": corrections.get(index),
+                "error": None if index in corrections else "Could not correct this sentence.",
+            }
+            for index, sentence in enumerate(request.sentences)
+        ]
+    }
+
+
+@router.get("/exercises/comprehension-test")
+async def get_comprehension_test(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
     topic: Optional[str] = None,
     lesson_focus: Optional[str] = None,
 ):
     """
     Genera un testo breve con domande a scelta multipla per testare la comprensione.
     """
-    prompt_parts = [
-        f"Generate a short text (about 3-4 paragraphs) in {target_language} for a language learner.",
-        f"The user's native language is {current_user.native_language}.",
-    ]
-    if topic:
-        prompt_parts.append(f"The topic should be about: {topic}.")
-    else:
-        prompt_parts.append("The topic should be about a daily life situation.")
-    if lesson_focus:
-        prompt_parts.append(
-            f"The text should subtly incorporate examples of: {lesson_focus}."
-        )
-    prompt_parts.append(
-        "After the text, create 3-4 multiple-choice questions about the text to test comprehension."
-    )
-    prompt_parts.append(f"The questions should be in {current_user.native_language}.")
-    prompt_parts.append(
-        "Format the entire output as a single JSON object with 'text' and 'questions' keys. The 'questions' should be an array of objects, each with 'question', 'options' (an array of strings), and 'answer' keys."
+    comprehension_test = await generate_exercise(
+        "comprehension-test", target_language, current_user.native_language, topic, lesson_focus
     )
-
-    prompt = " ".join(prompt_parts)
-    response = generate_llm_response(prompt)
-    return {"comprehension_test": clean_json_response(response)}
+    return {
+        "comprehension_test": await with_exercise_id(
+            "comprehension-test", target_language, comprehension_test
+        )
+    }
 
 
 @router.get("/exercises/flashcards")
-def get_flashcards(
-    target_language: str,
-    current_user: models.User = Depends(get_current_user),
+async def get_flashcards(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
     topic: Optional[str] = None,
     lesson_focus: Optional[str] = None,
 ):
     """
     Genera 5 flashcard (parola e traduzione) relative a un argomento.
     """
-    prompt_parts = [
-        f"Generate 5 flashcards for learning {target_language}.",
-        f"The user's native language is {current_user.native_language}.",
-    ]
-    if topic:
-        prompt_parts.append(f"The flashcards should be related to the topic: {topic}.")
-    if lesson_focus:
-        prompt_parts.append(
-            f"The flashcards should focus on vocabulary related to: {lesson_focus}."
-        )
-    prompt_parts.append(
-        "For each flashcard, provide a word or short phrase in the target language and its translation in the user's native language. Format the output as a JSON array of objects, where each object has 'word_or_phrase' and 'translation' keys."
+    flashcards = await generate_exercise(
+        "flashcards", target_language, current_user.native_language, topic, lesson_focus
     )
-
-    prompt = " ".join(prompt_parts)
-    response = generate_llm_response(prompt)
-    return {"flashcards": clean_json_response(response)}
+    return {"flashcards": flashcards}
 
 
 @router.post("/exercises/submit-flashcard-correction")
-def submit_flashcard_correction(
+async def submit_flashcard_correction(
     request: schemas.FlashcardCorrectionRequest,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Invia la traduzione di una flashcard per la correzione e aggiorna i progressi dell'utente.
     """
-    user_progress = crud.get_or_create_progress(
-        db, user_id=current_user.id, target_language=request.target_language
-    )
-
+    request.target_language = await resolve_target_language(db, request.target_language)
     prompt = f"""A user learning {request.target_language} has provided a translation for a flashcard.
     Original text: '{request.flashcard_text}'
     User's translation: '{request.user_translation}'
@@ -209,28 +588,197 @@ def submit_flashcard_correction(
 
     Format the entire output as a single JSON object with two keys: 'feedback' (a string) and 'evaluation' (the JSON object with the delta)."""
 
-    response = generate_llm_response(prompt)
+    response = await generate_llm_response_async(prompt, json_output=True)
 
     try:
-        response_data = clean_json_response(response)
-        feedback = response_data.get("feedback", "Could not parse feedback.")
-        evaluation = response_data.get("evaluation", {})
-
-        crud.update_progress(
-            db,
-            progress_id=user_progress.id,
-            vocabulary_delta=evaluation.get("vocabulary_delta", 0),
+        response_data = clean_json_response(response, "flashcard-correction")
+    except LLMResponseParseError as e:
+        logger.warning("Error parsing LLM response: %s", e)
+        user_progress = await read_progress(
+            db, user_id=current_user.id, target_language=request.target_language
         )
-
-    except (json.JSONDecodeError, AttributeError) as e:
-        print(f"Error parsing LLM response: {e}")
         return {
             "feedback": "There was an error processing your results, but your submission has been received.",
             "new_progress": user_progress,
         }
 
-    updated_progress = crud.get_or_create_progress(
-        db, user_id=current_user.id, target_language=request.target_language
+    feedback = response_data.get("feedback", "Could not parse feedback.")
+    evaluation = response_data.get("evaluation", {})
+    updated_progress = await apply_progress(
+        db,
+        user_id=current_user.id,
+        target_language=request.target_language,
+        # Come nella correzione in blocco, una flashcard vale al massimo un punto
+        vocabulary_delta=max(-1, min(1, evaluation.get("vocabulary_delta", 0))),
     )
 
     return {"feedback": feedback, "new_progress": updated_progress}
+
+
+@router.post("/exercises/submit-flashcard-corrections")
+async def submit_flashcard_corrections(
+    request: schemas.FlashcardBatchCorrectionRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Valuta con una sola chiamata all'LLM le traduzioni di più flashcard e applica la somma
+    dei vocabulary_delta con un solo UPDATE. Restituisce il feedback di ogni flashcard,
+    nell'ordine ricevuto, e i progressi aggiornati.
+    """
+    request.target_language = await resolve_target_language(db, request.target_language)
+    if not request.cards:
+        raise HTTPException(status_code=400, detail="No flashcards to correct.")
+    if len(request.cards) > FLASHCARD_CORRECTION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many flashcards: at most {FLASHCARD_CORRECTION_BATCH_MAX_ITEMS} per request.",
+        )
+
+    def build_prompt(numbered: str) -> str:
+        return f"""A user learning {request.target_language} has provided translations for the following numbered flashcards.
+{numbered}
+    The user's native language is {current_user.native_language}.
+
+    Please evaluate each translation. For each flashcard provide:
+    1. A feedback message for the user in {current_user.native_language}, explaining if the translation is correct or what could be improved.
+    2. The vocabulary performance change as an integer: 1 for improvement, 0 for no change, or -1 for a step back.
+
+    Format the entire output as a JSON array with one object per flashcard, each with 'index' (the number of the flashcard), 'feedback' (a string) and 'vocabulary_delta' (the integer) keys."""
+
+    evaluations = await evaluate_numbered_items(
+        {
+            i: f"Original text: '{card.flashcard_text}' - User's translation: '{card.user_translation}'"
+            for i, card in enumerate(request.cards)
+        },
+        build_prompt,
+        schemas.FlashcardBatchEvaluation,
+        "flashcard evaluation",
+    )
+    for evaluation in evaluations.values():
+        # Ogni flashcard vale al massimo un punto, in più o in meno
+        evaluation["vocabulary_delta"] = max(-1, min(1, evaluation["vocabulary_delta"]))
+
+    results = []
+    for index, card in enumerate(request.cards):
+        evaluation = evaluations.get(index)
+        results.append(
+            {
+                "flashcard_text": card.flashcard_text,
+                "feedback": evaluation["feedback"] if evaluation else None,
+                "vocabulary_delta": evaluation["vocabulary_delta"] if evaluation else 0,
+                "error": None if evaluation else "Could not evaluate this flashcard.",
+            }
+        )
+
+    new_progress = await apply_progress(
+        db,
+        user_id=current_user.id,
+        target_language=request.target_language,
+        vocabulary_delta=sum(result["vocabulary_delta"] for result in results),
+    )
+    return {"results": results, "new_progress": new_progress}
+
+
+async def grade_free_text_answers(
+    results: List[dict], indexes: List[int], target_language: str, native_language: str
+):
+    """
+    Corregge con una sola chiamata all'LLM le risposte libere indicate, aggiornando i
+    risultati. Le risposte non valutate restano con 'correct' nullo.
+    """
+    def build_prompt(numbered: str) -> str:
+        return f"""A user learning {target_language} answered the following numbered exercise questions in their own words.
+{numbered}
+    The user's native language is {native_language}.
+
+    For each answer, decide whether it has the same meaning as the expected answer, and give a brief feedback message in {native_language}.
+    Format the entire output as a JSON array with one object per answer, each with 'index' (the number of the answer), 'correct' (a boolean) and 'feedback' (a string) keys."""
+
+    evaluations = await evaluate_numbered_items(
+        {
+            i: f"Question: '{results[i]['question']}' - Expected answer: '{results[i]['expected_answer']}' - User's answer: '{results[i]['user_answer']}'"
+            for i in indexes
+        },
+        build_prompt,
+        schemas.FreeTextEvaluation,
+        "free-text evaluation",
+    )
+    for index, evaluation in evaluations.items():
+        result = results[index]
+        result["correct"] = evaluation["correct"]
+        result["feedback"] = evaluation["feedback"]
+        result["graded_by"] = "llm"
+
+
+@router.post("/exercises/grade")
+async def grade_exercise(
+    submission: schemas.AssessmentSubmission,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Corregge le risposte a un esercizio generato in precedenza (indicato da exercise_id)
+    confrontandole con le soluzioni salvate. L'LLM viene usato solo per le risposte libere.
+    Il risultato aggiorna comprehension_level (test di comprensione) o grammar_level
+    ("riempi gli spazi"). Ogni esercizio si può correggere una sola volta per utente.
+    """
+    submission.target_language = await resolve_target_language(db, submission.target_language)
+    if submission.exercise_type not in GRADABLE_EXERCISES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Exercise type '{submission.exercise_type}' cannot be graded. "
+            f"Gradable types: {', '.join(GRADABLE_EXERCISES)}.",
+        )
+    if not submission.exercise_id:
+        raise HTTPException(status_code=400, detail="exercise_id is required.")
+
+    stored = await exercise_store.get(submission.exercise_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Exercise not found.")
+    exercise_type, target_language, exercise = stored
+    if exercise_type != submission.exercise_type:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Exercise {submission.exercise_id} is a '{exercise_type}' exercise.",
+        )
+    # I progressi vanno alla lingua dell'esercizio, non a quella dichiarata dal client
+    if target_language != submission.target_language:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Exercise {submission.exercise_id} is a {target_language} exercise.",
+        )
+    # Registrata prima della correzione: invii concorrenti dello stesso esercizio non
+    # possono aggiornare i progressi due volte
+    if not await mark_exercise_graded(db, current_user.id, submission.exercise_id):
+        raise HTTPException(status_code=409, detail="Exercise already graded.")
+
+    results = grade_answers(exercise_questions(exercise_type, exercise), submission.answers)
+    free_text = [
+        i
+        for i, result in enumerate(results)
+        if result["correct"] is None and result["expected_answer"] is not None
+    ]
+    if free_text:
+        await grade_free_text_answers(
+            results, free_text, submission.target_language, current_user.native_language
+        )
+
+    graded = [result for result in results if result["correct"] is not None]
+    score = sum(1 for result in graded if result["correct"])
+    delta = level_delta(score, len(graded))
+    new_progress = await apply_progress(
+        db,
+        user_id=current_user.id,
+        target_language=submission.target_language,
+        comprehension_delta=delta if exercise_type == "comprehension-test" else 0,
+        grammar_delta=delta if exercise_type == "fill-in-the-blank" else 0,
+    )
+    return {
+        "exercise_id": submission.exercise_id,
+        "score": score,
+        "graded": len(graded),
+        "total": len(results),
+        "results": results,
+        "new_progress": new_progress,
+    }
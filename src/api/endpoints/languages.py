@@ -1,36 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import crud, schemas, models
-from database import SessionLocal
+from database import get_db
+from utils.language_names import display_language_name
+from utils.reference_data import reference_data, snapshot_response
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("/languages", response_model=List[schemas.Language])
-def get_languages(db: Session = Depends(get_db)):
+async def get_languages(request: Request, db: AsyncSession = Depends(get_db)):
     """
-    Ritorna una lista di tutte le lingue supportate per l'apprendimento.
+    Ritorna una lista di tutte le lingue supportate per l'apprendimento. La risposta ha un
+    ETag: con If-None-Match uguale si riceve 304 Not Modified.
     """
-    return crud.get_languages(db)
+    return snapshot_response(request, await reference_data.get(db, "languages"))
 
 
 @router.post("/add-language", response_model=schemas.Language)
-def add_language(language: schemas.LanguageBase, db: Session = Depends(get_db)):
+async def add_language(language: schemas.LanguageBase, db: AsyncSession = Depends(get_db)):
     """
     Aggiunge una nuova lingua alla lista delle lingue supportate.
     """
-    db_language = (
-        db.query(models.Language).filter(models.Language.name == language.name.capitalize()).first()
-    )
+    if not language.name.strip():
+        raise HTTPException(status_code=400, detail="Invalid language name")
+    db_language = await crud.get_language_by_name(db, language.name)
     if db_language:
         raise HTTPException(status_code=400, detail="Language already in list")
-    return crud.create_language(db=db, name=language.name.capitalize())
+    return await crud.create_language(db=db, name=display_language_name(language.name))
@@ -1,33 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import crud, schemas, models
-from database import SessionLocal
+from database import get_db
+from utils.reference_data import reference_data, snapshot_response
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("/topics", response_model=List[schemas.Topic], tags=["Learning Content"])
-def get_topics(db: Session = Depends(get_db)):
-    """Ritorna una lista di tutti gli argomenti di lezione supportati per l'apprendimento."""
-    return crud.get_topics(db)
+async def get_topics(request: Request, db: AsyncSession = Depends(get_db)):
+    """Ritorna una lista di tutti gli argomenti di lezione supportati per l'apprendimento (con ETag)."""
+    return snapshot_response(request, await reference_data.get(db, "topics"))
 
 
 @router.post("/topics", response_model=schemas.Topic, tags=["Learning Content"])
-def create_topic(topic: schemas.TopicBase, db: Session = Depends(get_db)):
+async def create_topic(topic: schemas.TopicBase, db: AsyncSession = Depends(get_db)):
     """Aggiunge un nuovo argomento di lezione alla lista degli argomenti di lezione supportati."""
-    db_topic = db.query(models.Topic).filter(models.Topic.name == topic.name).first()
+    db_topic = await crud.get_topic_by_name(db, topic.name)
     if db_topic:
         raise HTTPException(status_code=400, detail="Topic already exists")
-    return crud.create_topic(db=db, name=topic.name)
+    return await crud.create_topic(db=db, name=topic.name)
 
 
 @router.get(
@@ -35,23 +28,19 @@ def create_topic(topic: schemas.TopicBase, db: Session = Depends(get_db)):
     response_model=List[schemas.LessonSubject],
     tags=["Learning Content"],
 )
-def get_lesson_subjects(db: Session = Depends(get_db)):
-    """Ritorna una lista di tutti gli argomenti di lezione supportati per l'apprendimento."""
-    return crud.get_lesson_subjects(db)
+async def get_lesson_subjects(request: Request, db: AsyncSession = Depends(get_db)):
+    """Ritorna una lista di tutti gli argomenti di lezione supportati per l'apprendimento (con ETag)."""
+    return snapshot_response(request, await reference_data.get(db, "lesson_subjects"))
 
 
 @router.post(
     "/lesson-subjects", response_model=schemas.LessonSubject, tags=["Learning Content"]
 )
-def create_lesson_subject(
-    subject: schemas.LessonSubjectBase, db: Session = Depends(get_db)
+async def create_lesson_subject(
+    subject: schemas.LessonSubjectBase, db: AsyncSession = Depends(get_db)
 ):
     """Aggiunge un nuovo argomento di lezione alla lista degli argomenti di lezione supportati."""
-    db_subject = (
-        db.query(models.LessonSubject)
-        .filter(models.LessonSubject.name == subject.name)
-        .first()
-    )
+    db_subject = await crud.get_lesson_subject_by_name(db, subject.name)
     if db_subject:
         raise HTTPException(status_code=400, detail="Lesson subject already exists")
-    return crud.create_lesson_subject(db=db, name=subject.name)
+    return await crud.create_lesson_subject(db=db, name=subject.name)
@@ -1,73 +1,134 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
 import schemas, crud, models
-from database import SessionLocal
-from utils.llm_handler import generate_llm_response, clean_json_response
-from jose import JWTError, jwt
-from fastapi.security import OAuth2PasswordBearer
-import os
+from api.dependencies import get_current_user, get_target_language
+from utils.llm_handler import stream_llm_response
+from utils.content_cache import (
+    generate_cached_json_response,
+    get_cached_content,
+    cache_content,
+)
+from utils.json_parser import LLMResponseParseError, validate_llm_data
+from utils.json_stream import JsonArrayStreamParser
+from utils import metrics
+import json
+import logging
 from typing import List, Optional
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
+def build_phrasebook_prompt(
+    target_language: str, native_language: str, topic: Optional[str] = None
+) -> str:
+    """
+    Costruisce il prompt per il phrasebook.
+    """
+    prompt_parts = [
+        f"Create a set of at least 30 useful sentences for a user who is learning the following language: {target_language}.",
+        f"The user's native language is {native_language}.",
+        f"Every sentence must have its own translation into the language {native_language}.",
+        f"Answer just with the JSON content, without any other text.",
+    ]
+    if topic:
+        prompt_parts.append(f"The topic should be about: {topic}.")
 
+    prompt_parts.append(
+        "Provide a JSON array of objects, where each object has 'sentence' and 'translation' keys"
+    )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    return " ".join(prompt_parts)
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+@router.get("/phrasebook")
+async def phrasebook(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
+    topic: Optional[str] = None,
 ):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+    """
+    Restituisce un elenco di frasi con traduzione per apprendere meglio la lingua.
+    """
+    prompt = build_phrasebook_prompt(target_language, current_user.native_language, topic)
+    phrasebook_entries = await generate_cached_json_response(
+        "phrasebook", prompt, target_language, current_user.native_language, topic
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
-        raise credentials_exception
-    return user
+    return {"phrasebook": phrasebook_entries}
 
 
-@router.get("/phrasebook")
-def phrasebook(
-    target_language: str,
-    current_user: models.User = Depends(get_current_user),
+@router.get("/phrasebook/stream")
+async def phrasebook_stream(
+    target_language: str = Depends(get_target_language),
+    current_user: schemas.User = Depends(get_current_user),
     topic: Optional[str] = None,
 ):
     """
-    Restituisce un elenco di frasi con traduzione per apprendere meglio la lingua.
+    Come /phrasebook, ma restituisce le frasi in formato NDJSON (un oggetto
+    {sentence, translation} per riga) man mano che il modello le genera. Se la risposta
+    viene troncata dal limite di token si ricevono comunque tutte le frasi complete.
+    Se il modello non risponde prima della prima frase si riceve un 502; se si
+    interrompe dopo, l'ultima riga è un oggetto {"error": ...}.
     """
-    prompt_parts = [
-        f"Create a set of at least 30 useful sentences for a user who is learning the following language: {target_language}.",
-        f"The user's native language is {current_user.native_language}.",
-        f"Every sentence must have its own translation into the language {current_user.native_language}.",
-        f"Answer just with the JSON content, without any other text.",
-    ]
-    if topic:
-        prompt_parts.append(f"The topic should be about: {topic}.")
+    native_language = current_user.native_language
+    cached = get_cached_content("phrasebook", target_language, native_language, topic)
+    if cached is not None:
+        return StreamingResponse(
+            (json.dumps(entry, ensure_ascii=False) + "\n" for entry in cached),
+            media_type="application/x-ndjson",
+        )
 
-    prompt_parts.append(
-        "Provide a JSON array of objects, where each object has 'sentence' and 'translation' keys"
-    )
+    prompt = build_phrasebook_prompt(target_language, native_language, topic)
+
+    async def generate_entries():
+        parser = JsonArrayStreamParser()
+        entries = []
+        size = 0
+        async for chunk in stream_llm_response(prompt, json_output=True):
+            size += len(chunk.encode("utf-8"))
+            skipped = parser.skipped
+            items = parser.feed(chunk)
+            # Oggetti non decodificabili scartati dal parser
+            if parser.skipped > skipped:
+                metrics.observe_parse_failure(parser.skipped - skipped)
+            for item in items:
+                # Stesso schema di /phrasebook, che legge la stessa voce della cache
+                try:
+                    entry = validate_llm_data(item, schemas.PhrasebookEntry)
+                except LLMResponseParseError as e:
+                    logger.warning("Skipping invalid phrasebook entry: %s", e)
+                    metrics.observe_parse_failure()
+                    continue
+                entries.append(entry)
+                yield entry
+        # Solo un array completo finisce in cache, una risposta troncata no
+        if entries and not parser.truncated:
+            cache_content("phrasebook", entries, size, target_language, native_language, topic)
+
+    entries = generate_entries()
+    # La prima frase si attende prima di rispondere: fino a lì un errore è ancora un 502
+    try:
+        first_entry = await entries.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="The LLM returned no valid phrasebook entries.",
+        )
+    except Exception as e:
+        logger.error("Error streaming phrasebook from Gemini API: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"An error occurred while communicating with the LLM: {e}",
+        )
+
+    async def ndjson_stream():
+        yield json.dumps(first_entry, ensure_ascii=False) + "\n"
+        try:
+            async for entry in entries:
+                yield json.dumps(entry, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error("Error streaming phrasebook from Gemini API: %s", e)
+            yield json.dumps({"error": "The LLM response was interrupted."}) + "\n"
 
-    prompt = " ".join(prompt_parts)
-    response = generate_llm_response(prompt)
-    return {"phrasebook": clean_json_response(response)}
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
@@ -1,135 +1,551 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import models, schemas
-from passlib.context import CryptContext
+from database import upsert_insert
+from utils.language_names import normalize_language_name
+from utils.reference_data import reference_data
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-
-def get_user_by_username(db: Session, username: str):
+async def get_user_by_username(db: AsyncSession, username: str):
     """
     Recupera un utente dal database tramite il suo nome utente.
     """
-    return db.query(models.User).filter(models.User.username == username).first()
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
 
 
-def create_user(db: Session, user: schemas.UserCreate):
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str):
     """
-    Crea un nuovo utente nel database.
+    Crea un nuovo utente nel database. L'hash della password va calcolato prima con
+    utils.passwords.hash_password.
     """
-    hashed_password = pwd_context.hash(user.password)
     db_user = models.User(
         username=user.username,
         hashed_password=hashed_password,
         native_language=user.native_language,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def get_or_create_progress(db: Session, user_id: int, target_language: str):
+async def update_user_password_hash(db: AsyncSession, user_id: int, hashed_password: str):
+    """
+    Sostituisce l'hash della password di un utente (es. dopo un cambio del costo bcrypt).
+    """
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(hashed_password=hashed_password)
+    )
+    await db.commit()
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    """
+    Recupera un utente dal database tramite il suo id.
+    """
+    return await db.get(models.User, user_id)
+
+
+async def create_refresh_token(
+    db: AsyncSession, token_id: str, token_hash: str, user_id: int, expires_at: datetime
+):
     """
-    Crea o recupera il progresso di un utente per una specifica lingua target.
+    Salva un nuovo refresh token (solo l'hash del segreto).
     """
-    progress = (
-        db.query(models.UserProgress)
-        .filter_by(user_id=user_id, target_language=target_language)
-        .first()
+    db_token = models.RefreshToken(
+        id=token_id, token_hash=token_hash, user_id=user_id, expires_at=expires_at
     )
-    if not progress:
-        progress = models.UserProgress(user_id=user_id, target_language=target_language)
-        db.add(progress)
-        db.commit()
-        db.refresh(progress)
-    return progress
+    db.add(db_token)
+    await db.commit()
+    return db_token
+
 
+async def get_refresh_token(db: AsyncSession, token_id: str):
+    """
+    Recupera un refresh token tramite il suo id.
+    """
+    return await db.get(models.RefreshToken, token_id)
 
-def update_progress(
-    db: Session,
-    progress_id: int,
+
+async def consume_refresh_token(db: AsyncSession, token_id: str, now: datetime) -> bool:
+    """
+    Revoca un refresh token solo se è ancora valido, con un unico UPDATE condizionale:
+    tra richieste concorrenti con lo stesso token solo una ottiene True.
+    """
+    result = await db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.id == token_id,
+            models.RefreshToken.revoked == False,
+            models.RefreshToken.expires_at > now,
+        )
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def revoke_refresh_token(db: AsyncSession, token_id: str):
+    """
+    Revoca un refresh token.
+    """
+    await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.id == token_id)
+        .values(revoked=True)
+    )
+    await db.commit()
+
+
+async def delete_expired_refresh_tokens(db: AsyncSession, now: datetime, batch_size: int = 1000) -> int:
+    """
+    Elimina i refresh token scaduti o revocati a blocchi di batch_size righe, con un
+    commit per blocco per non tenere a lungo il lock di scrittura.
+
+    Returns:
+        Il numero di righe eliminate.
+    """
+    deleted = 0
+    while True:
+        expired_ids = (
+            select(models.RefreshToken.id)
+            .where(
+                (models.RefreshToken.expires_at < now)
+                | (models.RefreshToken.revoked == True)
+            )
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            delete(models.RefreshToken)
+            .where(models.RefreshToken.id.in_(expired_ids))
+            .execution_options(synchronize_session=False)
+        )
+        count = result.rowcount
+        await db.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def _progress_deltas(comprehension_delta: int, vocabulary_delta: int, grammar_delta: int) -> dict:
+    # Nuovi valori calcolati dal database a partire da quelli della riga
+    progress = models.UserProgress
+    comprehension = progress.comprehension_level + comprehension_delta
+    vocabulary = progress.vocabulary_level + vocabulary_delta
+    grammar = progress.grammar_level + grammar_delta
+    return {
+        "comprehension_level": comprehension,
+        "vocabulary_level": vocabulary,
+        "grammar_level": grammar,
+        "overall_progress": (comprehension + vocabulary + grammar) / 3.0,
+    }
+
+
+_PROGRESS_RETURNING = (
+    models.UserProgress.id,
+    models.UserProgress.user_id,
+    models.UserProgress.target_language,
+    models.UserProgress.comprehension_level,
+    models.UserProgress.vocabulary_level,
+    models.UserProgress.grammar_level,
+    models.UserProgress.overall_progress,
+)
+
+
+def _progress_upsert(
+    user_id: int,
+    target_language: str,
+    comprehension_delta: int,
+    vocabulary_delta: int,
+    grammar_delta: int,
+):
+    # INSERT ... ON CONFLICT DO UPDATE: la riga viene creata se manca, altrimenti i nuovi
+    # valori sono calcolati dal database a partire da quelli correnti
+    comprehension = 1 + comprehension_delta
+    vocabulary = 1 + vocabulary_delta
+    grammar = 1 + grammar_delta
+    return (
+        upsert_insert(models.UserProgress)
+        .values(
+            user_id=user_id,
+            target_language=target_language,
+            comprehension_level=comprehension,
+            vocabulary_level=vocabulary,
+            grammar_level=grammar,
+            overall_progress=(comprehension + vocabulary + grammar) / 3.0,
+        )
+        .on_conflict_do_update(
+            index_elements=["user_id", "target_language"],
+            set_=_progress_deltas(comprehension_delta, vocabulary_delta, grammar_delta),
+        )
+    )
+
+
+async def get_progress(db: AsyncSession, user_id: int, target_language: str):
+    """
+    Legge il progresso di un utente per una lingua, senza crearlo.
+
+    Returns:
+        La riga del progresso, oppure None se non esiste.
+    """
+    result = await db.execute(
+        select(*_PROGRESS_RETURNING).where(
+            models.UserProgress.user_id == user_id,
+            models.UserProgress.target_language == target_language,
+        )
+    )
+    return result.first()
+
+
+async def increment_progress(
+    db: AsyncSession,
+    user_id: int,
+    target_language: str,
     comprehension_delta: int = 0,
     vocabulary_delta: int = 0,
     grammar_delta: int = 0,
 ):
     """
-    Aggiorna il progresso di un utente per una specifica lingua target prendendo in considerazione i valori di comprensione del testo, vocabolario e grammatica.
+    Somma i delta ai livelli dell'utente per la lingua con un solo INSERT ... ON CONFLICT
+    DO UPDATE ... RETURNING: la riga viene creata se manca, altrimenti i nuovi valori sono
+    calcolati dal database, quindi aggiornamenti concorrenti non si sovrascrivono.
+
+    Returns:
+        La riga aggiornata.
     """
-    progress = db.query(models.UserProgress).filter_by(id=progress_id).first()
-    if progress:
-        progress.comprehension_level += comprehension_delta
-        progress.vocabulary_level += vocabulary_delta
-        progress.grammar_level += grammar_delta
-        progress.overall_progress = (
-            progress.comprehension_level
-            + progress.vocabulary_level
-            + progress.grammar_level
-        ) / 3.0
-        db.commit()
-        db.refresh(progress)
-    return progress
+    stmt = _progress_upsert(
+        user_id, target_language, comprehension_delta, vocabulary_delta, grammar_delta
+    ).returning(*_PROGRESS_RETURNING)
+    row = (await db.execute(stmt)).first()
+    await db.commit()
+    return row
 
 
-def get_languages(db: Session):
+async def increment_progress_many(db: AsyncSession, deltas: dict):
     """
-    Recupera tutte le lingue dal database.
+    Applica in un'unica transazione i delta accumulati per più coppie utente/lingua.
+
+    Args:
+        deltas: Dizionario (user_id, target_language) -> (comprehension_delta,
+            vocabulary_delta, grammar_delta).
     """
-    return db.query(models.Language).order_by(models.Language.name).all()
+    for (user_id, target_language), (comprehension, vocabulary, grammar) in deltas.items():
+        await db.execute(_progress_upsert(user_id, target_language, comprehension, vocabulary, grammar))
+    await db.commit()
 
 
-def get_language_by_name(db: Session, name: str):
+async def get_languages(db: AsyncSession):
     """
-    Recupera una lingua dal database tramite il nome.
+    Recupera tutte le lingue, dalla copia in memoria di utils.reference_data.
     """
-    return (
-        db.query(models.Language)
-        .filter(models.Language.name == name.capitalize())
-        .first()
-    )
+    return (await reference_data.get(db, "languages")).rows
+
+
+async def get_language_by_name(db: AsyncSession, name: str):
+    """
+    Recupera una lingua tramite il nome, senza distinguere maiuscole e spazi, oppure
+    tramite un alias (codice ISO 639, nome nella lingua stessa), dalla copia in memoria.
+    """
+    snapshot = await reference_data.get(db, "languages")
+    return snapshot.by_key.get(normalize_language_name(name))
 
 
-def create_language(db: Session, name: str):
+async def create_language(db: AsyncSession, name: str):
     """
     Aggiunge una nuova lingua al database.
     """
-    db_language = models.Language(name=name)
+    db_language = models.Language(name=name, normalized_name=normalize_language_name(name))
     db.add(db_language)
-    db.commit()
-    db.refresh(db_language)
+    await db.commit()
+    await db.refresh(db_language)
+    reference_data.invalidate("languages")
     return db_language
 
 
-def get_topics(db: Session):
+async def get_topics(db: AsyncSession):
+    """
+    Recupera tutti i topics, dalla copia in memoria.
+    """
+    return (await reference_data.get(db, "topics")).rows
+
+
+async def get_topic_by_name(db: AsyncSession, name: str):
     """
-    Recupera tutti i topics dal database.
+    Recupera un topic tramite il nome, dalla copia in memoria.
     """
-    return db.query(models.Topic).all()
+    return (await reference_data.get(db, "topics")).by_name.get(name)
 
 
-def create_topic(db: Session, name: str):
+async def create_topic(db: AsyncSession, name: str):
     """
     Aggiunge un nuovo topic al database.
     """
     db_topic = models.Topic(name=name)
     db.add(db_topic)
-    db.commit()
-    db.refresh(db_topic)
+    await db.commit()
+    await db.refresh(db_topic)
+    reference_data.invalidate("topics")
     return db_topic
 
 
-def get_lesson_subjects(db: Session):
+async def get_lesson_subjects(db: AsyncSession):
+    """
+    Recupera tutte gli argomenti di lezione, dalla copia in memoria.
+    """
+    return (await reference_data.get(db, "lesson_subjects")).rows
+
+
+async def get_lesson_subject_by_name(db: AsyncSession, name: str):
     """
-    Recupera tutte gli argomenti di lezione dal database.
+    Recupera un argomento di lezione tramite il nome, dalla copia in memoria.
     """
-    return db.query(models.LessonSubject).all()
+    return (await reference_data.get(db, "lesson_subjects")).by_name.get(name)
 
 
-def create_lesson_subject(db: Session, name: str):
+async def create_lesson_subject(db: AsyncSession, name: str):
     """
     Aggiunge un nuovo argomento di lezione al database.
     """
     db_lesson_subject = models.LessonSubject(name=name)
     db.add(db_lesson_subject)
-    db.commit()
-    db.refresh(db_lesson_subject)
+    await db.commit()
+    await db.refresh(db_lesson_subject)
+    reference_data.invalidate("lesson_subjects")
     return db_lesson_subject
+
+
+async def create_chat_session(
+    db: AsyncSession, session_id: str, user_id: int, language: str, mode: str, now: datetime
+):
+    """
+    Crea una nuova sessione di chat di proprietà dell'utente.
+    """
+    db_session = models.ChatSession(
+        id=session_id, user_id=user_id, language=language, mode=mode, last_activity_at=now
+    )
+    db.add(db_session)
+    await db.commit()
+    await db.refresh(db_session)
+    return db_session
+
+
+async def get_chat_session(db: AsyncSession, session_id: str):
+    """
+    Recupera una sessione di chat tramite il suo id.
+    """
+    return await db.get(models.ChatSession, session_id)
+
+
+async def delete_expired_chat_sessions(
+    db: AsyncSession, inactive_since: datetime, batch_size: int = 1000
+) -> int:
+    """
+    Elimina, con i loro messaggi, le sessioni di chat senza attività da inactive_since, a
+    blocchi di batch_size sessioni con un commit per blocco.
+
+    Returns:
+        Il numero di sessioni eliminate.
+    """
+    deleted = 0
+    while True:
+        expired_ids = (
+            await db.execute(
+                select(models.ChatSession.id)
+                .where(models.ChatSession.last_activity_at < inactive_since)
+                .limit(batch_size)
+            )
+        ).scalars().all()
+        if expired_ids:
+            await db.execute(
+                delete(models.ChatSessionMessage)
+                .where(models.ChatSessionMessage.session_id.in_(expired_ids))
+                .execution_options(synchronize_session=False)
+            )
+            await db.execute(
+                delete(models.ChatSession)
+                .where(models.ChatSession.id.in_(expired_ids))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        deleted += len(expired_ids)
+        if len(expired_ids) < batch_size:
+            return deleted
+
+
+async def add_chat_message(
+    db: AsyncSession, session_id: str, role: str, content: str, token_count: int
+):
+    """
+    Aggiunge un messaggio alla cronologia di una sessione di chat.
+    """
+    db_message = models.ChatSessionMessage(
+        session_id=session_id, role=role, content=content, token_count=token_count
+    )
+    db.add(db_message)
+    await db.commit()
+    return db_message
+
+
+async def delete_chat_message(db: AsyncSession, message_id: int):
+    """
+    Elimina un messaggio dalla cronologia (es. il turno dell'utente rimasto senza risposta).
+    """
+    await db.execute(
+        delete(models.ChatSessionMessage)
+        .where(models.ChatSessionMessage.id == message_id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def get_chat_messages(db: AsyncSession, session_id: str):
+    """
+    Recupera l'intera cronologia di una sessione di chat, dal messaggio più vecchio.
+    """
+    result = await db.execute(
+        select(models.ChatSessionMessage)
+        .where(models.ChatSessionMessage.session_id == session_id)
+        .order_by(models.ChatSessionMessage.id)
+    )
+    return result.scalars().all()
+
+
+async def get_chat_history_window(
+    db: AsyncSession, session_id: str, token_budget: int, max_messages: int = 200
+):
+    """
+    Recupera i messaggi più recenti di una sessione che rientrano nel budget di token,
+    dal più vecchio al più recente. Il messaggio più recente è sempre incluso.
+    """
+    result = await db.execute(
+        select(models.ChatSessionMessage)
+        .where(models.ChatSessionMessage.session_id == session_id)
+        .order_by(models.ChatSessionMessage.id.desc())
+        .limit(max_messages)
+    )
+    recent_messages = result.scalars().all()
+    window = []
+    used_tokens = 0
+    for message in recent_messages:
+        if window and used_tokens + message.token_count > token_budget:
+            break
+        window.append(message)
+        used_tokens += message.token_count
+    window.reverse()
+    return window
+
+
+async def get_chat_messages_between(
+    db: AsyncSession, session_id: str, after_id: int, before_id: int
+):
+    """
+    Recupera i messaggi di una sessione con id compreso tra after_id e before_id (esclusi).
+    """
+    result = await db.execute(
+        select(models.ChatSessionMessage)
+        .where(
+            models.ChatSessionMessage.session_id == session_id,
+            models.ChatSessionMessage.id > after_id,
+            models.ChatSessionMessage.id < before_id,
+        )
+        .order_by(models.ChatSessionMessage.id)
+    )
+    return result.scalars().all()
+
+
+async def count_chat_tokens_between(db: AsyncSession, session_id: str, after_id: int, before_id: int) -> int:
+    """
+    Somma i token stimati dei messaggi di una sessione con id tra after_id e before_id (esclusi).
+    """
+    result = await db.execute(
+        select(func.coalesce(func.sum(models.ChatSessionMessage.token_count), 0)).where(
+            models.ChatSessionMessage.session_id == session_id,
+            models.ChatSessionMessage.id > after_id,
+            models.ChatSessionMessage.id < before_id,
+        )
+    )
+    return result.scalar()
+
+
+async def update_chat_session_summary(
+    db: AsyncSession, session: models.ChatSession, summary: str, summary_until_id: int
+):
+    """
+    Aggiorna il riassunto dei turni più vecchi di una sessione di chat.
+    """
+    session.summary = summary
+    session.summary_until_id = summary_until_id
+    await db.commit()
+    return session
+
+
+async def save_generated_exercise(
+    db: AsyncSession, exercise_id: str, exercise_type: str, target_language: str, content: str
+):
+    """
+    Salva un esercizio generato, se non è già presente (l'id dipende dal contenuto).
+    """
+    stmt = (
+        upsert_insert(models.GeneratedExercise)
+        .values(
+            id=exercise_id,
+            exercise_type=exercise_type,
+            target_language=target_language,
+            content=content,
+        )
+        .on_conflict_do_nothing(index_elements=["id"])
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+async def get_generated_exercise(db: AsyncSession, exercise_id: str):
+    """
+    Recupera un esercizio generato tramite il suo id.
+    """
+    return await db.get(models.GeneratedExercise, exercise_id)
+
+
+async def mark_exercise_graded(db: AsyncSession, user_id: int, exercise_id: str) -> bool:
+    """
+    Registra la correzione di un esercizio per un utente con INSERT ... ON CONFLICT DO
+    NOTHING.
+
+    Returns:
+        True se è la prima correzione, False se l'esercizio era già stato corretto.
+    """
+    result = await db.execute(
+        upsert_insert(models.GradedExercise)
+        .values(user_id=user_id, exercise_id=exercise_id)
+        .on_conflict_do_nothing(index_elements=["user_id", "exercise_id"])
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def mark_exercises_graded(db: AsyncSession, keys: list) -> set:
+    """
+    Registra in un'unica transazione le correzioni di più esercizi, con un solo INSERT
+    ... ON CONFLICT DO NOTHING RETURNING.
+
+    Args:
+        keys: Lista di coppie (user_id, exercise_id) distinte.
+
+    Returns:
+        L'insieme delle coppie corrette per la prima volta.
+    """
+    result = await db.execute(
+        upsert_insert(models.GradedExercise)
+        .values([{"user_id": user_id, "exercise_id": exercise_id} for user_id, exercise_id in keys])
+        .on_conflict_do_nothing(index_elements=["user_id", "exercise_id"])
+        .returning(models.GradedExercise.user_id, models.GradedExercise.exercise_id)
+    )
+    inserted = {tuple(row) for row in result.all()}
+    await db.commit()
+    return inserted
@@ -1,97 +1,316 @@
-from sqlalchemy import create_engine
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///../data/BabilonIA.db"
+from utils.language_names import INITIAL_LANGUAGE_ALIASES, normalize_language_name
+
+load_dotenv()
+
+# data/BabilonIA.db nella radice del progetto, qualunque sia la directory di lavoro
+DEFAULT_DATABASE_PATH = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "BabilonIA.db")
+)
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DEFAULT_DATABASE_PATH}")
+
+# Dimensionamento del pool di connessioni (per worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Secondi dopo cui una connessione viene riaperta (-1: mai)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+# Impostazioni applicate ad ogni nuova connessione SQLite. Con WAL le letture non
+# bloccano le scritture (e viceversa) e synchronous=NORMAL evita un fsync per commit;
+# busy_timeout fa attendere una scrittura concorrente invece di fallire subito.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Valori negativi indicano KiB: -65536 sono 64 MiB di cache per connessione
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+# INSERT con ON CONFLICT per il database in uso
+upsert_insert = sqlite_insert if IS_SQLITE else postgresql_insert
+
+engine_options = {}
+if IS_SQLITE:
+    engine_options["connect_args"] = {"check_same_thread": False}
+if ":memory:" not in DATABASE_URL:
+    engine_options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+# Driver asincroni usati dagli endpoint; il motore sincrono serve solo a init_db
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+_scheme, _, _rest = DATABASE_URL.partition("://")
+ASYNC_DATABASE_URL = f"{ASYNC_DRIVERS.get(_scheme, _scheme)}://{_rest}"
+
+engine = create_engine(DATABASE_URL, **engine_options)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+# expire_on_commit=False: gli oggetti restano leggibili dopo il commit senza nuove query
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_db():
+    """
+    Dipendenza FastAPI che fornisce una sessione asincrona, chiusa a fine richiesta.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+# Versione di tabelle, migrazioni e dati iniziali: va incrementata quando cambiano, così
+# i database già aggiornati saltano init_db con una sola query
+SCHEMA_VERSION = 4
+# Chiave dell'advisory lock PostgreSQL che serializza init_db tra i worker
+SCHEMA_LOCK_KEY = 0x42AB1104
+
+INITIAL_LANGUAGES = [
+    "Albanian",
+    "Arabic",
+    "English",
+    "Spanish",
+    "French",
+    "German",
+    "Italian",
+    "Portuguese",
+    "Dutch",
+    "Russian",
+    "Mandarin Chinese",
+    "Japanese",
+    "Korean",
+]
+
+INITIAL_TOPICS = [
+    "Saluti e Presentazioni",
+    "Viaggi e Trasporti",
+    "Al Ristorante e Cibo",
+    "Shopping e Negozi",
+    "Lavoro e Professioni",
+    "Famiglia e Amici",
+    "Tempo Libero e Hobby",
+    "Salute e Benessere",
+    "Meteo e Stagioni",
+    "In Città e Indicazioni Stradali",
+    "Cultura e Tradizioni",
+    "Emergenze",
+    "Sentimenti ed Emozioni",
+    "Sport",
+    "Tecnologia",
+    "Natura e Ambiente",
+    "Istruzione",
+    "Casa e Vita Quotidiana",
+]
+
+INITIAL_LESSON_SUBJECTS = [
+    "Articoli (Determinativi e Indeterminativi)",
+    "Sostantivi (Genere e Numero)",
+    "Aggettivi (Accordo e Posizione)",
+    "Pronomi (Personali, Possessivi, Dimostrativi)",
+    "Verbi: Presente Indicativo",
+    "Verbi: Passato Prossimo",
+    "Verbi: Imperfetto",
+    "Verbi: Futuro Semplice",
+    "Preposizioni (Semplici e Articolate)",
+    "Congiunzioni",
+    "Avverbi",
+    "Sintassi della Frase Semplice",
+    "Formazione delle Domande",
+    "Comparativi e Superlativi",
+    "Il Congiuntivo (Uso Base)",
+    "Il Condizionale (Uso Base)",
+    "Discorso Diretto e Indiretto",
+    "Verbi Modali",
+    "Lessico Tematico (es. Colori, Numeri, Giorni della Settimana)",
+    "Espressioni Idiomatiche Comuni",
+]
+
+
+def get_schema_version() -> int:
+    """
+    Restituisce la versione registrata nel database, 0 se il database è vuoto o precedente
+    all'introduzione della tabella schema_version.
+    """
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar() or 0
+    except DBAPIError:
+        return 0
+
+
+def _read_schema_version(conn) -> int:
+    # Dentro la transazione di init_db: su PostgreSQL una query fallita la annullerebbe
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar() or 0
+
+
+def _lock_schema(conn):
+    """
+    Apre la transazione di init_db prendendo subito il lock che la serializza rispetto
+    agli altri worker: su SQLite il lock di scrittura del database, su PostgreSQL un
+    advisory lock rilasciato a fine transazione.
+    """
+    if IS_SQLITE:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+
 def init_db():
     """
     Inizializza il database creando le tabelle e popolando i dati iniziali se non presenti.
+    Se il database è già alla versione SCHEMA_VERSION non viene fatto nulla.
     """
     import models
-    import crud
 
-    models.Base.metadata.create_all(bind=engine)
+    if get_schema_version() >= SCHEMA_VERSION:
+        return
 
-    db = SessionLocal()
-    try:
-        # Lingue iniziali
-        initial_languages = [
-            "Albanian",
-            "Arabic",
-            "English",
-            "Spanish",
-            "French",
-            "German",
-            "Italian",
-            "Portuguese",
-            "Dutch",
-            "Russian",
-            "Mandarin Chinese",
-            "Japanese",
-            "Korean",
-        ]
-        for lang_name in initial_languages:
-            if not db.query(models.Language).filter_by(name=lang_name).first():
-                crud.create_language(db, lang_name)
-
-        # Topics iniziali
-        initial_topics = [
-            "Saluti e Presentazioni",
-            "Viaggi e Trasporti",
-            "Al Ristorante e Cibo",
-            "Shopping e Negozi",
-            "Lavoro e Professioni",
-            "Famiglia e Amici",
-            "Tempo Libero e Hobby",
-            "Salute e Benessere",
-            "Meteo e Stagioni",
-            "In Città e Indicazioni Stradali",
-            "Cultura e Tradizioni",
-            "Emergenze",
-            "Sentimenti ed Emozioni",
-            "Sport",
-            "Tecnologia",
-            "Natura e Ambiente",
-            "Istruzione",
-            "Casa e Vita Quotidiana",
-        ]
-        for topic_name in initial_topics:
-            if not db.query(models.Topic).filter_by(name=topic_name).first():
-                crud.create_topic(db, topic_name)
-
-        # Argomenti di lezione iniziali
-        initial_lesson_subjects = [
-            "Articoli (Determinativi e Indeterminativi)",
-            "Sostantivi (Genere e Numero)",
-            "Aggettivi (Accordo e Posizione)",
-            "Pronomi (Personali, Possessivi, Dimostrativi)",
-            "Verbi: Presente Indicativo",
-            "Verbi: Passato Prossimo",
-            "Verbi: Imperfetto",
-            "Verbi: Futuro Semplice",
-            "Preposizioni (Semplici e Articolate)",
-            "Congiunzioni",
-            "Avverbi",
-            "Sintassi della Frase Semplice",
-            "Formazione delle Domande",
-            "Comparativi e Superlativi",
-            "Il Congiuntivo (Uso Base)",
-            "Il Condizionale (Uso Base)",
-            "Discorso Diretto e Indiretto",
-            "Verbi Modali",
-            "Lessico Tematico (es. Colori, Numeri, Giorni della Settimana)",
-            "Espressioni Idiomatiche Comuni",
+    # I worker avviati insieme arrivano qui in parallelo: tabelle, migrazioni e dati
+    # iniziali vanno in un'unica transazione che prende subito il lock, e la versione
+    # viene riletta dopo averlo ottenuto. Chi attende trova il database già aggiornato.
+    with engine.connect() as conn:
+        _lock_schema(conn)
+        if _read_schema_version(conn) >= SCHEMA_VERSION:
+            return
+
+        models.Base.metadata.create_all(bind=conn)
+        _add_progress_unique_index(conn, models)
+        _add_language_normalized_name(conn, models)
+        _add_chat_session_owner(conn, models)
+
+        # Per ogni tabella una lettura dei nomi presenti e un solo INSERT per quelli mancanti
+        languages = models.Language.__table__
+        existing = set(conn.execute(select(languages.c.normalized_name)).scalars())
+        missing = [
+            {"name": name, "normalized_name": normalize_language_name(name)}
+            for name in INITIAL_LANGUAGES
+            if normalize_language_name(name) not in existing
         ]
-        for subject_name in initial_lesson_subjects:
-            if not db.query(models.LessonSubject).filter_by(name=subject_name).first():
-                crud.create_lesson_subject(db, subject_name)
+        if missing:
+            conn.execute(upsert_insert(languages).on_conflict_do_nothing(), missing)
+
+        for model, names in (
+            (models.Topic, INITIAL_TOPICS),
+            (models.LessonSubject, INITIAL_LESSON_SUBJECTS),
+        ):
+            table = model.__table__
+            existing = set(conn.execute(select(table.c.name)).scalars())
+            missing = [{"name": name} for name in names if name not in existing]
+            if missing:
+                conn.execute(upsert_insert(table).on_conflict_do_nothing(), missing)
 
-    finally:
-        db.close()
+        # Alias delle lingue iniziali; quelli uguali al nome della lingua non servono
+        language_ids = dict(conn.execute(select(languages.c.normalized_name, languages.c.id)).all())
+        aliases = models.LanguageAlias.__table__
+        existing = set(conn.execute(select(aliases.c.alias)).scalars())
+        missing = {}
+        for name, names in INITIAL_LANGUAGE_ALIASES.items():
+            language_id = language_ids.get(normalize_language_name(name))
+            for alias in map(normalize_language_name, names):
+                if language_id and alias not in existing and alias not in language_ids:
+                    missing[alias] = {"alias": alias, "language_id": language_id}
+        if missing:
+            conn.execute(upsert_insert(aliases).on_conflict_do_nothing(), list(missing.values()))
+
+        conn.execute(
+            upsert_insert(models.SchemaVersion.__table__)
+            .values(id=1, version=SCHEMA_VERSION)
+            .on_conflict_do_update(index_elements=["id"], set_={"version": SCHEMA_VERSION})
+        )
+        conn.commit()
+
+
+def _add_progress_unique_index(conn, models):
+    """
+    Aggiunge l'indice unico (user_id, target_language) ai database creati prima della sua
+    introduzione. Gli eventuali duplicati vengono eliminati tenendo la riga con id minore,
+    cioè quella che le vecchie letture dei progressi restituivano.
+    """
+    index_names = {index["name"] for index in inspect(conn).get_indexes("progress")}
+    if "ix_progress_user_language" in index_names:
+        return
+    conn.execute(
+        text(
+            "DELETE FROM progress WHERE id NOT IN "
+            "(SELECT MIN(id) FROM progress GROUP BY user_id, target_language)"
+        )
+    )
+    for index in models.UserProgress.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+def _add_language_normalized_name(conn, models):
+    """
+    Aggiunge e valorizza la colonna languages.normalized_name nei database creati prima
+    della sua introduzione. Le lingue che differiscono solo per maiuscole o spazi vengono
+    ridotte a una, tenendo quella con id minore. Va eseguita nella transazione di
+    init_db, che tiene il lock: ALTER TABLE non ha una forma IF NOT EXISTS e due worker
+    fuori dal lock la eseguirebbero entrambi.
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("languages")}
+    if "normalized_name" in columns:
+        return
+    conn.execute(text("ALTER TABLE languages ADD COLUMN normalized_name VARCHAR"))
+    seen = set()
+    for language_id, name in conn.execute(text("SELECT id, name FROM languages ORDER BY id")).all():
+        key = normalize_language_name(name)
+        if key in seen:
+            conn.execute(text("DELETE FROM languages WHERE id = :id"), {"id": language_id})
+        else:
+            seen.add(key)
+            conn.execute(
+                text("UPDATE languages SET normalized_name = :key WHERE id = :id"),
+                {"key": key, "id": language_id},
+            )
+    for index in models.Language.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+def _add_chat_session_owner(conn, models):
+    """
+    Aggiunge a chat_sessions le colonne user_id e last_activity_at nei database creati
+    prima della loro introduzione. Le sessioni esistenti non hanno un proprietario e non
+    sarebbero più accessibili: vengono eliminate insieme ai loro messaggi.
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("chat_sessions")}
+    if "user_id" in columns:
+        return
+    conn.execute(text("DELETE FROM chat_session_messages"))
+    conn.execute(text("DELETE FROM chat_sessions"))
+    conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN user_id INTEGER REFERENCES users(id)"))
+    conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN last_activity_at TIMESTAMP"))
+    for index in models.ChatSession.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
@@ -1,16 +1,79 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from api.endpoints import auth, languages, exercises, learning_content, phrasebook, chat
-from database import engine, Base, init_db
+from database import async_engine, init_db
+from utils import exercise_pool, metrics, progress_aggregator
+from utils.passwords import shutdown_password_executor
+from api.dependencies import delete_expired_refresh_tokens
+from api.endpoints.chat import delete_expired_chat_sessions
+from utils.json_parser import LLMResponseParseError
+from utils.llm_handler import LLMUnavailableError
+
+init_db()
+
+# Ogni quanto eliminare i refresh token scaduti o revocati
+REFRESH_TOKEN_CLEANUP_INTERVAL = 3600
+# Ogni quanto eliminare le sessioni di chat inattive
+CHAT_SESSION_CLEANUP_INTERVAL = 3600
+
+
+async def cleanup_refresh_tokens():
+    while True:
+        try:
+            await delete_expired_refresh_tokens()
+        except Exception as e:
+            print(f"Error deleting expired refresh tokens: {e}")
+        await asyncio.sleep(REFRESH_TOKEN_CLEANUP_INTERVAL)
+
+
+async def cleanup_chat_sessions():
+    while True:
+        try:
+            await delete_expired_chat_sessions()
+        except Exception as e:
+            print(f"Error deleting expired chat sessions: {e}")
+        await asyncio.sleep(CHAT_SESSION_CLEANUP_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Avvia il produttore di esercizi pre-generati, se abilitato
+    producer = None
+    if exercise_pool.EXERCISE_POOL_ENABLED:
+        producer = asyncio.create_task(exercise_pool.run_producer())
+    # Avvia la scrittura differita dei progressi, se abilitata
+    progress_writer = None
+    if progress_aggregator.PROGRESS_WRITE_BEHIND_ENABLED:
+        progress_writer = asyncio.create_task(progress_aggregator.progress_aggregator.run())
+    cleanup = asyncio.create_task(cleanup_refresh_tokens())
+    chat_cleanup = asyncio.create_task(cleanup_chat_sessions())
+    yield
+    cleanup.cancel()
+    chat_cleanup.cancel()
+    if producer:
+        producer.cancel()
+    await exercise_pool.exercise_pool.stop()
+    if progress_writer:
+        # I delta ancora in memoria vengono scritti prima di chiudere
+        progress_aggregator.progress_aggregator.stop()
+        await progress_writer
+    shutdown_password_executor()
+    await async_engine.dispose()
 
-Base.metadata.create_all(bind=engine)
-init_db() 
 
 app = FastAPI(
     title="Babilonia API",
     description="API per un'applicazione di apprendimento linguistico tramite LLM.",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(async_engine.sync_engine)
+
 app.include_router(auth.router, prefix="/api", tags=["Authentication"])
 app.include_router(languages.router, prefix="/api", tags=["Languages"])
 app.include_router(exercises.router, prefix="/api", tags=["Exercises"])
@@ -19,6 +82,33 @@ app.include_router(phrasebook.router, prefix="/api", tags=["Phrasebook"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
 
 
+@app.exception_handler(LLMResponseParseError)
+async def llm_response_parse_error_handler(request: Request, exc: LLMResponseParseError):
+    # La risposta del modello non è interpretabile: errore del servizio a monte
+    print(f"Error parsing LLM response: {exc}")
+    return JSONResponse(
+        status_code=502,
+        content={"detail": "Could not parse the response from the language model."},
+    )
+
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_error_handler(request: Request, exc: LLMUnavailableError):
+    # Gemini non ha risposto: errore del servizio a monte, nessun dato viene salvato
+    return JSONResponse(
+        status_code=502,
+        content={"detail": "Could not get a response from the language model."},
+    )
+
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Babilonia!"}
+
+
+if metrics.METRICS_ENABLED:
+
+    # async: la lettura avviene sull'event loop, come gli aggiornamenti delle metriche
+    @app.get("/metrics", include_in_schema=False)
+    async def read_metrics():
+        return Response(content=metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
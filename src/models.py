@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -28,11 +28,26 @@ class UserProgress(Base):
 
     owner = relationship("User", back_populates="progress") # Come sopra
 
+    # Un solo progresso per utente e lingua: serve anche agli upsert di crud
+    __table_args__ = (
+        Index("ix_progress_user_language", "user_id", "target_language", unique=True),
+    )
+
 
 class Language(Base):
     __tablename__ = "languages"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
+    # Chiave di ricerca (utils.language_names.normalize_language_name): niente doppioni
+    # che differiscono solo per maiuscole o spazi
+    normalized_name = Column(String, unique=True, index=True)
+
+
+class LanguageAlias(Base):
+    __tablename__ = "language_aliases"
+    # Alias normalizzato (codice ISO 639, nome nella lingua stessa, ...)
+    alias = Column(String, primary_key=True)
+    language_id = Column(Integer, ForeignKey("languages.id"), index=True)
 
 
 class Topic(Base):
@@ -45,3 +60,66 @@ class LessonSubject(Base):
     __tablename__ = "lesson_subjects"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    # id pubblico del token; del segreto si salva solo l'hash SHA-256
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    token_hash = Column(String)
+    expires_at = Column(DateTime, index=True)
+    revoked = Column(Boolean, default=False)
+
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+    id = Column(String, primary_key=True)
+    # Solo il proprietario può leggere la sessione o aggiungervi messaggi
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    language = Column(String)
+    mode = Column(String)
+    # Creazione o ultimo messaggio dell'utente: le sessioni inattive da più di
+    # CHAT_SESSION_TTL_DAYS vengono eliminate
+    last_activity_at = Column(DateTime, index=True)
+    # Riassunto dei turni usciti dalla finestra di cronologia, fino al messaggio summary_until_id
+    summary = Column(Text, nullable=True)
+    summary_until_id = Column(Integer, default=0)
+
+    messages = relationship("ChatSessionMessage", back_populates="session")
+
+
+class ChatSessionMessage(Base):
+    __tablename__ = "chat_session_messages"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, ForeignKey("chat_sessions.id"), index=True)
+    role = Column(String)
+    content = Column(Text)
+    token_count = Column(Integer)
+
+    session = relationship("ChatSession", back_populates="messages")
+
+
+class GeneratedExercise(Base):
+    __tablename__ = "generated_exercises"
+    # Hash del contenuto: lo stesso esercizio servito più volte (cache, pool) ha sempre lo stesso id
+    id = Column(String, primary_key=True)
+    exercise_type = Column(String)
+    target_language = Column(String)
+    content = Column(Text)  # JSON dell'esercizio, soluzioni comprese
+
+
+class GradedExercise(Base):
+    __tablename__ = "graded_exercises"
+    # Un esercizio salvato si corregge una sola volta per utente: gli id dipendono dal
+    # contenuto e non dall'utente, quindi senza questa riga lo stesso invio ripetuto
+    # aumenterebbe i progressi ogni volta
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    exercise_id = Column(String, ForeignKey("generated_exercises.id"), primary_key=True)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    # Una sola riga (id 1): versione di tabelle e dati iniziali già applicata da init_db
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer)
@@ -22,6 +22,11 @@ class User(UserBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -48,6 +53,7 @@ class AssessmentSubmission(BaseModel):
     exercise_type: str  # ad esempio "comprehension-test", "fill-in-the-blank", ...
     target_language: str
     answers: List[AssessmentAnswer]
+    exercise_id: Optional[str] = None  # restituito insieme all'esercizio generato
 
 
 class FlashcardCorrectionRequest(BaseModel):
@@ -56,6 +62,16 @@ class FlashcardCorrectionRequest(BaseModel):
     target_language: str
 
 
+class FlashcardAnswer(BaseModel):
+    flashcard_text: str
+    user_translation: str
+
+
+class FlashcardBatchCorrectionRequest(BaseModel):
+    target_language: str
+    cards: List[FlashcardAnswer]
+
+
 class LanguageBase(BaseModel):
     name: str
 
@@ -97,6 +113,95 @@ class ChatInteractionRequest(BaseModel):
     mode: str
     messages: List[ChatMessage]
 
+class ChatSessionCreate(BaseModel):
+    language: str
+    mode: str
+
+class ChatSession(ChatSessionCreate):
+    id: str
+
+    class Config:
+        orm_mode = True
+
+class ChatSessionMessageRequest(BaseModel):
+    content: str
+
 class SentenceCorrectionRequest(BaseModel):
     sentence: str
     target_language: str
+
+class SentenceCorrectionBatchRequest(BaseModel):
+    sentences: List[str]
+    target_language: str
+
+
+class ExerciseBundleRequest(BaseModel):
+    target_language: str
+    exercise_types: List[str]  # ad esempio ["flashcards", "fill-in-the-blank"]
+    topic: Optional[str] = None
+    lesson_focus: Optional[str] = None
+
+
+# Schemi delle risposte JSON attese dall'LLM, usati per validare l'output del modello
+
+
+class PracticeSentence(BaseModel):
+    sentence: str
+    translation: str
+
+
+class FillInTheBlankExercise(BaseModel):
+    sentence: str
+    options: List[str]
+    answer: str
+
+
+class ComprehensionQuestion(BaseModel):
+    question: str
+    options: List[str]
+    answer: str
+
+
+class ComprehensionTest(BaseModel):
+    text: str
+    questions: List[ComprehensionQuestion]
+
+
+class Flashcard(BaseModel):
+    word_or_phrase: str
+    translation: str
+
+
+class SentenceCorrection(BaseModel):
+    corrected_sentence: str
+    explanation: str
+
+
+class SentenceCorrectionBatchItem(SentenceCorrection):
+    index: int
+
+
+class FlashcardEvaluation(BaseModel):
+    vocabulary_delta: int = 0
+
+
+class FlashcardCorrectionResult(BaseModel):
+    feedback: str
+    evaluation: FlashcardEvaluation
+
+
+class FlashcardBatchEvaluation(BaseModel):
+    index: int
+    feedback: str
+    vocabulary_delta: int = 0
+
+
+class FreeTextEvaluation(BaseModel):
+    index: int
+    correct: bool
+    feedback: str
+
+
+class PhrasebookEntry(BaseModel):
+    sentence: str
+    translation: str
@@ -0,0 +1,208 @@
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+from utils.llm_handler import generate_llm_response_async, clean_json_response
+
+load_dotenv()
+
+# Cache dei contenuti generati dall'LLM. I prompt degli esercizi dipendono solo da
+# (target_language, native_language, topic, lesson_focus), quindi le combinazioni più
+# richieste possono essere servite senza una nuova chiamata a Gemini.
+
+CONTENT_CACHE_ENABLED = os.getenv("CONTENT_CACHE_ENABLED", "true").lower() == "true"
+CONTENT_CACHE_MAX_BYTES = int(os.getenv("CONTENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Con un valore > 1 ogni chiave conserva fino a K varianti e ne serve una a caso,
+# così gli utenti non ricevono sempre lo stesso esercizio.
+CONTENT_CACHE_VARIANTS = int(os.getenv("CONTENT_CACHE_VARIANTS", "1"))
+
+# TTL in secondi per endpoint, sovrascrivibili con CONTENT_CACHE_TTL_<ENDPOINT>
+# (es. CONTENT_CACHE_TTL_FILL_IN_THE_BLANK=600)
+DEFAULT_TTLS = {
+    "daily-practice": 24 * 3600,
+    "fill-in-the-blank": 3600,
+    "flashcards": 3600,
+    "comprehension-test": 3600,
+    "phrasebook": 7 * 24 * 3600,
+}
+CACHE_TTLS = {
+    endpoint: int(
+        os.getenv(f"CONTENT_CACHE_TTL_{endpoint.upper().replace('-', '_')}", str(ttl))
+    )
+    for endpoint, ttl in DEFAULT_TTLS.items()
+}
+
+
+class CacheBackend(ABC):
+    """
+    Interfaccia minima di un backend di cache. Per usare un backend diverso (es. Redis)
+    basta implementare questi metodi e registrarlo con set_cache_backend.
+    """
+
+    @abstractmethod
+    def get(self, key: tuple, variants: int = 1) -> Optional[Any]:
+        """
+        Restituisce un valore valido per la chiave, oppure None se manca o è scaduto. Con
+        variants > 1 restituisce None finché non sono stati salvati variants valori.
+        """
+
+    @abstractmethod
+    def set(self, key: tuple, value: Any, ttl: int, size: int, variants: int = 1):
+        """
+        Salva un valore per ttl secondi, tenendo al massimo variants valori per chiave;
+        size è la dimensione stimata in byte. Un valore uguale a una variante già salvata
+        non viene aggiunto.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Svuota la cache.
+        """
+
+
+class InMemoryLRUCache(CacheBackend):
+    """
+    Cache in memoria con scadenza per elemento ed eviction LRU quando la dimensione
+    stimata supera max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # chiave -> lista di varianti (scadenza, valore, dimensione)
+        self._entries: "OrderedDict[tuple, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, variants: int = 1) -> Optional[Any]:
+        """
+        Restituisce un valore valido per la chiave, oppure None se manca, è scaduto o se
+        non sono ancora state raccolte abbastanza varianti.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                now = time.monotonic()
+                alive = [variant for variant in entry if variant[0] > now]
+                if len(alive) != len(entry):
+                    self.current_bytes -= sum(v[2] for v in entry) - sum(v[2] for v in alive)
+                    if alive:
+                        self._entries[key] = alive
+                    else:
+                        del self._entries[key]
+                entry = alive
+            if not entry or len(entry) < variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry)[1] if variants > 1 else entry[-1][1]
+
+    def set(self, key: tuple, value: Any, ttl: int, size: int, variants: int = 1):
+        """
+        Salva un valore per la chiave. Oltre `variants` valori, il più vecchio viene scartato.
+        Le richieste accorpate su una stessa chiamata all'LLM salvano lo stesso contenuto:
+        i doppioni non contano come varianti.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._entries.setdefault(key, [])
+            if any(variant[1] == value for variant in entry):
+                return
+            entry.append((time.monotonic() + ttl, value, size))
+            self.current_bytes += size
+            while len(entry) > max(variants, 1):
+                self.current_bytes -= entry.pop(0)[2]
+            self._entries.move_to_end(key)
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= sum(v[2] for v in evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+content_cache: CacheBackend = InMemoryLRUCache(CONTENT_CACHE_MAX_BYTES)
+
+
+def set_cache_backend(backend: CacheBackend):
+    """
+    Sostituisce il backend di cache usato dagli endpoint.
+    """
+    global content_cache
+    content_cache = backend
+
+
+def normalize_key_part(value: Optional[str]) -> str:
+    """
+    Normalizza un input del prompt: minuscolo, senza spazi superflui.
+    """
+    if value is None:
+        return ""
+    return " ".join(value.split()).casefold()
+
+
+def make_cache_key(endpoint: str, *inputs: Optional[str]) -> tuple:
+    """
+    Costruisce la chiave di cache a partire dall'endpoint e dagli input normalizzati del prompt.
+    """
+    return (endpoint,) + tuple(normalize_key_part(value) for value in inputs)
+
+
+def get_cached_content(endpoint: str, *inputs: Optional[str]) -> Optional[Any]:
+    """
+    Restituisce il contenuto in cache per l'endpoint e gli input del prompt, se presente.
+    """
+    if not CONTENT_CACHE_ENABLED or endpoint not in CACHE_TTLS:
+        return None
+    key = make_cache_key(endpoint, *inputs)
+    return content_cache.get(key, variants=CONTENT_CACHE_VARIANTS)
+
+
+def cache_content(endpoint: str, data: Any, size: int, *inputs: Optional[str]):
+    """
+    Salva in cache il contenuto generato per l'endpoint e gli input del prompt.
+    """
+    if not CONTENT_CACHE_ENABLED or endpoint not in CACHE_TTLS:
+        return
+    content_cache.set(
+        make_cache_key(endpoint, *inputs),
+        data,
+        ttl=CACHE_TTLS[endpoint],
+        size=size,
+        variants=CONTENT_CACHE_VARIANTS,
+    )
+
+
+async def generate_cached_json_response(endpoint: str, prompt: str, *inputs: Optional[str]):
+    """
+    Restituisce la risposta JSON già interpretata per il prompt, usando la cache se possibile.
+
+    Args:
+        endpoint: Il nome dell'endpoint, usato per la chiave e per il TTL.
+        prompt: Il prompt da inviare al modello in caso di cache miss.
+        inputs: Gli input da cui è costruito il prompt (lingue, topic, lesson_focus).
+
+    Returns:
+        La risposta del modello interpretata e validata da clean_json_response.
+    """
+    cached = get_cached_content(endpoint, *inputs)
+    if cached is not None:
+        return cached
+
+    response = await generate_llm_response_async(prompt, json_output=True)
+    # Se la risposta non è interpretabile l'eccezione risale e nulla viene salvato
+    data = clean_json_response(response, endpoint)
+    cache_content(endpoint, data, len(response.encode("utf-8")), *inputs)
+    return data
@@ -0,0 +1,282 @@
+import asyncio
+import os
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+import crud
+from database import AsyncSessionLocal
+from utils.llm_handler import generate_llm_response_async, clean_json_response
+from utils.content_cache import make_cache_key
+from utils import metrics
+
+load_dotenv()
+
+# Pool di esercizi pre-generati in background. Per ogni combinazione
+# (tipo di esercizio, lingue, topic, lesson_focus) si tiene una coda di esercizi già
+# interpretati: l'endpoint ne estrae uno in O(1) e la coda viene riempita di nuovo
+# in modo asincrono, così la prima richiesta non attende Gemini. Si pre-generano solo le
+# combinazioni richieste più volte: un topic libero chiesto una sola volta non costa
+# chiamate a Gemini.
+
+EXERCISE_POOL_ENABLED = os.getenv("EXERCISE_POOL_ENABLED", "false").lower() == "true"
+EXERCISE_POOL_DEPTH = int(os.getenv("EXERCISE_POOL_DEPTH", "5"))
+EXERCISE_POOL_REFILL_CONCURRENCY = int(os.getenv("EXERCISE_POOL_REFILL_CONCURRENCY", "4"))
+EXERCISE_POOL_PRODUCER_INTERVAL = float(os.getenv("EXERCISE_POOL_PRODUCER_INTERVAL", "60"))
+# Numero massimo di chiavi che il produttore riempie ad ogni giro
+EXERCISE_POOL_MAX_KEYS = int(os.getenv("EXERCISE_POOL_MAX_KEYS", "50"))
+# Richieste recenti dopo cui una combinazione viene pre-generata
+EXERCISE_POOL_MIN_REQUESTS = int(os.getenv("EXERCISE_POOL_MIN_REQUESTS", "3"))
+# Combinazioni ricordate al massimo: oltre si scartano quelle usate meno di recente,
+# con la loro coda e il loro contatore
+EXERCISE_POOL_MAX_TRACKED_KEYS = int(os.getenv("EXERCISE_POOL_MAX_TRACKED_KEYS", "1000"))
+
+PromptBuilder = Callable[[str, str, Optional[str], Optional[str]], str]
+
+
+class ExercisePool:
+    """
+    Code di esercizi pronti, indicizzate sugli input normalizzati del prompt.
+    """
+
+    def __init__(
+        self,
+        depth: int,
+        refill_concurrency: int,
+        min_requests: int = EXERCISE_POOL_MIN_REQUESTS,
+        max_tracked_keys: int = EXERCISE_POOL_MAX_TRACKED_KEYS,
+    ):
+        self.depth = depth
+        self.refill_concurrency = refill_concurrency
+        self.min_requests = min_requests
+        self.max_tracked_keys = max_tracked_keys
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        self._pools: Dict[tuple, deque] = {}
+        # chiave -> (tipo di esercizio, input originali) per ricostruire il prompt, in
+        # ordine di ultimo utilizzo
+        self._key_args: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._request_counts: Counter = Counter()
+        self._prompt_builders: Dict[str, PromptBuilder] = {}
+        self._refilling: set = set()
+        # Riempimenti in corso: il loop tiene solo riferimenti deboli ai task, quindi
+        # senza questo insieme potrebbero essere raccolti prima di terminare
+        self._tasks: set = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def register_prompt_builder(self, exercise_type: str, builder: PromptBuilder):
+        """
+        Registra la funzione che costruisce il prompt per un tipo di esercizio.
+        """
+        self._prompt_builders[exercise_type] = builder
+
+    def _track(self, key: tuple, exercise_type: str, args: tuple):
+        if key in self._key_args:
+            self._key_args.move_to_end(key)
+            return
+        self._key_args[key] = (exercise_type, args)
+        while len(self._key_args) > self.max_tracked_keys:
+            evicted, _ = self._key_args.popitem(last=False)
+            self._pools.pop(evicted, None)
+            self._request_counts.pop(evicted, None)
+
+    def pop(
+        self,
+        exercise_type: str,
+        target_language: str,
+        native_language: str,
+        topic: Optional[str] = None,
+        lesson_focus: Optional[str] = None,
+    ) -> Optional[Any]:
+        """
+        Estrae un esercizio pronto per la combinazione richiesta. Se la combinazione ha
+        raggiunto min_requests richieste recenti, ne viene generato uno in background al
+        posto di quello estratto. Restituisce None se la coda è vuota.
+        """
+        if not EXERCISE_POOL_ENABLED:
+            return None
+        args = (target_language, native_language, topic, lesson_focus)
+        key = make_cache_key(exercise_type, *args)
+        self._track(key, exercise_type, args)
+        self._request_counts[key] += 1
+
+        pool = self._pools.get(key)
+        exercise = pool.popleft() if pool else None
+        if exercise is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if self._request_counts[key] >= self.min_requests:
+            self.schedule_refill(key, count=1)
+        return exercise
+
+    def schedule_refill(self, key: tuple, count: Optional[int] = None):
+        """
+        Avvia in background la generazione di count esercizi (di default fino a depth),
+        se non è già in corso.
+        """
+        if key in self._refilling or key not in self._key_args:
+            return
+        missing = self.depth - len(self._pools.get(key, ()))
+        if count is not None:
+            missing = min(missing, count)
+        if missing <= 0:
+            return
+        self._refilling.add(key)
+        task = asyncio.get_running_loop().create_task(self._refill(key, missing))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """
+        Annulla i riempimenti in corso e ne attende la fine (alla chiusura dell'app).
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _refill(self, key: tuple, count: int):
+        exercise_type, args = self._key_args[key]
+        # Il riempimento continua dopo la richiesta che l'ha avviato: le chiamate
+        # all'LLM sono etichettate con il tipo di esercizio
+        metrics.set_operation(f"pool/{exercise_type}")
+        prompt = self._prompt_builders[exercise_type](*args)
+        pool = self._pools.setdefault(key, deque())
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.refill_concurrency)
+        try:
+            for _ in range(count):
+                try:
+                    async with self._semaphore:
+                        response = await generate_llm_response_async(prompt, json_output=True)
+                    pool.append(clean_json_response(response, exercise_type))
+                    self.generated += 1
+                except Exception as e:
+                    # Gemini non disponibile o risposta non valida: si riprova alla prossima richiesta
+                    print(f"Error pre-generating {exercise_type} exercise: {e}")
+                    self.failures += 1
+                    break
+        finally:
+            self._refilling.discard(key)
+
+    def add_key(
+        self,
+        exercise_type: str,
+        target_language: str,
+        native_language: str,
+        topic: Optional[str] = None,
+        lesson_focus: Optional[str] = None,
+    ):
+        """
+        Aggiunge una combinazione da pre-generare senza contarla come richiesta.
+        """
+        args = (target_language, native_language, topic, lesson_focus)
+        key = make_cache_key(exercise_type, *args)
+        self._track(key, exercise_type, args)
+        self.schedule_refill(key)
+
+    def hottest_keys(self, limit: int):
+        """
+        Restituisce le combinazioni richieste più di frequente di recente, almeno
+        min_requests volte.
+        """
+        return [
+            key
+            for key, count in self._request_counts.most_common(limit)
+            if count >= self.min_requests
+        ]
+
+    def decay_request_counts(self):
+        """
+        Dimezza i contatori di frequenza, così pesano di più le richieste recenti.
+        """
+        for key in list(self._request_counts):
+            self._request_counts[key] //= 2
+            if not self._request_counts[key]:
+                del self._request_counts[key]
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "enabled": EXERCISE_POOL_ENABLED,
+            "depth": self.depth,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "generated": self.generated,
+            "failures": self.failures,
+            "keys": len(self._pools),
+            "tracked_keys": len(self._key_args),
+            "ready_exercises": sum(len(pool) for pool in self._pools.values()),
+            "refills_in_progress": len(self._refilling),
+        }
+
+
+exercise_pool = ExercisePool(EXERCISE_POOL_DEPTH, EXERCISE_POOL_REFILL_CONCURRENCY)
+
+metrics.CallbackMetric(
+    "babilonia_exercise_pool_events_total",
+    "Esercizi serviti dal pool (hit) o generati al momento (miss), e riempimenti riusciti o falliti.",
+    "counter",
+    ("event",),
+    lambda: {
+        ("hit",): exercise_pool.hits,
+        ("miss",): exercise_pool.misses,
+        ("generated",): exercise_pool.generated,
+        ("failure",): exercise_pool.failures,
+    },
+)
+metrics.CallbackMetric(
+    "babilonia_exercise_pool_ready_exercises",
+    "Esercizi pre-generati pronti nel pool.",
+    "gauge",
+    (),
+    lambda: {(): exercise_pool.stats()["ready_exercises"]},
+)
+
+
+async def _load_seeded_content():
+    async with AsyncSessionLocal() as db:
+        topics = [topic.name for topic in await crud.get_topics(db)]
+        lesson_subjects = [subject.name for subject in await crud.get_lesson_subjects(db)]
+    return topics, lesson_subjects
+
+
+async def run_producer():
+    """
+    Ciclo del produttore in background. Ad ogni giro riempie le combinazioni più
+    richieste e, per le coppie di lingue più usate, le varianti con i topic e gli
+    argomenti di lezione presenti a database.
+    """
+    while True:
+        try:
+            topics, lesson_subjects = await _load_seeded_content()
+            hot_keys = exercise_pool.hottest_keys(EXERCISE_POOL_MAX_KEYS)
+            for key in hot_keys:
+                exercise_pool.schedule_refill(key)
+
+            budget = EXERCISE_POOL_MAX_KEYS - len(hot_keys)
+            language_pairs = []
+            for key in hot_keys:
+                exercise_type, (target, native, _, _) = exercise_pool._key_args[key]
+                if (exercise_type, target, native) not in language_pairs:
+                    language_pairs.append((exercise_type, target, native))
+            for exercise_type, target, native in language_pairs:
+                for topic in topics:
+                    if budget <= 0:
+                        break
+                    exercise_pool.add_key(exercise_type, target, native, topic=topic)
+                    budget -= 1
+                for subject in lesson_subjects:
+                    if budget <= 0:
+                        break
+                    exercise_pool.add_key(exercise_type, target, native, lesson_focus=subject)
+                    budget -= 1
+
+            exercise_pool.decay_request_counts()
+        except Exception as e:
+            print(f"Error in exercise pool producer: {e}")
+        await asyncio.sleep(EXERCISE_POOL_PRODUCER_INTERVAL)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import orjson
+from dotenv import load_dotenv
+import crud
+from database import AsyncSessionLocal
+
+load_dotenv()
+
+# Archivio degli esercizi generati che si possono correggere senza LLM. Ogni esercizio
+# viene salvato con un id ricavato dal suo contenuto, così la correzione può recuperare
+# le soluzioni senza fidarsi di quelle inviate dal client. Lo stesso esercizio servito
+# più volte dalla cache o dal pool ha sempre lo stesso id e viene salvato una sola volta.
+
+# Esercizi con risposte chiuse, corretti localmente
+GRADABLE_EXERCISES = ("fill-in-the-blank", "comprehension-test")
+
+# Esercizi tenuti anche in memoria, per evitare scritture e letture ripetute a database
+EXERCISE_STORE_MEMORY_ENTRIES = int(os.getenv("EXERCISE_STORE_MEMORY_ENTRIES", "10000"))
+
+
+def make_exercise_id(exercise_type: str, target_language: str, content: bytes) -> str:
+    """
+    Calcola l'id di un esercizio a partire dal tipo, dalla lingua e dal contenuto JSON.
+    """
+    digest = hashlib.sha256(f"{exercise_type}\0{target_language}\0".encode() + content)
+    return digest.hexdigest()[:32]
+
+
+class ExerciseStore:
+    """
+    Salva gli esercizi generati a database e tiene in memoria quelli usati di recente.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # id -> (tipo di esercizio, lingua, contenuto)
+        self._entries: "OrderedDict[str, Tuple[str, str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(
+        self, exercise_id: str, exercise_type: str, target_language: str, exercise: Any
+    ):
+        with self._lock:
+            self._entries[exercise_id] = (exercise_type, target_language, exercise)
+            self._entries.move_to_end(exercise_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, exercise_id: str) -> Optional[Tuple[str, str, Any]]:
+        with self._lock:
+            entry = self._entries.get(exercise_id)
+            if entry is not None:
+                self._entries.move_to_end(exercise_id)
+            return entry
+
+    @staticmethod
+    async def _save_to_db(exercise_id: str, exercise_type: str, target_language: str, content: str):
+        async with AsyncSessionLocal() as db:
+            await crud.save_generated_exercise(
+                db, exercise_id, exercise_type, target_language, content
+            )
+
+    @staticmethod
+    async def _load_from_db(exercise_id: str) -> Optional[Tuple[str, str, Any]]:
+        async with AsyncSessionLocal() as db:
+            exercise = await crud.get_generated_exercise(db, exercise_id)
+        if exercise is None:
+            return None
+        return exercise.exercise_type, exercise.target_language, orjson.loads(exercise.content)
+
+    async def save(self, exercise_type: str, target_language: str, exercise: Any) -> str:
+        """
+        Salva l'esercizio, se non è già noto, e ne restituisce l'id.
+        """
+        content = orjson.dumps(exercise, option=orjson.OPT_SORT_KEYS)
+        exercise_id = make_exercise_id(exercise_type, target_language, content)
+        if self._lookup(exercise_id) is None:
+            await self._save_to_db(exercise_id, exercise_type, target_language, content.decode())
+            self._remember(exercise_id, exercise_type, target_language, exercise)
+        return exercise_id
+
+    async def get(self, exercise_id: str) -> Optional[Tuple[str, str, Any]]:
+        """
+        Restituisce (tipo di esercizio, lingua, contenuto) per l'id, oppure None se non
+        esiste.
+        """
+        entry = self._lookup(exercise_id)
+        if entry is None:
+            entry = await self._load_from_db(exercise_id)
+            if entry is not None:
+                self._remember(exercise_id, *entry)
+        return entry
+
+
+exercise_store = ExerciseStore(EXERCISE_STORE_MEMORY_ENTRIES)
+
+
+async def with_exercise_id(exercise_type: str, target_language: str, exercise: Any) -> Any:
+    """
+    Salva un esercizio correggibile e lo restituisce con il suo "exercise_id". Gli altri
+    esercizi sono restituiti senza modifiche.
+    """
+    if exercise_type not in GRADABLE_EXERCISES or not isinstance(exercise, dict):
+        return exercise
+    exercise_id = await exercise_store.save(exercise_type, target_language, exercise)
+    return {**exercise, "exercise_id": exercise_id}
@@ -0,0 +1,91 @@
+import string
+from typing import Any, Dict, List, Optional
+
+import schemas
+
+# Correzione locale degli esercizi a risposta chiusa. Gli esercizi "riempi gli spazi" e
+# i test di comprensione contengono già la soluzione ('answer'), quindi una risposta che
+# coincide con una delle opzioni si corregge con un confronto di stringhe. Solo le
+# risposte libere, che non corrispondono a nessuna opzione, richiedono l'LLM.
+
+_STRIP_CHARS = string.whitespace + string.punctuation + "¿¡«»“”‘’"
+
+
+def normalize_answer(text: Optional[str]) -> str:
+    """
+    Normalizza una risposta per il confronto: minuscolo, spazi compattati, senza
+    punteggiatura iniziale o finale.
+    """
+    if text is None:
+        return ""
+    return " ".join(text.split()).casefold().strip(_STRIP_CHARS)
+
+
+def exercise_questions(exercise_type: str, exercise: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Restituisce le domande di un esercizio salvato, ciascuna con 'question', 'options' e
+    'answer'.
+    """
+    if exercise_type == "fill-in-the-blank":
+        return [
+            {
+                "question": exercise["sentence"],
+                "options": exercise.get("options", []),
+                "answer": exercise["answer"],
+            }
+        ]
+    if exercise_type == "comprehension-test":
+        return exercise["questions"]
+    return []
+
+
+def grade_answers(
+    questions: List[Dict[str, Any]], answers: List[schemas.AssessmentAnswer]
+) -> List[Dict[str, Any]]:
+    """
+    Corregge localmente le risposte. Ogni risposta è associata alla domanda con lo stesso
+    testo o, se il testo non corrisponde, a quella nella stessa posizione.
+
+    Returns:
+        Un risultato per risposta, nell'ordine ricevuto. 'correct' è None per le risposte
+        libere, da correggere con l'LLM, e per quelle senza una domanda corrispondente.
+    """
+    by_text = {normalize_answer(q["question"]): q for q in questions}
+    results = []
+    for position, answer in enumerate(answers):
+        question = by_text.get(normalize_answer(answer.question))
+        if question is None and position < len(questions) and len(answers) == len(questions):
+            question = questions[position]
+        result = {
+            "question": answer.question,
+            "user_answer": answer.user_answer,
+            "correct": None,
+            "expected_answer": None,
+            "feedback": None,
+            "graded_by": None,
+        }
+        if question is not None:
+            user_answer = normalize_answer(answer.user_answer)
+            expected = normalize_answer(question["answer"])
+            options = {normalize_answer(option) for option in question.get("options", [])}
+            result["expected_answer"] = question["answer"]
+            if user_answer == expected or user_answer in options:
+                result["correct"] = user_answer == expected
+                result["graded_by"] = "local"
+        results.append(result)
+    return results
+
+
+def level_delta(correct: int, graded: int) -> int:
+    """
+    Variazione del livello per un esercizio: +1 con almeno il 75% di risposte corrette,
+    -1 con meno del 40%, 0 altrimenti o se nessuna risposta è stata corretta.
+    """
+    if graded == 0:
+        return 0
+    ratio = correct / graded
+    if ratio >= 0.75:
+        return 1
+    if ratio < 0.4:
+        return -1
+    return 0
@@ -0,0 +1,144 @@
+from functools import lru_cache
+from typing import Any, List, Optional
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+import schemas
+
+# Interpretazione dell'output strutturato dell'LLM. Il modello viene invocato con
+# response_mime_type="application/json", quindi nel caso comune la risposta è JSON puro
+# e basta una decodifica con orjson. Se il modello aggiunge comunque marcatori ```json o
+# frasi di cortesia si estrae il primo valore JSON bilanciato dal testo.
+
+# Schema atteso per la risposta di ogni endpoint
+RESPONSE_SCHEMAS = {
+    "daily-practice": List[schemas.PracticeSentence],
+    "fill-in-the-blank": schemas.FillInTheBlankExercise,
+    "comprehension-test": schemas.ComprehensionTest,
+    "flashcards": List[schemas.Flashcard],
+    "sentence-correction": schemas.SentenceCorrection,
+    "flashcard-correction": schemas.FlashcardCorrectionResult,
+    "phrasebook": List[schemas.PhrasebookEntry],
+}
+
+
+class LLMResponseParseError(ValueError):
+    """
+    La risposta dell'LLM non contiene un JSON valido o non rispetta lo schema atteso.
+    """
+
+
+def _find_balanced_end(text: str, start: int) -> Optional[int]:
+    """
+    Restituisce l'indice della parentesi che chiude il valore che inizia in start,
+    ignorando le parentesi dentro le stringhe. None se il valore è troncato.
+    """
+    depth = 0
+    quote = None
+    escape = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == quote:
+                quote = None
+        elif char == '"':
+            quote = char
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def extract_first_json_value(text: str) -> Any:
+    """
+    Estrae e decodifica il primo valore JSON (oggetto o array) bilanciato presente nel
+    testo.
+
+    Raises:
+        LLMResponseParseError: Se il testo non contiene alcun valore decodificabile o se
+            il primo valore è troncato.
+    """
+    # Caso comune: JSON racchiuso tra marcatori ```json o testo di contorno senza parentesi
+    candidates = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if candidates:
+        start = min(candidates)
+        end = text.rfind("}" if text[start] == "{" else "]")
+        if end > start:
+            try:
+                return orjson.loads(text[start : end + 1])
+            except orjson.JSONDecodeError:
+                pass
+
+    start = 0
+    while True:
+        candidates = [i for i in (text.find("{", start), text.find("[", start)) if i != -1]
+        if not candidates:
+            raise LLMResponseParseError(
+                f"No JSON value found in LLM response: {text[:80]!r}"
+            )
+        start = min(candidates)
+        end = _find_balanced_end(text, start)
+        if end is None:
+            # Risposta interrotta: un oggetto interno non va scambiato per il valore intero
+            raise LLMResponseParseError(
+                f"Truncated JSON value in LLM response: {text[start:start + 80]!r}"
+            )
+        try:
+            return orjson.loads(text[start : end + 1])
+        except orjson.JSONDecodeError:
+            pass
+        # Parentesi nel testo di contorno (es. "[nota]"): si prova dopo la chiusura, senza
+        # scambiare una parte del valore non valido per la risposta
+        start = end + 1
+
+
+@lru_cache(maxsize=None)
+def _type_adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def validate_llm_data(data: Any, schema: Any) -> Any:
+    """
+    Valida dati già decodificati rispetto a uno schema e li restituisce come dizionari e
+    liste semplici.
+
+    Raises:
+        LLMResponseParseError: Se i dati non rispettano lo schema.
+    """
+    adapter = _type_adapter(schema)
+    try:
+        return adapter.dump_python(adapter.validate_python(data))
+    except ValidationError as e:
+        raise LLMResponseParseError(f"LLM response does not match the schema: {e}") from e
+
+
+def parse_llm_json(text: str, schema: Any = None) -> Any:
+    """
+    Interpreta la risposta JSON dell'LLM e, se indicato, la valida rispetto a uno schema.
+
+    Args:
+        text: La risposta testuale del modello.
+        schema: Un modello Pydantic o un tipo (es. List[Model]) con cui validare i dati.
+
+    Returns:
+        I dati decodificati, come dizionari e liste semplici.
+
+    Raises:
+        LLMResponseParseError: Se la risposta non è interpretabile o non rispetta lo schema.
+    """
+    try:
+        data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        data = extract_first_json_value(text)
+
+    if schema is None:
+        return data
+    return validate_llm_data(data, schema)
@@ -0,0 +1,85 @@
+import json
+from typing import Any, List, Optional
+
+
+class JsonArrayStreamParser:
+    """
+    Parser incrementale per un array JSON di oggetti che arriva a frammenti dall'LLM.
+
+    Ogni chiamata a feed restituisce gli oggetti completati con il nuovo frammento,
+    così possono essere inviati al client senza attendere la fine dell'array. Il testo
+    prima della "[" iniziale (marcatori ```json, frasi di cortesia) viene ignorato e un
+    oggetto troncato alla fine della risposta viene semplicemente scartato.
+    """
+
+    def __init__(self):
+        self.finished = False
+        self.skipped = 0
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._escape = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Aggiunge un frammento di testo e restituisce gli oggetti completati.
+        """
+        if self.finished:
+            return []
+        buffer = self._buffer + text
+        items = []
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == self._quote:
+                    self._quote = None
+            elif self._depth == 0:
+                if char == "[":
+                    self._depth = 1
+            elif char == '"' and self._depth > 1:
+                self._quote = char
+            elif char in "[{":
+                if self._depth == 1:
+                    self._item_start = i
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.finished = True
+                    break
+                if self._depth == 1 and self._item_start is not None:
+                    item = self._parse_item(buffer[self._item_start : i + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._item_start = None
+            i += 1
+
+        # Si conserva solo l'oggetto in corso, il resto è già stato consumato
+        start = self._item_start if self._item_start is not None else i
+        self._buffer = buffer[start:]
+        self._pos = i - start
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
+
+    def _parse_item(self, text: str) -> Optional[Any]:
+        try:
+            return json.loads(text)
+        except ValueError:
+            print(f"Skipping unparsable item in streamed JSON array: {text[:80]}")
+            self.skipped += 1
+            return None
+
+    @property
+    def truncated(self) -> bool:
+        """
+        True se la risposta si è interrotta prima della chiusura dell'array.
+        """
+        return not self.finished
@@ -0,0 +1,40 @@
+import unicodedata
+
+# Normalizzazione dei nomi delle lingue e alias iniziali. La chiave normalizzata è usata
+# sia dalla colonna languages.normalized_name (indice unico) sia dalla tabella
+# language_aliases, così "mandarin  chinese", "ZH" e "中文" portano alla stessa lingua.
+
+
+def normalize_language_name(name: str) -> str:
+    """
+    Restituisce la chiave di ricerca di un nome: forma Unicode NFKC, spazi ridotti a uno
+    e confronto senza maiuscole (casefold).
+    """
+    return " ".join(unicodedata.normalize("NFKC", name).split()).casefold()
+
+
+def display_language_name(name: str) -> str:
+    """
+    Restituisce il nome da salvare per una nuova lingua: spazi ridotti a uno e iniziale
+    maiuscola, senza modificare il resto (es. "Mandarin Chinese").
+    """
+    name = " ".join(name.split())
+    return name[:1].upper() + name[1:]
+
+
+# Lingua -> codici ISO 639-1/639-2/639-3 e nomi nella lingua stessa
+INITIAL_LANGUAGE_ALIASES = {
+    "Albanian": ["sq", "sqi", "alb", "Shqip"],
+    "Arabic": ["ar", "ara", "العربية"],
+    "English": ["en", "eng"],
+    "Spanish": ["es", "spa", "Español", "Castellano"],
+    "French": ["fr", "fra", "fre", "Français"],
+    "German": ["de", "deu", "ger", "Deutsch"],
+    "Italian": ["it", "ita", "Italiano"],
+    "Portuguese": ["pt", "por", "Português"],
+    "Dutch": ["nl", "nld", "dut", "Nederlands"],
+    "Russian": ["ru", "rus", "Русский"],
+    "Mandarin Chinese": ["zh", "zho", "chi", "cmn", "Chinese", "Mandarin", "中文", "普通话"],
+    "Japanese": ["ja", "jpn", "日本語"],
+    "Korean": ["ko", "kor", "한국어"],
+}
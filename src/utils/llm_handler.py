@@ -1,7 +1,11 @@
 import os
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional
 import google.generativeai as genai
 from dotenv import load_dotenv
-from ast import literal_eval
+from utils.json_parser import parse_llm_json, LLMResponseParseError, RESPONSE_SCHEMAS
+from utils import metrics
 
 load_dotenv()
 
@@ -33,8 +37,23 @@ safety_settings = [
     },
 ]
 
+# Per le risposte strutturate si chiede a Gemini di produrre direttamente JSON
+json_generation_config = {"response_mime_type": "application/json"}
+
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
 
+# Le chiamate concorrenti con lo stesso prompt e la stessa configurazione condividono
+# un'unica richiesta a Gemini (single-flight)
+LLM_COALESCING_ENABLED = os.getenv("LLM_COALESCING_ENABLED", "true").lower() == "true"
+
+
+class LLMUnavailableError(RuntimeError):
+    """
+    La chiamata a Gemini non ha restituito una risposta (errore di rete, quota, contenuto
+    bloccato, ...). Gli endpoint rispondono 502 senza salvare nulla.
+    """
+
+
 model = genai.GenerativeModel(
     model_name=MODEL_NAME,
     generation_config=generation_config,
@@ -42,32 +61,172 @@ model = genai.GenerativeModel(
 )
 
 
-def generate_llm_response(prompt: str) -> str:
+# Richieste a Gemini in corso, indicizzate per (prompt, json_output)
+_in_flight: Dict[tuple, asyncio.Task] = {}
+
+
+async def _call_model_async(prompt: str, json_output: bool) -> str:
+    start = time.perf_counter()
+    try:
+        response = await model.generate_content_async(
+            prompt, generation_config=json_generation_config if json_output else None
+        )
+        text = response.text
+    except Exception as e:
+        metrics.observe_llm_call(time.perf_counter() - start, error=True)
+        print(f"Error calling Gemini API: {e}")
+        raise LLMUnavailableError(str(e)) from e
+    metrics.observe_llm_call(
+        time.perf_counter() - start, getattr(response, "usage_metadata", None)
+    )
+    return text
+
+
+def _forget_in_flight(key: tuple, task: asyncio.Task):
+    _in_flight.pop(key, None)
+    # L'errore viene letto qui, così non viene segnalato come mai recuperato se tutte le
+    # richieste in attesa sono state annullate
+    if not task.cancelled():
+        task.exception()
+
+
+async def generate_llm_response_async(prompt: str, json_output: bool = False) -> str:
     """
     Genera una risposta dal modello linguistico di Gemini basata su un prompt fornito.
-    
+    Attende la risposta senza occupare un thread del threadpool, così un singolo worker
+    può gestire molte richieste LLM concorrenti. Se una richiesta identica è già in corso, ne attende il
+    risultato invece di inviarne un'altra.
+
     Args:
         prompt: Il prompt da inviare al modello linguistico.
+        json_output: Se True chiede al modello una risposta in formato JSON.
 
     Returns:
         La risposta testuale dal modello linguistico.
+
+    Raises:
+        LLMUnavailableError: Se Gemini non restituisce una risposta; con l'accorpamento
+            l'errore arriva a tutte le richieste in attesa.
     """
+    if not LLM_COALESCING_ENABLED:
+        return await _call_model_async(prompt, json_output)
+
+    key = (prompt, json_output)
+    task = _in_flight.get(key)
+    if task is not None:
+        metrics.llm_coalesced_requests.inc((metrics.current_operation(),))
+    else:
+        task = asyncio.create_task(_call_model_async(prompt, json_output))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _forget_in_flight(key, done))
+    # shield: se un client si disconnette la richiesta continua per gli altri in attesa
+    return await asyncio.shield(task)
+
+
+async def stream_llm_response(prompt: str, json_output: bool = False) -> AsyncIterator[str]:
+    """
+    Genera una risposta dal modello in modalità streaming, restituendo i frammenti di
+    testo man mano che Gemini li produce.
+
+    Args:
+        prompt: Il prompt da inviare al modello linguistico.
+        json_output: Se True chiede al modello una risposta in formato JSON.
+
+    Yields:
+        I frammenti di testo della risposta, nell'ordine in cui arrivano.
+    """
+    start = time.perf_counter()
+    usage = None
+    error = False
     try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        print(f"Error calling Gemini API: {e}")
-        return "Error: Could not get a response from the language model."
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=json_generation_config if json_output else None,
+            stream=True,
+        )
+        async for chunk in response:
+            # L'utilizzo completo arriva con l'ultimo frammento
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            if chunk.text:
+                yield chunk.text
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.observe_llm_call(time.perf_counter() - start, usage, error)
+
+
+def start_chat_session(system_prompt: str):
+    """
+    Apre una sessione di chat dell'SDK che mantiene la cronologia in memoria, da usare
+    per conversazioni lunghe sulla stessa connessione. Il messaggio di sistema viene
+    inserito come primo turno della cronologia.
+    """
+    return model.start_chat(
+        history=[
+            {"role": "user", "parts": [system_prompt]},
+            {"role": "model", "parts": ["Understood."]},
+        ]
+    )
 
 
-def clean_json_response(response: str) -> str:
+async def stream_chat_message(chat, content: str) -> AsyncIterator[str]:
     """
-    Pulisce la risposta JSON dal modello LLM rimuovendo i marcatori del blocco di codice.
+    Invia un messaggio a una sessione di chat e restituisce la risposta a frammenti.
+    Se la risposta si interrompe, la cronologia della sessione torna allo stato
+    precedente al messaggio.
+
+    Args:
+        chat: La sessione creata con start_chat_session.
+        content: Il messaggio dell'utente.
+
+    Yields:
+        I frammenti di testo della risposta, nell'ordine in cui arrivano.
+    """
+    history = list(chat.history)
+    start = time.perf_counter()
+    usage = None
+    error = False
+    try:
+        response = await chat.send_message_async(content, stream=True)
+        async for chunk in response:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            if chunk.text:
+                yield chunk.text
+    except BaseException as e:
+        error = isinstance(e, Exception)
+        chat.history = history
+        raise
+    finally:
+        metrics.observe_llm_call(time.perf_counter() - start, usage, error)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Stima veloce del numero di token di un testo (circa 4 caratteri per token), senza
+    chiamare l'API count_tokens di Gemini.
+    """
+    return len(text) // 4 + 1
+
+
+def clean_json_response(response: str, endpoint: Optional[str] = None):
+    """
+    Interpreta la risposta JSON dal modello LLM, ignorando eventuali marcatori del blocco
+    di codice o testo di contorno.
 
     Args:
         response: La risposta JSON grezza dal modello LLM.
+        endpoint: Se indicato, la risposta viene validata con lo schema dell'endpoint
+            (vedi json_parser.RESPONSE_SCHEMAS).
 
     Returns:
-        La risposta JSON pulita.
+        I dati JSON decodificati.
+
+    Raises:
+        LLMResponseParseError: Se la risposta non è interpretabile o non rispetta lo schema.
     """
-    return literal_eval(response.replace("```json", "").replace("```", ""))
+    try:
+        return parse_llm_json(response, RESPONSE_SCHEMAS.get(endpoint))
+    except LLMResponseParseError:
+        metrics.observe_parse_failure()
+        raise
@@ -0,0 +1,372 @@
+import bisect
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+# Metriche in formato testuale di Prometheus, esposte su /metrics. I valori sono
+# aggiornati solo dal thread dell'event loop (middleware, chiamate a Gemini, listener di
+# SQLAlchemy eseguiti nel greenlet della sessione asincrona), quindi contatori e
+# istogrammi sono semplici liste e dizionari senza lock. Ogni serie viene creata alla
+# prima osservazione; le successive incrementano solo valori già esistenti.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Etichetta delle richieste che non corrispondono a nessuna route (es. 404 di scansioni):
+# il path non viene usato come etichetta per non far crescere le serie senza limite
+UNMATCHED_ROUTE = "unmatched"
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+DB_QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+DB_REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+DB_QUERIES_PER_REQUEST_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Contatore monotono. Le etichette sono passate come tupla di valori, nello stesso
+    ordine di labelnames.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[tuple, float] = {}
+        REGISTRY.append(self)
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in list(self.values.items()):
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Histogram:
+    """
+    Istogramma a bucket fissi. Ogni serie è una lista con un contatore per bucket (non
+    cumulativo, l'ultimo è +Inf) seguito dalla somma dei valori osservati.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(buckets)
+        self.series: Dict[tuple, list] = {}
+        REGISTRY.append(self)
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+        series[bisect.bisect_left(self.bounds, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        les = [_format_value(bound) for bound in self.bounds] + ["+Inf"]
+        for labels, series in list(self.series.items()):
+            cumulative = 0
+            for le, count in zip(les, series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Contatore o gauge i cui valori sono letti da callback() al momento dell'esposizione,
+    per le statistiche già tenute da altri oggetti (es. il pool di esercizi). callback
+    restituisce un dizionario {etichette: valore}.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[tuple, float]],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.callback().items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+REGISTRY: list = []
+
+http_request_duration = Histogram(
+    "babilonia_http_request_duration_seconds",
+    "Durata delle richieste HTTP, compreso l'invio delle risposte in streaming.",
+    ("method", "route"),
+    HTTP_BUCKETS,
+)
+http_requests = Counter(
+    "babilonia_http_requests_total",
+    "Richieste HTTP completate, per codice di stato.",
+    ("method", "route", "status"),
+)
+llm_request_duration = Histogram(
+    "babilonia_llm_request_duration_seconds",
+    "Durata delle chiamate a Gemini (fino all'ultimo frammento per lo streaming).",
+    ("operation",),
+    LLM_BUCKETS,
+)
+llm_errors = Counter(
+    "babilonia_llm_errors_total",
+    "Chiamate a Gemini terminate con un errore.",
+    ("operation",),
+)
+llm_coalesced_requests = Counter(
+    "babilonia_llm_coalesced_requests_total",
+    "Richieste a Gemini servite da una chiamata identica già in corso, senza una nuova chiamata.",
+    ("operation",),
+)
+llm_prompt_tokens = Counter(
+    "babilonia_llm_prompt_tokens_total",
+    "Token dei prompt secondo usage_metadata di Gemini.",
+    ("operation",),
+)
+llm_response_tokens = Counter(
+    "babilonia_llm_response_tokens_total",
+    "Token delle risposte secondo usage_metadata di Gemini.",
+    ("operation",),
+)
+llm_parse_failures = Counter(
+    "babilonia_llm_parse_failures_total",
+    "Risposte di Gemini, o singoli elementi di risposte JSON, non interpretabili o non conformi allo schema.",
+    ("operation",),
+)
+db_query_duration = Histogram(
+    "babilonia_db_query_duration_seconds",
+    "Durata delle singole query SQL.",
+    (),
+    DB_QUERY_BUCKETS,
+)
+db_queries_per_request = Histogram(
+    "babilonia_db_queries_per_request",
+    "Query SQL eseguite da ogni richiesta HTTP.",
+    ("route",),
+    DB_QUERIES_PER_REQUEST_BUCKETS,
+)
+db_time_per_request = Histogram(
+    "babilonia_db_time_per_request_seconds",
+    "Tempo passato in query SQL da ogni richiesta HTTP.",
+    ("route",),
+    DB_REQUEST_BUCKETS,
+)
+
+
+class RequestMetrics:
+    """
+    Stato della richiesta in corso: lo scope ASGI (per risalire alla route) e il
+    numero e la durata delle query eseguite.
+    """
+
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# id(route) -> template completo usato come etichetta. Con le versioni di FastAPI che
+# includono i router senza copiarne le route, route.path non contiene il prefisso del
+# router (es. "/api"): viene ricavato una volta per route dal path della prima richiesta
+_route_labels: Dict[int, str] = {}
+
+
+def route_label(scope: dict) -> Optional[str]:
+    """
+    Restituisce il template completo della route della richiesta (es.
+    "/api/chat/sessions/{session_id}"), oppure None se nessuna route corrisponde.
+    """
+    route = scope.get("route")
+    if route is None:
+        return None
+    label = _route_labels.get(id(route))
+    if label is None:
+        path = scope["path"]
+        label = route.path
+        for i, char in enumerate(path):
+            if char == "/" and route.path_regex.match(path[i:]):
+                label = path[:i] + route.path
+                break
+        _route_labels[id(route)] = label
+    return label
+
+
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "metrics_current_request", default=None
+)
+_current_operation: ContextVar[Optional[str]] = ContextVar(
+    "metrics_current_operation", default=None
+)
+
+
+def set_operation(operation: str):
+    """
+    Imposta l'etichetta delle chiamate all'LLM fatte dal contesto corrente, per il
+    lavoro in background che non appartiene a una richiesta (es. "pool/flashcards").
+    """
+    _current_operation.set(operation)
+
+
+def current_operation() -> str:
+    """
+    Restituisce l'etichetta delle chiamate all'LLM: quella impostata con set_operation
+    oppure la route della richiesta in corso (es. "/api/exercises/flashcards"), che per
+    gli esercizi identifica il tipo di esercizio.
+    """
+    operation = _current_operation.get()
+    if operation is not None:
+        return operation
+    request = _current_request.get()
+    if request is not None:
+        return route_label(request.scope) or "other"
+    return "other"
+
+
+def observe_llm_call(seconds: float, usage=None, error: bool = False):
+    """
+    Registra una chiamata a Gemini: durata, eventuale errore e token riportati da
+    usage_metadata (prompt_token_count e candidates_token_count).
+    """
+    labels = (current_operation(),)
+    llm_request_duration.observe(labels, seconds)
+    if error:
+        llm_errors.inc(labels)
+    if usage:
+        llm_prompt_tokens.inc(labels, usage.prompt_token_count or 0)
+        llm_response_tokens.inc(labels, usage.candidates_token_count or 0)
+
+
+def observe_parse_failure(count: int = 1):
+    llm_parse_failures.inc((current_operation(),), count)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    db_query_duration.observe((), elapsed)
+    request = _current_request.get()
+    if request is not None:
+        request.queries += 1
+        request.db_seconds += elapsed
+
+
+def instrument_engine(engine):
+    """
+    Registra i listener che misurano le query dell'engine. Con AsyncEngine va passato
+    async_engine.sync_engine.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI che misura la durata di ogni richiesta HTTP e le query eseguite,
+    etichettate con il template della route (es. "/api/chat/sessions/{session_id}").
+    Le connessioni WebSocket non sono misurate, ma le loro chiamate all'LLM sono
+    comunque etichettate con la route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        request = RequestMetrics(scope)
+        token = _current_request.set(request)
+        if scope["type"] == "websocket":
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_request.reset(token)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_request.reset(token)
+            route_path = route_label(scope) or UNMATCHED_ROUTE
+            http_request_duration.observe((scope["method"], route_path), elapsed)
+            http_requests.inc((scope["method"], route_path, status))
+            db_queries_per_request.observe((route_path,), request.queries)
+            db_time_per_request.observe((route_path,), request.db_seconds)
+
+
+def render_metrics() -> str:
+    """
+    Restituisce tutte le metriche nel formato testuale di Prometheus.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,268 @@
+import asyncio
+import os
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from database import AsyncSessionLocal
+
+load_dotenv()
+
+# Scrittura differita (write-behind) dei progressi. Con molti invii concorrenti ogni
+# aggiornamento è una scrittura su SQLite, che serializza le transazioni. Se abilitata,
+# i delta vengono accumulati in memoria per (utente, lingua) e scritti in blocco ogni
+# PROGRESS_FLUSH_INTERVAL_MS millisecondi o dopo PROGRESS_FLUSH_MAX_EVENTS aggiornamenti.
+# Le letture sommano alla riga a database i delta non ancora scritti. Anche le
+# correzioni registrate in graded_exercises vengono scritte a gruppi, altrimenti ogni
+# invio resterebbe comunque un commit.
+
+PROGRESS_WRITE_BEHIND_ENABLED = (
+    os.getenv("PROGRESS_WRITE_BEHIND_ENABLED", "false").lower() == "true"
+)
+PROGRESS_FLUSH_INTERVAL_MS = int(os.getenv("PROGRESS_FLUSH_INTERVAL_MS", "500"))
+PROGRESS_FLUSH_MAX_EVENTS = int(os.getenv("PROGRESS_FLUSH_MAX_EVENTS", "100"))
+
+ProgressKey = Tuple[int, str]
+
+
+def _merge(target: Dict[ProgressKey, list], deltas: Dict[ProgressKey, list]):
+    for key, (comprehension, vocabulary, grammar) in deltas.items():
+        pending = target.setdefault(key, [0, 0, 0])
+        pending[0] += comprehension
+        pending[1] += vocabulary
+        pending[2] += grammar
+
+
+class ProgressAggregator:
+    """
+    Accumula i delta dei progressi e li scrive a database in blocco.
+    """
+
+    def __init__(self, flush_interval_ms: int, flush_max_events: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_events = flush_max_events
+        self.flushes = 0
+        self.flushed_events = 0
+        # (user_id, target_language) -> [comprehension, vocabulary, grammar]
+        self._pending: Dict[ProgressKey, list] = {}
+        # Delta in corso di scrittura: restano visibili alle letture fino al commit
+        self._in_flight: Dict[ProgressKey, list] = {}
+        self._events = 0
+        # Serializza le scritture in blocco e le letture che sommano i delta in sospeso
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def add(
+        self,
+        user_id: int,
+        target_language: str,
+        comprehension_delta: int = 0,
+        vocabulary_delta: int = 0,
+        grammar_delta: int = 0,
+    ):
+        """
+        Registra un aggiornamento. Raggiunti flush_max_events aggiornamenti, la scrittura
+        in blocco viene anticipata.
+        """
+        _merge(
+            self._pending,
+            {(user_id, target_language): (comprehension_delta, vocabulary_delta, grammar_delta)},
+        )
+        self._events += 1
+        if self._events >= self.flush_max_events and self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending_deltas(self, user_id: int, target_language: str) -> Tuple[int, int, int]:
+        """
+        Restituisce la somma dei delta non ancora scritti a database per utente e lingua.
+        """
+        key = (user_id, target_language)
+        totals = [0, 0, 0]
+        for source in (self._in_flight, self._pending):
+            for i, delta in enumerate(source.get(key, ())):
+                totals[i] += delta
+        return tuple(totals)
+
+    async def read(self, db: AsyncSession, user_id: int, target_language: str) -> dict:
+        """
+        Legge il progresso a database e vi somma i delta in sospeso. Se la riga non esiste
+        ancora si parte dai valori iniziali.
+        """
+        async with self._flush_lock:
+            row = await crud.get_progress(db, user_id=user_id, target_language=target_language)
+            comprehension, vocabulary, grammar = self.pending_deltas(user_id, target_language)
+        # Chiude la transazione di lettura: la connessione torna subito al pool
+        await db.commit()
+        if row is None:
+            progress = {
+                "id": None,
+                "user_id": user_id,
+                "target_language": target_language,
+                "comprehension_level": 1,
+                "vocabulary_level": 1,
+                "grammar_level": 1,
+                "overall_progress": 0.0,
+            }
+        else:
+            progress = row._asdict()
+        progress["comprehension_level"] += comprehension
+        progress["vocabulary_level"] += vocabulary
+        progress["grammar_level"] += grammar
+        if comprehension or vocabulary or grammar:
+            progress["overall_progress"] = (
+                progress["comprehension_level"]
+                + progress["vocabulary_level"]
+                + progress["grammar_level"]
+            ) / 3.0
+        return progress
+
+    async def flush(self):
+        """
+        Scrive a database, in un'unica transazione, i delta accumulati. In caso di errore
+        i delta tornano tra quelli in sospeso e verranno riprovati.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._in_flight, self._pending = self._pending, {}
+            events, self._events = self._events, 0
+            try:
+                async with AsyncSessionLocal() as db:
+                    await crud.increment_progress_many(db, self._in_flight)
+            except Exception:
+                _merge(self._pending, self._in_flight)
+                self._events += events
+                self._in_flight = {}
+                raise
+            self._in_flight = {}
+            self.flushes += 1
+            self.flushed_events += events
+
+    async def run(self):
+        """
+        Ciclo di scrittura in blocco, da avviare come task all'avvio dell'applicazione.
+        Termina dopo un'ultima scrittura quando viene chiamato stop.
+        """
+        self._wakeup = asyncio.Event()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing progress updates: {e}")
+
+    def stop(self):
+        """
+        Chiede al ciclo di scrittura di terminare. Il task non viene cancellato: una
+        scrittura in corso si completa e i delta ancora in memoria vengono scritti.
+        """
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+
+class GradedExerciseBatcher:
+    """
+    Registra le correzioni degli esercizi a gruppi: le richieste arrivate mentre un
+    gruppo è in scrittura attendono e vengono scritte insieme nel successivo, con un solo
+    commit. A differenza dei delta dei progressi la scrittura non è differita: ogni
+    richiesta riceve l'esito dal database, quindi un esercizio resta correggibile una
+    sola volta anche con più worker.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        # (user_id, exercise_id) -> future delle richieste in attesa
+        self._pending: Dict[Tuple[int, str], list] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    async def mark(self, user_id: int, exercise_id: str) -> bool:
+        """
+        Registra la correzione e restituisce True se è la prima per l'utente. Tra invii
+        concorrenti dello stesso esercizio solo il primo risulta nuovo.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault((user_id, exercise_id), []).append(future)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+        return await future
+
+    async def _write(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, {}
+                try:
+                    async with AsyncSessionLocal() as db:
+                        inserted = await crud.mark_exercises_graded(db, list(batch))
+                except Exception as e:
+                    for futures in batch.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(e)
+                    continue
+                self.batches += 1
+                for key, futures in batch.items():
+                    for i, future in enumerate(futures):
+                        if not future.done():
+                            future.set_result(i == 0 and key in inserted)
+        finally:
+            self._writer = None
+
+
+progress_aggregator = ProgressAggregator(PROGRESS_FLUSH_INTERVAL_MS, PROGRESS_FLUSH_MAX_EVENTS)
+graded_exercise_batcher = GradedExerciseBatcher()
+
+
+async def mark_exercise_graded(db: AsyncSession, user_id: int, exercise_id: str) -> bool:
+    """
+    Registra la correzione di un esercizio: subito, oppure, se la scrittura differita è
+    abilitata, insieme a quelle delle richieste concorrenti.
+
+    Returns:
+        True se è la prima correzione, False se l'esercizio era già stato corretto.
+    """
+    if not PROGRESS_WRITE_BEHIND_ENABLED:
+        return await crud.mark_exercise_graded(db, user_id, exercise_id)
+    return await graded_exercise_batcher.mark(user_id, exercise_id)
+
+
+async def apply_progress(
+    db: AsyncSession,
+    user_id: int,
+    target_language: str,
+    comprehension_delta: int = 0,
+    vocabulary_delta: int = 0,
+    grammar_delta: int = 0,
+) -> dict:
+    """
+    Applica i delta ai progressi dell'utente e restituisce i progressi aggiornati: subito
+    a database oppure, se la scrittura differita è abilitata, tramite l'aggregatore.
+    """
+    if not PROGRESS_WRITE_BEHIND_ENABLED:
+        progress = await crud.increment_progress(
+            db,
+            user_id=user_id,
+            target_language=target_language,
+            comprehension_delta=comprehension_delta,
+            vocabulary_delta=vocabulary_delta,
+            grammar_delta=grammar_delta,
+        )
+        return progress._asdict()
+    progress_aggregator.add(
+        user_id, target_language, comprehension_delta, vocabulary_delta, grammar_delta
+    )
+    return await progress_aggregator.read(db, user_id, target_language)
+
+
+async def read_progress(db: AsyncSession, user_id: int, target_language: str) -> dict:
+    """
+    Restituisce i progressi dell'utente per la lingua, compresi i delta non ancora scritti.
+    """
+    return await progress_aggregator.read(db, user_id, target_language)
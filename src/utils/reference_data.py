@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, Optional
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models, schemas
+from utils.language_names import normalize_language_name
+
+load_dotenv()
+
+# Copia in memoria delle tabelle di riferimento (lingue, topic, argomenti di lezione).
+# Cambiano di rado ma vengono lette ad ogni avvio dei client e ad ogni turno di chat:
+# ogni tabella è letta una volta, serializzata una volta e ricostruita solo dopo una
+# scrittura tramite crud. Le risposte hanno un ETag forte, quindi i client possono
+# ricevere 304 Not Modified.
+
+# Con più worker ogni processo ha la propria copia: dopo questi secondi viene riletta
+# comunque, così un'aggiunta fatta da un altro worker diventa visibile
+REFERENCE_DATA_TTL_SECONDS = float(os.getenv("REFERENCE_DATA_TTL_SECONDS", "300"))
+
+# tabella -> (modello, schema della risposta, ordinamento)
+REFERENCE_TABLES = {
+    "languages": (models.Language, schemas.Language, models.Language.name),
+    "topics": (models.Topic, schemas.Topic, models.Topic.id),
+    "lesson_subjects": (models.LessonSubject, schemas.LessonSubject, models.LessonSubject.id),
+}
+
+
+class Snapshot:
+    """
+    Contenuto di una tabella: righe, indici per nome e per nome normalizzato (compresi
+    gli eventuali alias) e corpo JSON già serializzato.
+    """
+
+    def __init__(self, rows: list, aliases: Optional[Dict[str, int]] = None):
+        self.rows = rows
+        self.by_name = {row.name: row for row in rows}
+        self.by_key = {normalize_language_name(row.name): row for row in rows}
+        by_id = {row.id: row for row in rows}
+        for alias, row_id in (aliases or {}).items():
+            if row_id in by_id:
+                self.by_key.setdefault(alias, by_id[row_id])
+        self.body = orjson.dumps([row.model_dump() for row in rows])
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.loaded_at = time.monotonic()
+
+
+class ReferenceData:
+    """
+    Mantiene uno Snapshot per tabella, ricostruito dopo le scritture o alla scadenza.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.builds = 0
+        self._snapshots: Dict[str, Snapshot] = {}
+        # Incrementata ad ogni invalidazione: uno snapshot letto prima di una scrittura
+        # non viene salvato
+        self._generations: Dict[str, int] = {table: 0 for table in REFERENCE_TABLES}
+        self._locks = {table: asyncio.Lock() for table in REFERENCE_TABLES}
+
+    def _fresh(self, table: str) -> Optional[Snapshot]:
+        snapshot = self._snapshots.get(table)
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl:
+            return snapshot
+        return None
+
+    async def get(self, db: AsyncSession, table: str) -> Snapshot:
+        """
+        Restituisce lo snapshot della tabella, leggendola a database se necessario. Le
+        richieste concorrenti attendono un'unica lettura.
+        """
+        snapshot = self._fresh(table)
+        if snapshot is not None:
+            return snapshot
+        async with self._locks[table]:
+            snapshot = self._fresh(table)
+            if snapshot is not None:
+                return snapshot
+            generation = self._generations[table]
+            model, schema, order = REFERENCE_TABLES[table]
+            result = await db.execute(select(model).order_by(order))
+            rows = [schema(id=row.id, name=row.name) for row in result.scalars().all()]
+            aliases = None
+            if model is models.Language:
+                result = await db.execute(
+                    select(models.LanguageAlias.alias, models.LanguageAlias.language_id)
+                )
+                aliases = dict(result.all())
+            snapshot = Snapshot(rows, aliases)
+            self.builds += 1
+            if self._generations[table] == generation:
+                self._snapshots[table] = snapshot
+            return snapshot
+
+    def invalidate(self, table: str):
+        """
+        Scarta lo snapshot della tabella: va chiamata dopo ogni scrittura.
+        """
+        self._generations[table] += 1
+        self._snapshots.pop(table, None)
+
+
+reference_data = ReferenceData(REFERENCE_DATA_TTL_SECONDS)
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    """
+    Risponde con il corpo già serializzato dello snapshot, oppure con 304 se il client
+    ha già la stessa versione (If-None-Match).
+    """
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if snapshot.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
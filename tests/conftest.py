@@ -0,0 +1,139 @@
+"""
+Configurazione comune dei test. L'app viene importata da src/, come fa uvicorn, con un
+database SQLite temporaneo e un modello Gemini fittizio: i test non usano la rete né il
+database di sviluppo.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+TEST_DB_DIR = tempfile.mkdtemp(prefix="babilonia-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DB_DIR, 'test.db')}"
+os.environ.setdefault("GEMINI_API_KEY", "fake-key-for-tests")
+os.environ.setdefault("SECRET_KEY", "fake-secret-for-tests")
+# Costo bcrypt minimo: i test verificano il percorso, non la robustezza dell'hash
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["EXERCISE_POOL_ENABLED"] = "false"
+os.environ["PROGRESS_WRITE_BEHIND_ENABLED"] = "false"
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeStream:
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield FakeResponse(chunk)
+        if self.error is not None:
+            raise self.error
+
+
+class FakeModel:
+    """
+    Sostituto di genai.GenerativeModel: restituisce `text`, oppure solleva `error` se
+    impostato, dopo `latency` secondi, e conta le chiamate ricevute. In streaming restituisce i frammenti
+    `chunks` (di default il solo `text`) e poi solleva `stream_error`, se impostato.
+    """
+
+    def __init__(self, text: str = "Fake response", latency: float = 0.0):
+        self.text = text
+        self.latency = latency
+        self.error = None
+        self.chunks = None
+        self.stream_error = None
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        if stream:
+            return FakeStream(self.chunks or [self.text], self.stream_error)
+        return FakeResponse(self.text)
+
+
+@pytest.fixture(scope="session")
+def loop():
+    # Un solo event loop per tutti i test: le connessioni del pool asincrono vi restano legate
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def run(loop):
+    return loop.run_until_complete
+
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app
+
+    return app
+
+
+@pytest.fixture
+def client(app, loop):
+    import httpx
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    yield client
+    loop.run_until_complete(client.aclose())
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    from utils import llm_handler
+
+    model = FakeModel()
+    monkeypatch.setattr(llm_handler, "model", model)
+    return model
+
+
+@pytest.fixture
+def user(app, run):
+    # app importa main, che crea le tabelle con init_db
+    import crud, schemas
+    from database import AsyncSessionLocal
+
+    async def create():
+        async with AsyncSessionLocal() as db:
+            db_user = await crud.create_user(
+                db,
+                schemas.UserCreate(
+                    username=f"test-{uuid.uuid4().hex[:12]}",
+                    password="unused",
+                    native_language="Italian",
+                ),
+                hashed_password="not-a-bcrypt-hash",
+            )
+        return schemas.User(
+            id=db_user.id, username=db_user.username, native_language=db_user.native_language
+        )
+
+    return run(create())
+
+
+@pytest.fixture
+def logged_in(app, user):
+    from api.dependencies import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_user, None)
@@ -0,0 +1,45 @@
+import asyncio
+
+import crud
+from api.dependencies import create_refresh_token
+from database import AsyncSessionLocal
+
+
+async def _refresh_token_for(user_id: int) -> str:
+    async with AsyncSessionLocal() as db:
+        return await create_refresh_token(db, user_id)
+
+
+def test_refresh_rotates_the_token(run, client, user):
+    token = run(_refresh_token_for(user.id))
+
+    response = run(client.post("/api/token/refresh", json={"refresh_token": token}))
+    assert response.status_code == 200
+    new_token = response.json()["refresh_token"]
+    assert new_token != token
+
+    reused = run(client.post("/api/token/refresh", json={"refresh_token": token}))
+    assert reused.status_code == 401
+    rotated = run(client.post("/api/token/refresh", json={"refresh_token": new_token}))
+    assert rotated.status_code == 200
+
+
+def test_concurrent_refresh_with_the_same_token_succeeds_once(run, client, user, monkeypatch):
+    token = run(_refresh_token_for(user.id))
+    get_refresh_token = crud.get_refresh_token
+
+    async def slow_get_refresh_token(db, token_id):
+        # Tutte le richieste leggono il token ancora valido prima che una lo revochi
+        db_token = await get_refresh_token(db, token_id)
+        await asyncio.sleep(0.05)
+        return db_token
+
+    monkeypatch.setattr(crud, "get_refresh_token", slow_get_refresh_token)
+
+    async def refresh_concurrently():
+        return await asyncio.gather(
+            *(client.post("/api/token/refresh", json={"refresh_token": token}) for _ in range(5))
+        )
+
+    statuses = sorted(response.status_code for response in run(refresh_concurrently()))
+    assert statuses == [200, 401, 401, 401, 401]
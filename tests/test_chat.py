@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+import crud
+import schemas
+from api.dependencies import get_current_user
+from api.endpoints import chat
+from database import AsyncSessionLocal
+from utils import llm_handler
+
+
+def _create_session(run, client) -> str:
+    response = run(client.post("/api/chat/sessions", json={"language": "German", "mode": "teacher"}))
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_llm_failure_does_not_persist_the_turn(run, client, fake_model, logged_in):
+    session_id = _create_session(run, client)
+    url = f"/api/chat/sessions/{session_id}/messages"
+
+    fake_model.error = RuntimeError("quota exceeded")
+    response = run(client.post(url, json={"content": "Hallo!"}))
+    assert response.status_code == 502
+    assert run(client.get(url)).json() == []
+
+    fake_model.error = None
+    fake_model.text = "Hallo! Wie geht's?"
+    response = run(client.post(url, json={"content": "Hallo!"}))
+    assert response.status_code == 200
+    assert run(client.get(url)).json() == [
+        {"role": "user", "content": "Hallo!"},
+        {"role": "assistant", "content": "Hallo! Wie geht's?"},
+    ]
+
+
+def test_chat_sessions_require_authentication(run, client):
+    response = run(client.post("/api/chat/sessions", json={"language": "German", "mode": "teacher"}))
+    assert response.status_code == 401
+
+
+def test_chat_session_is_only_visible_to_its_owner(run, app, client, fake_model, logged_in):
+    session_id = _create_session(run, client)
+    url = f"/api/chat/sessions/{session_id}/messages"
+
+    other = schemas.User(id=logged_in.id + 100_000, username="other", native_language="Italian")
+    app.dependency_overrides[get_current_user] = lambda: other
+    assert run(client.get(url)).status_code == 404
+    assert run(client.post(url, json={"content": "Hallo!"})).status_code == 404
+    assert fake_model.calls == 0
+
+
+def test_inactive_chat_sessions_are_deleted(run, client, fake_model, logged_in):
+    session_id = _create_session(run, client)
+    url = f"/api/chat/sessions/{session_id}/messages"
+    assert run(client.post(url, json={"content": "Hallo!"})).status_code == 200
+
+    async def make_inactive():
+        async with AsyncSessionLocal() as db:
+            session = await crud.get_chat_session(db, session_id)
+            session.last_activity_at = datetime(2000, 1, 1)
+            await db.commit()
+
+    run(make_inactive())
+    assert run(chat.delete_expired_chat_sessions()) >= 1
+    assert run(client.get(url)).status_code == 404
+
+
+def test_coalesced_callers_all_receive_the_error(run, fake_model):
+    fake_model.error = RuntimeError("quota exceeded")
+
+    async def call_concurrently():
+        return await asyncio.gather(
+            *(llm_handler.generate_llm_response_async("same prompt") for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = run(call_concurrently())
+    assert fake_model.calls == 1
+    assert all(isinstance(result, llm_handler.LLMUnavailableError) for result in results)
+
+
+def test_exercise_endpoints_answer_502_when_the_llm_fails(run, client, fake_model, logged_in):
+    fake_model.error = RuntimeError("quota exceeded")
+    response = run(client.get("/api/exercises/daily-quote", params={"target_language": "German"}))
+    assert response.status_code == 502
+
+
+def _slow_validation(monkeypatch, delay: float = 0.2):
+    async def validate(language, mode):
+        await asyncio.sleep(delay)
+        if mode == "unknown":
+            raise HTTPException(status_code=404, detail="Chat mode not found")
+        return "system prompt"
+
+    monkeypatch.setattr(chat, "_validate_chat_request", validate)
+
+
+def test_websocket_slot_is_reserved_before_validation(app, monkeypatch):
+    _slow_validation(monkeypatch)
+    monkeypatch.setattr(chat, "CHAT_WS_MAX_SESSIONS", 1)
+    # Se la seconda connessione venisse accettata, il test terminerebbe per inattività
+    monkeypatch.setattr(chat, "CHAT_WS_IDLE_TIMEOUT", 1)
+    client = TestClient(app)
+
+    with client.websocket_connect("/api/chat/ws?language=German&mode=teacher"):
+        with client.websocket_connect("/api/chat/ws?language=German&mode=teacher") as second:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                second.receive_json()
+    assert closed.value.code == 1013
+
+
+def test_websocket_rejected_request_releases_its_slot(app, monkeypatch):
+    _slow_validation(monkeypatch, delay=0)
+    client = TestClient(app)
+
+    with client.websocket_connect("/api/chat/ws?language=German&mode=unknown") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1008
+    assert chat.open_ws_sessions == 0
+
+
+def test_websocket_non_json_message_gets_an_error_event(app, monkeypatch):
+    _slow_validation(monkeypatch, delay=0)
+    monkeypatch.setattr(chat, "start_chat_session", lambda system_prompt: None)
+    client = TestClient(app)
+
+    with client.websocket_connect("/api/chat/ws?language=German&mode=teacher") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json() == {"type": "error", "detail": "Invalid JSON message"}
+        # La connessione resta aperta per i messaggi successivi
+        websocket.send_json({})
+        assert websocket.receive_json() == {"type": "error", "detail": "Missing content"}
+    assert chat.open_ws_sessions == 0
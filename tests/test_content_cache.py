@@ -0,0 +1,26 @@
+import asyncio
+import json
+
+from utils import content_cache
+from utils.content_cache import InMemoryLRUCache, generate_cached_json_response, make_cache_key
+
+FLASHCARDS = [{"word_or_phrase": "das Haus", "translation": "la casa"}]
+
+
+def test_coalesced_callers_store_one_variant(run, fake_model, monkeypatch):
+    cache = InMemoryLRUCache(max_bytes=1_000_000)
+    monkeypatch.setattr(content_cache, "content_cache", cache)
+    monkeypatch.setattr(content_cache, "CONTENT_CACHE_ENABLED", True)
+    monkeypatch.setattr(content_cache, "CONTENT_CACHE_VARIANTS", 3)
+    fake_model.text = json.dumps(FLASHCARDS)
+    fake_model.latency = 0.05
+    inputs = ("German", "Italian", "casa", None)
+
+    async def generate_concurrently():
+        return await asyncio.gather(
+            *(generate_cached_json_response("flashcards", "prompt", *inputs) for _ in range(3))
+        )
+
+    assert run(generate_concurrently()) == [FLASHCARDS] * 3
+    assert fake_model.calls == 1
+    assert len(cache._entries[make_cache_key("flashcards", *inputs)]) == 1
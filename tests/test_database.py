@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+INIT_DB = "import database; database.init_db()"
+
+
+def _run_init_db(path: str, workers: int) -> list:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", INIT_DB],
+            cwd=SRC_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(workers)
+    ]
+    return [(process.wait(timeout=60), process.stderr.read()) for process in processes]
+
+
+def _make_legacy_database(path: str):
+    """
+    Crea un database come quelli precedenti alle migrazioni di init_db: senza indice unico
+    su progress, senza languages.normalized_name, con sessioni di chat senza proprietario
+    e senza versione registrata.
+    """
+    assert _run_init_db(path, 1)[0][0] == 0
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP INDEX ix_progress_user_language")
+        conn.execute("DROP INDEX ix_languages_normalized_name")
+        conn.execute("ALTER TABLE languages DROP COLUMN normalized_name")
+        conn.execute("DELETE FROM schema_version")
+        conn.execute("INSERT INTO users (username, hashed_password) VALUES ('anna', 'x')")
+        conn.executemany(
+            "INSERT INTO progress (user_id, target_language) VALUES (1, 'German')", [(), ()]
+        )
+        conn.execute("INSERT INTO languages (name) VALUES ('english ')")
+        conn.execute("DROP TABLE chat_sessions")
+        conn.execute(
+            "CREATE TABLE chat_sessions (id VARCHAR PRIMARY KEY, language VARCHAR, "
+            "mode VARCHAR, summary TEXT, summary_until_id INTEGER)"
+        )
+        conn.execute("INSERT INTO chat_sessions (id, language, mode) VALUES ('s1', 'German', 'teacher')")
+        conn.execute(
+            "INSERT INTO chat_session_messages (session_id, role, content) VALUES ('s1', 'user', 'Hallo')"
+        )
+
+
+def _index_names(path: str, table: str) -> set:
+    with sqlite3.connect(path) as conn:
+        return {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+
+
+def test_concurrent_workers_migrate_a_legacy_database_once(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    _make_legacy_database(path)
+
+    results = _run_init_db(path, 4)
+
+    assert [code for code, _ in results] == [0, 0, 0, 0], [err for _, err in results]
+    assert "ix_progress_user_language" in _index_names(path, "progress")
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM progress").fetchone()[0] == 1
+        assert conn.execute("SELECT version FROM schema_version").fetchone()[0] > 0
+
+
+def test_concurrent_workers_add_language_normalized_name_once(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    _make_legacy_database(path)
+
+    results = _run_init_db(path, 4)
+
+    assert [code for code, _ in results] == [0, 0, 0, 0], [err for _, err in results]
+    assert "ix_languages_normalized_name" in _index_names(path, "languages")
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT name FROM languages WHERE normalized_name = 'english'")
+        assert [row[0] for row in rows] == ["English"]
+        unset = conn.execute("SELECT COUNT(*) FROM languages WHERE normalized_name IS NULL")
+        assert unset.fetchone()[0] == 0
+
+
+def test_ownerless_chat_sessions_are_dropped_by_the_migration(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    _make_legacy_database(path)
+
+    results = _run_init_db(path, 2)
+
+    assert [code for code, _ in results] == [0, 0], [err for _, err in results]
+    assert "ix_chat_sessions_user_id" in _index_names(path, "chat_sessions")
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM chat_session_messages").fetchone()[0] == 0
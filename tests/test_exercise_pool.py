@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from utils import exercise_pool as exercise_pool_module
+from utils.exercise_pool import ExercisePool
+
+
+@pytest.fixture
+def pool(monkeypatch, fake_model):
+    monkeypatch.setattr(exercise_pool_module, "EXERCISE_POOL_ENABLED", True)
+    fake_model.text = '{"sentence": "Ich bin Anna."}'
+    pool = ExercisePool(depth=5, refill_concurrency=4, min_requests=3, max_tracked_keys=10)
+    pool.register_prompt_builder(
+        "test-exercise", lambda target, native, topic, focus: f"{target} {native} {topic} {focus}"
+    )
+    return pool
+
+
+async def _pop_all(pool, topics):
+    exercises = [pool.pop("test-exercise", "German", "Italian", topic=topic) for topic in topics]
+    # Lascia terminare i riempimenti avviati in background
+    await asyncio.sleep(0.05)
+    return exercises
+
+
+def test_topics_requested_once_are_not_pregenerated(run, pool, fake_model):
+    run(_pop_all(pool, [f"topic {i}" for i in range(20)]))
+
+    assert fake_model.calls == 0
+    assert pool.stats()["tracked_keys"] == 10
+
+
+def test_each_pop_of_a_hot_key_generates_one_exercise(run, pool, fake_model):
+    run(_pop_all(pool, ["travel"] * 3))
+    assert fake_model.calls == 1
+
+    exercises = run(_pop_all(pool, ["travel"]))
+    assert exercises == [{"sentence": "Ich bin Anna."}]
+    assert fake_model.calls == 2
+
+
+def test_stop_cancels_refills_in_progress(run, pool, fake_model):
+    fake_model.latency = 10
+
+    async def pop_and_stop():
+        await _pop_all(pool, ["travel"] * 3)
+        assert len(pool._tasks) == 1
+        await asyncio.wait_for(pool.stop(), timeout=1)
+
+    run(pop_and_stop())
+
+    assert pool._tasks == set()
+    assert pool.stats()["refills_in_progress"] == 0
+    assert pool.stats()["ready_exercises"] == 0
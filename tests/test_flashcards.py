@@ -0,0 +1,19 @@
+import json
+
+import pytest
+
+CORRECTION = {"target_language": "German", "flashcard_text": "das Haus", "user_translation": "la casa"}
+
+
+@pytest.mark.parametrize("delta, level", [(1000, 2), (-1000, 0)])
+def test_flashcard_correction_moves_vocabulary_by_one_step(
+    run, client, logged_in, fake_model, delta, level
+):
+    fake_model.text = json.dumps(
+        {"feedback": "Perfetto!", "evaluation": {"vocabulary_delta": delta}}
+    )
+
+    response = run(client.post("/api/exercises/submit-flashcard-correction", json=CORRECTION))
+
+    assert response.status_code == 200
+    assert response.json()["new_progress"]["vocabulary_level"] == level
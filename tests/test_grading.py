@@ -0,0 +1,68 @@
+import asyncio
+
+import crud
+from database import AsyncSessionLocal
+from utils.exercise_store import exercise_store
+
+EXERCISE = {"sentence": "Ich ___ Anna.", "options": ["bin", "bist", "ist"], "answer": "bin"}
+
+
+def _submission(exercise_id: str) -> dict:
+    return {
+        "exercise_id": exercise_id,
+        "exercise_type": "fill-in-the-blank",
+        "target_language": "German",
+        "answers": [{"question": EXERCISE["sentence"], "user_answer": "bin"}],
+    }
+
+
+async def _grammar_level(user_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        progress = await crud.get_progress(db, user_id, "German")
+    return progress.grammar_level
+
+
+def test_an_exercise_is_graded_once_per_user(run, client, logged_in):
+    exercise_id = run(exercise_store.save("fill-in-the-blank", "German", EXERCISE))
+
+    first = run(client.post("/api/exercises/grade", json=_submission(exercise_id)))
+    assert first.status_code == 200
+    assert first.json()["score"] == 1
+    level = run(_grammar_level(logged_in.id))
+
+    replay = run(client.post("/api/exercises/grade", json=_submission(exercise_id)))
+    assert replay.status_code == 409
+    assert run(_grammar_level(logged_in.id)) == level
+
+
+def test_concurrent_replays_update_progress_once(run, client, logged_in):
+    exercise = {**EXERCISE, "sentence": "Du ___ Anna."}
+    exercise_id = run(exercise_store.save("fill-in-the-blank", "German", exercise))
+    submission = _submission(exercise_id)
+    submission["answers"][0]["question"] = exercise["sentence"]
+
+    async def grade_concurrently():
+        return await asyncio.gather(
+            *(client.post("/api/exercises/grade", json=submission) for _ in range(5))
+        )
+
+    statuses = sorted(response.status_code for response in run(grade_concurrently()))
+    assert statuses == [200, 409, 409, 409, 409]
+    assert run(_grammar_level(logged_in.id)) == 2
+
+
+def test_progress_goes_to_the_language_of_the_exercise(run, client, logged_in):
+    exercise = {**EXERCISE, "sentence": "Er ___ Anna."}
+    exercise_id = run(exercise_store.save("fill-in-the-blank", "German", exercise))
+    submission = _submission(exercise_id)
+    submission["answers"][0]["question"] = exercise["sentence"]
+    submission["target_language"] = "French"
+
+    response = run(client.post("/api/exercises/grade", json=submission))
+    assert response.status_code == 400
+
+    async def french_progress():
+        async with AsyncSessionLocal() as db:
+            return await crud.get_progress(db, logged_in.id, "French")
+
+    assert run(french_progress()) is None
@@ -0,0 +1,28 @@
+import pytest
+
+from utils.json_parser import LLMResponseParseError, parse_llm_json
+from utils.json_stream import JsonArrayStreamParser
+
+
+def test_fenced_json_with_surrounding_text():
+    text = 'Ecco le frasi [nota]:\n```json\n[{"s": "a"}, {"s": "b"}]\n```\nBuono studio!'
+    assert parse_llm_json(text) == [{"s": "a"}, {"s": "b"}]
+
+
+@pytest.mark.parametrize("text", ["{[1]: 2}", "Risposta: {[1]: 2}", "{'s': 'a'}"])
+def test_invalid_json_raises_parse_error(text):
+    with pytest.raises(LLMResponseParseError):
+        parse_llm_json(text)
+
+
+def test_truncated_array_is_rejected():
+    with pytest.raises(LLMResponseParseError):
+        parse_llm_json('[{"s":"a"},{"s":"b"},{"s":"c')
+
+
+def test_stream_parser_skips_invalid_items():
+    parser = JsonArrayStreamParser()
+    items = parser.feed('```json\n[{"s": "a"}, {[1]: 2}, {"s": "b"}]')
+    assert items == [{"s": "a"}, {"s": "b"}]
+    assert parser.skipped == 1
+    assert not parser.truncated
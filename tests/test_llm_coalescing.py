@@ -0,0 +1,51 @@
+import asyncio
+
+from utils import llm_handler, metrics
+
+
+def _coalesced() -> float:
+    return sum(metrics.llm_coalesced_requests.values.values())
+
+
+def test_identical_concurrent_calls_share_one_upstream_call(run, fake_model):
+    fake_model.latency = 0.05
+    coalesced = _coalesced()
+
+    async def call_all():
+        return await asyncio.gather(
+            *[llm_handler.generate_llm_response_async("same prompt") for _ in range(10)]
+        )
+
+    assert run(call_all()) == [fake_model.text] * 10
+    assert fake_model.calls == 1
+    assert _coalesced() - coalesced == 9
+
+
+def test_distinct_prompts_are_not_coalesced(run, fake_model):
+    fake_model.latency = 0.05
+
+    async def call_all():
+        return await asyncio.gather(
+            *[llm_handler.generate_llm_response_async(f"prompt {i}") for i in range(10)]
+        )
+
+    run(call_all())
+    assert fake_model.calls == 10
+
+
+def test_coalesced_requests_are_exposed_on_metrics(run, client, fake_model):
+    fake_model.latency = 0.05
+
+    async def call_all():
+        await asyncio.gather(
+            *[llm_handler.generate_llm_response_async("metrics prompt") for _ in range(3)]
+        )
+
+    run(call_all())
+    response = run(client.get("/metrics"))
+
+    assert response.status_code == 200
+    assert "babilonia_llm_coalesced_requests_total" in response.text
+    assert "babilonia_exercise_pool_ready_exercises" in response.text
+    assert run(client.get("/api/exercises/llm-stats")).status_code == 404
+    assert run(client.get("/api/exercises/pool-stats")).status_code == 404
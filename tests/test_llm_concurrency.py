@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+from utils import llm_handler
+
+LATENCY = 0.5
+REQUESTS = 120
+
+
+def test_concurrent_llm_requests_are_served_in_parallel(
+    run, client, fake_model, logged_in, monkeypatch
+):
+    # Richieste identiche: senza accorpamento ognuna arriva al modello
+    monkeypatch.setattr(llm_handler, "LLM_COALESCING_ENABLED", False)
+    fake_model.latency = LATENCY
+
+    async def request_all():
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *[
+                client.get("/api/exercises/daily-quote", params={"target_language": "German"})
+                for _ in range(REQUESTS)
+            ]
+        )
+        return responses, time.perf_counter() - start
+
+    responses, elapsed = run(request_all())
+
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    assert fake_model.calls == REQUESTS
+    # Sul threadpool di starlette (~40 thread) servirebbero almeno 3 turni di LATENCY
+    assert elapsed < 2 * LATENCY
@@ -0,0 +1,61 @@
+import json
+import uuid
+
+from utils import content_cache, metrics
+
+
+def _total(counter) -> float:
+    return sum(counter.values.values())
+
+
+def test_llm_outage_is_not_counted_as_a_parse_failure(
+    run, client, logged_in, fake_model, monkeypatch
+):
+    monkeypatch.setattr(content_cache, "CONTENT_CACHE_ENABLED", False)
+    url = "/api/exercises/fill-in-the-blank"
+    errors, parse_failures = _total(metrics.llm_errors), _total(metrics.llm_parse_failures)
+
+    fake_model.error = RuntimeError("quota exceeded")
+    response = run(client.get(url, params={"target_language": "German"}))
+    assert response.status_code == 502
+    assert _total(metrics.llm_errors) == errors + 1
+    assert _total(metrics.llm_parse_failures) == parse_failures
+
+    fake_model.error = None
+    fake_model.text = "Non è JSON"
+    response = run(client.get(url, params={"target_language": "German"}))
+    assert response.status_code == 502
+    assert _total(metrics.llm_errors) == errors + 1
+    assert _total(metrics.llm_parse_failures) == parse_failures + 1
+
+
+def test_dropped_stream_and_batch_items_are_counted(run, client, logged_in, fake_model):
+    parse_failures = _total(metrics.llm_parse_failures)
+
+    # Un oggetto non decodificabile e uno senza traduzione
+    fake_model.chunks = [
+        '[{"sentence": "Guten Tag", "translation": "Buongiorno"},',
+        ' {"sentence": "Danke", "translation": },',
+        ' {"sentence": "Bitte"}]',
+    ]
+    response = run(
+        client.get(
+            "/api/phrasebook/stream",
+            params={"target_language": "German", "topic": uuid.uuid4().hex},
+        )
+    )
+    assert response.status_code == 200
+    assert _total(metrics.llm_parse_failures) == parse_failures + 2
+
+    fake_model.text = json.dumps([{"index": 0, "vocabulary_delta": 1}])
+    response = run(
+        client.post(
+            "/api/exercises/submit-flashcard-corrections",
+            json={
+                "target_language": "German",
+                "cards": [{"flashcard_text": "das Haus", "user_translation": "la casa"}],
+            },
+        )
+    )
+    assert response.status_code == 200
+    assert _total(metrics.llm_parse_failures) == parse_failures + 3
@@ -0,0 +1,61 @@
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from passlib.hash import bcrypt
+
+import crud, schemas
+from api.dependencies import user_cache
+from database import AsyncSessionLocal
+from utils import passwords
+
+
+@pytest.fixture(params=[2, 0], ids=["process-pool", "threadpool"])
+def workers(request, monkeypatch):
+    passwords.shutdown_password_executor()
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_WORKERS", request.param)
+    yield request.param
+    passwords.shutdown_password_executor()
+
+
+def test_hash_and_verify(run, workers):
+    hashed = run(passwords.hash_password("segreta"))
+
+    assert hashed.startswith("$2b$04$")
+    assert run(passwords.verify_password("segreta", hashed)) == (True, None)
+    assert run(passwords.verify_password("sbagliata", hashed)) == (False, None)
+    assert isinstance(passwords._executor, ProcessPoolExecutor) == (workers > 0)
+
+
+def test_hash_with_another_cost_is_updated(run, workers):
+    old_hash = bcrypt.using(rounds=5).hash("segreta")
+
+    valid, new_hash = run(passwords.verify_password("segreta", old_hash))
+
+    assert valid
+    assert new_hash.startswith("$2b$04$")
+    assert run(passwords.verify_password("segreta", new_hash)) == (True, None)
+
+
+def test_login_stores_the_updated_hash(run, client):
+    username = f"test-{uuid.uuid4().hex[:12]}"
+
+    async def create_user():
+        async with AsyncSessionLocal() as db:
+            return await crud.create_user(
+                db,
+                schemas.UserCreate(username=username, password="segreta", native_language="Italian"),
+                hashed_password=bcrypt.using(rounds=5).hash("segreta"),
+            )
+
+    user = run(create_user())
+    user_cache.set(username, schemas.User(id=user.id, username=username, native_language="Italian"))
+    response = run(client.post("/api/token", data={"username": username, "password": "segreta"}))
+    assert response.status_code == 200
+
+    async def stored_hash():
+        async with AsyncSessionLocal() as db:
+            return (await crud.get_user_by_id(db, user.id)).hashed_password
+
+    assert run(stored_hash()).startswith("$2b$04$")
+    assert user_cache.get(username) is None
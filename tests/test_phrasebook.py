@@ -0,0 +1,55 @@
+import json
+import uuid
+
+STREAM_URL = "/api/phrasebook/stream"
+
+
+def _params() -> dict:
+    # Un topic diverso per ogni test: le risposte restano in cache
+    return {"target_language": "German", "topic": uuid.uuid4().hex}
+
+
+def _lines(response) -> list:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_invalid_streamed_entries_are_skipped_and_not_cached(run, client, logged_in, fake_model):
+    params = _params()
+    fake_model.chunks = [
+        '[{"sentence": "Guten Tag", "translation": "Buongiorno"},',
+        ' {"sentence": "Danke"},',
+        ' {"sentence": "Bitte", "translation": "Prego"}]',
+    ]
+
+    response = run(client.get(STREAM_URL, params=params))
+    assert response.status_code == 200
+    assert [entry["sentence"] for entry in _lines(response)] == ["Guten Tag", "Bitte"]
+
+    fake_model.error = RuntimeError("not cached")
+    response = run(client.get("/api/phrasebook", params=params))
+    assert response.status_code == 200
+    assert [entry["sentence"] for entry in response.json()["phrasebook"]] == ["Guten Tag", "Bitte"]
+
+
+def test_llm_failure_before_the_first_entry_returns_502(run, client, logged_in, fake_model):
+    fake_model.error = RuntimeError("quota exceeded")
+
+    response = run(client.get(STREAM_URL, params=_params()))
+    assert response.status_code == 502
+
+
+def test_llm_failure_mid_stream_ends_with_an_error_line(run, client, logged_in, fake_model):
+    params = _params()
+    fake_model.chunks = ['[{"sentence": "Guten Tag", "translation": "Buongiorno"},', ' {"sen']
+    fake_model.stream_error = RuntimeError("connection reset")
+
+    response = run(client.get(STREAM_URL, params=params))
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert lines[0]["sentence"] == "Guten Tag"
+    assert "error" in lines[-1]
+
+    fake_model.stream_error = None
+    fake_model.chunks = ['[{"sentence": "Danke", "translation": "Grazie"}]']
+    response = run(client.get(STREAM_URL, params=params))
+    assert [entry["sentence"] for entry in _lines(response)] == ["Danke"]
@@ -0,0 +1,36 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+import crud
+import models
+from database import AsyncSessionLocal
+
+
+async def _increment_concurrently(user_id: int, tasks: int, increments: int):
+    async def worker():
+        async with AsyncSessionLocal() as db:
+            for _ in range(increments):
+                await crud.increment_progress(db, user_id, "German", vocabulary_delta=1)
+
+    await asyncio.gather(*[worker() for _ in range(tasks)])
+
+
+async def _rows(user_id: int):
+    async with AsyncSessionLocal() as db:
+        count = await db.scalar(
+            select(func.count())
+            .select_from(models.UserProgress)
+            .filter_by(user_id=user_id, target_language="German")
+        )
+        return count, await crud.get_progress(db, user_id, "German")
+
+
+def test_concurrent_increments_are_not_lost(run, user):
+    run(_increment_concurrently(user.id, tasks=8, increments=10))
+
+    count, progress = run(_rows(user.id))
+
+    assert count == 1
+    assert progress.vocabulary_level == 1 + 8 * 10
+    assert progress.comprehension_level == 1
@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+
+import pytest
+
+import crud
+from database import AsyncSessionLocal
+from utils.progress_aggregator import GradedExerciseBatcher, ProgressAggregator
+
+
+@pytest.fixture
+def aggregator():
+    return ProgressAggregator(flush_interval_ms=60_000, flush_max_events=100)
+
+
+async def _stored_levels(user_id: int, target_language: str = "German"):
+    async with AsyncSessionLocal() as db:
+        row = await crud.get_progress(db, user_id, target_language)
+    if row is None:
+        return None
+    return row.comprehension_level, row.vocabulary_level, row.grammar_level
+
+
+async def _read(aggregator, user_id: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await aggregator.read(db, user_id, "German")
+
+
+def test_reads_include_pending_deltas_until_flushed(run, aggregator, user):
+    aggregator.add(user.id, "German", vocabulary_delta=1)
+    aggregator.add(user.id, "German", vocabulary_delta=1, grammar_delta=-1)
+
+    assert run(_stored_levels(user.id)) is None
+    assert run(_read(aggregator, user.id))["vocabulary_level"] == 3
+
+    run(aggregator.flush())
+
+    assert run(_stored_levels(user.id)) == (1, 3, 0)
+    assert aggregator.pending_deltas(user.id, "German") == (0, 0, 0)
+    assert run(_read(aggregator, user.id))["vocabulary_level"] == 3
+
+
+def test_updates_during_a_flush_are_written_by_the_next_one(run, aggregator, user, monkeypatch):
+    increment_progress_many = crud.increment_progress_many
+
+    async def slow_increment_progress_many(db, deltas):
+        # Un aggiornamento arriva mentre il blocco precedente è in scrittura
+        aggregator.add(user.id, "German", comprehension_delta=1)
+        assert aggregator.pending_deltas(user.id, "German") == (1, 1, 0)
+        await increment_progress_many(db, deltas)
+
+    monkeypatch.setattr(crud, "increment_progress_many", slow_increment_progress_many)
+    aggregator.add(user.id, "German", vocabulary_delta=1)
+    run(aggregator.flush())
+    assert run(_stored_levels(user.id)) == (1, 2, 1)
+
+    monkeypatch.setattr(crud, "increment_progress_many", increment_progress_many)
+    run(aggregator.flush())
+    assert run(_stored_levels(user.id)) == (2, 2, 1)
+
+
+def test_failed_flush_keeps_the_deltas(run, aggregator, user, monkeypatch):
+    increment_progress_many = crud.increment_progress_many
+
+    async def failing_increment_progress_many(db, deltas):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(crud, "increment_progress_many", failing_increment_progress_many)
+    aggregator.add(user.id, "German", grammar_delta=1)
+    with pytest.raises(RuntimeError):
+        run(aggregator.flush())
+    assert aggregator.pending_deltas(user.id, "German") == (0, 0, 1)
+
+    monkeypatch.setattr(crud, "increment_progress_many", increment_progress_many)
+    run(aggregator.flush())
+    assert run(_stored_levels(user.id)) == (1, 1, 2)
+
+
+def test_stop_writes_pending_deltas(run, aggregator, user):
+    async def add_and_stop():
+        writer = asyncio.create_task(aggregator.run())
+        await asyncio.sleep(0)
+        aggregator.add(user.id, "German", vocabulary_delta=1)
+        aggregator.stop()
+        await asyncio.wait_for(writer, timeout=5)
+
+    run(add_and_stop())
+
+    assert run(_stored_levels(user.id)) == (1, 2, 1)
+
+
+def test_concurrent_grades_are_registered_together(run, user):
+    batcher = GradedExerciseBatcher()
+
+    async def mark_all():
+        exercises = [f"exercise-{uuid.uuid4().hex}" for _ in range(20)]
+        # Lo stesso esercizio inviato due volte insieme conta una volta sola
+        exercises.append(exercises[0])
+        return await asyncio.gather(*[batcher.mark(user.id, exercise) for exercise in exercises])
+
+    results = run(mark_all())
+
+    assert results == [True] * 20 + [False]
+    assert batcher.batches == 1
+    assert run(mark_all()) == [True] * 20 + [False]
+    assert batcher.batches == 2